@@ -1,42 +1,32 @@
 from urllib.parse import quote
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-from services.analyzer.router import detect_language, analyze_units
-from services.db import Base, engine, get_db
-from models.config import Config
-from services.crypto import encrypt, decrypt
-from services.github import GitHubClient
-from pathlib import Path
+from flask import Flask, Response, render_template, stream_template, request, redirect, url_for, flash, jsonify, stream_with_context
+from services.analyzer.pipeline import analyze_file_view, normalize_mode, stream_file_view
+from services.analysis_store import get_analysis, iter_analyses, list_analyses, save_analysis, search_units
+from services.analysis_cache import cache_stats
+from services.singleflight import SINGLE_FLIGHT
+from services.db import Base, engine, session_scope
+from services.db_writer import DB_WRITER
+from services.config_store import get_config, get_github_token, set_config_value
+from models.analysis_cache import AnalysisCacheEntry  # noqa: F401 (registra a tabela)
+from models.analysis_store import Analysis  # noqa: F401 (registra as tabelas)
+from models.diagram_cache import DiagramCacheEntry  # noqa: F401 (registra a tabela)
+from models.batch_job import BatchJob, BatchJobFile
+from services import batch
+from services.llm.executor import get_executor
+from services.llm.tokens import TOKEN_TOTALS, tokenizer_name, track_usage
+from services.crypto import encrypt
+from services.github import get_client
+from services.github_http import SESSION_POOL
+from services.github_ratelimit import GITHUB_SCHEDULER, GitHubRateLimited
+from services.http_cache import HTTP_CACHE
+from services.blob_store import BLOB_STORE
+from services.files import get_file_view
+from services.tree_cache import REF_RESOLVER, TREE_CACHE, TREE_LISTING_CACHE, get_tree_index
+import itertools
 import json
-from jsonschema import Draft202012Validator
-from referencing import Registry, Resource
-from services.diagram.mermaid import to_mermaid
-
-# Validador JSON Schema (ex.: para validar o output do analisador)
-def _load_json(p: Path):
-    with p.open("r", encoding="utf-8") as f:
-        return json.load(f)
-
-SCHEMA_ROOT = Path(__file__).resolve().parent / "schemas"
-try:
-    _analysis_schema = _load_json(SCHEMA_ROOT / "analysis.schema.json")
-    _generic_schema  = _load_json(SCHEMA_ROOT / "unit.generic.schema.json")
-    _cobol_schema    = _load_json(SCHEMA_ROOT / "unit.cobol.schema.json")
-    Draft202012Validator.check_schema(_analysis_schema)
-    Draft202012Validator.check_schema(_generic_schema)
-    Draft202012Validator.check_schema(_cobol_schema)
-
-    _registry = Registry()
-    _registry = _registry.with_resource("analysis.schema.json",      Resource.from_contents(_analysis_schema))
-    _registry = _registry.with_resource("unit.generic.schema.json",  Resource.from_contents(_generic_schema))
-    _registry = _registry.with_resource("unit.cobol.schema.json",    Resource.from_contents(_cobol_schema))
-    _registry = _registry.with_resource("./unit.generic.schema.json", Resource.from_contents(_generic_schema))
-    _registry = _registry.with_resource("./unit.cobol.schema.json",   Resource.from_contents(_cobol_schema))
-
-    ANALYSIS_VALIDATOR = Draft202012Validator(_analysis_schema, registry=_registry)
-except Exception as e:
-    ANALYSIS_VALIDATOR = None
-    print(f"[warn] Schemas não carregados: {e}")
-
+import time
+from services.diagram.cache import DIAGRAM_CACHE
+from services.schemas import validate_analysis
 
 app = Flask(__name__)
 app.secret_key = "dev-secret"  # só para flash messages (pode mover para .env se quiser)
@@ -44,49 +34,108 @@ app.secret_key = "dev-secret"  # só para flash messages (pode mover para .env s
 # cria as tabelas (em produção, usar migrações)
 Base.metadata.create_all(bind=engine)
 
+def _rate_limited(e: GitHubRateLimited):
+    """429 com Retry-After quando a cota do GitHub acabou e a espera passaria do limite."""
+    resp = jsonify({"error": str(e)})
+    resp.headers["Retry-After"] = str(max(1, int(e.retry_at - time.time()) + 1))
+    return resp, 429
+
+@app.before_request
+def _start_background_workers():
+    # só no processo que atende requisições (não no pai do reloader do Flask)
+    batch.ensure_supervisor()
+
 def _require_token():
-    db = next(get_db())
-    enc_token = get_config_value(db, "github_token")
-    token = decrypt(enc_token) if enc_token else None
+    token = get_github_token()
     if not token:
         flash("Configure o token do GitHub primeiro.", "error")
         return None
     return token
 
-def _build_tree(entries):
+def _list_dir_from_git(gh, owner, repo, sha, path):
     """
-    Constrói uma árvore a partir do /git/trees?recursive=1
-    Mantemos apenas 'blob' (arquivo) e 'tree' (diretório).
-    Saída:
-      { 'type': 'dir', 'name': '', 'children': { 'src': {...}, 'README.md': {...} } }
+    Lista um nível via git/trees não recursivo, descendo diretório a diretório.
+    Cada nível é cacheado pelo sha da própria árvore (também imutável).
     """
-    root = {"type": "dir", "name": "", "children": {}}
-
+    def level(tree_sha):
+        return TREE_LISTING_CACHE.get_or_build(
+            (gh.cache_namespace, owner.lower(), repo.lower(), tree_sha),
+            lambda: gh.get_tree(owner, repo, tree_sha).get("tree", []),
+        )
+
+    entries = level(sha)
+    for part in [p for p in path.split("/") if p]:
+        sub = next((e for e in entries if e.get("path") == part and e.get("type") == "tree"), None)
+        if sub is None:
+            return None
+        entries = level(sub["sha"])
+
+    out = []
     for e in entries:
-        p = e.get("path", "")
         t = e.get("type")
-
-        # ignorar tipos que não são dir/arquivo (ex.: submodule 'commit')
         if t not in ("blob", "tree"):
             continue
+        name = e.get("path", "")
+        item = {"name": name, "path": f"{path}/{name}" if path else name, "type": "dir" if t == "tree" else "file"}
+        if t == "blob":
+            item["size"] = e.get("size")
+            item["sha"] = e.get("sha")
+        out.append(item)
+    # mesma ordem do TreeIndex.list_dir: diretórios primeiro, depois nome
+    out.sort(key=lambda e: (e["type"] != "dir", e["name"].lower()))
+    return out
+
+@app.get("/github/repo/<owner>/<repo>/tree")
+def repo_tree_api(owner, repo):
+    """
+    Lista UM nível de diretório (paginado) para a árvore lazy do repo_browser.
+    Query params: ref (branch/sha), path (diretório; vazio = raiz), offset, limit.
+    """
+    token = _require_token()
+    if token is None:
+        return jsonify({"error": "Token não configurado"}), 400
 
-        if not p:  # caminho vazio não deve acontecer, mas por via das dúvidas
-            continue
+    gh = get_client(token)
+    ref = (request.args.get("ref") or "").strip()
+    path = (request.args.get("path") or "").strip("/")
+    try:
+        offset = max(0, int(request.args.get("offset", 0)))
+        limit = min(1000, max(1, int(request.args.get("limit", 200))))
+    except ValueError:
+        return jsonify({"error": "offset/limit devem ser inteiros"}), 400
 
-        parts = p.split("/")
-        node = root
-        for i, part in enumerate(parts):
-            is_last = (i == len(parts) - 1)
-            if is_last:
-                if t == "tree":
-                    node["children"].setdefault(part, {"type": "dir", "name": part, "children": {}})
-                else:  # blob
-                    node["children"][part] = {"type": "file", "name": part, "path": p}
-            else:
-                node = node["children"].setdefault(part, {"type": "dir", "name": part, "children": {}})
+    try:
+        if not ref:
+            ref = gh.get_default_branch(owner, repo)
+        sha = REF_RESOLVER.resolve(gh, owner, repo, ref)
+        index = get_tree_index(gh, owner, repo, sha)
+        # árvore truncada (>100k entradas): o índice está incompleto, cai para git/trees por nível
+        if index.truncated:
+            entries, source = _list_dir_from_git(gh, owner, repo, sha, path), "git_trees"
+        else:
+            entries, source = index.list_dir(path), "index"
+    except GitHubRateLimited as e:
+        return _rate_limited(e)
+    except Exception as e:
+        return jsonify({"error": f"Falha ao listar diretório: {e}"}), 502
 
-    return root
+    if entries is None:
+        return jsonify({"error": f"Diretório não encontrado: {path}"}), 404
 
+    page = entries[offset:offset + limit]
+    next_offset = offset + limit if offset + limit < len(entries) else None
+    return jsonify({
+        "ref": ref,
+        "sha": sha,
+        "path": path,
+        "entries": page,
+        "total": len(entries),
+        "offset": offset,
+        "limit": limit,
+        "next_offset": next_offset,
+        "truncated": index.truncated,
+        "source": source,
+    }), 200
 
 @app.get("/github/repo/<owner>/<repo>")
 def repo_browser(owner, repo):
@@ -98,14 +147,13 @@ def repo_browser(owner, repo):
     if token is None:
         return redirect(url_for("settings_get"))
 
-    gh = GitHubClient(token)
+    gh = get_client(token)
     ref = request.args.get("ref")
     try:
         if not ref:
             ref = gh.get_default_branch(owner, repo)
-        tree_data = gh.get_tree_recursive(owner, repo, ref)
-        entries = tree_data.get("tree", [])
-        tree = _build_tree(entries)
+        # branch -> sha (TTL curto); a árvore é carregada sob demanda por repo_tree_api
+        sha = REF_RESOLVER.resolve(gh, owner, repo, ref)
         branches = gh.list_branches(owner, repo)
     except Exception as e:
         flash(f"Erro ao carregar árvore do repositório: {e}", "error")
@@ -116,7 +164,7 @@ def repo_browser(owner, repo):
     file_view = None
     if selected_path:
         try:
-            file_view = gh.get_file_content(owner, repo, selected_path, ref)
+            file_view = get_file_view(gh, owner, repo, sha, selected_path)
         except Exception as e:
             flash(f"Erro ao abrir arquivo: {e}", "error")
             file_view = None
@@ -126,25 +174,12 @@ def repo_browser(owner, repo):
         owner=owner,
         repo=repo,
         ref=ref,
+        sha=sha,
         branches=branches,
-        tree=tree,
         selected_path=selected_path,
         file_view=file_view,
     )
 
-def get_config_value(db, key: str) -> str | None:
-    item = db.query(Config).filter(Config.key == key).one_or_none()
-    return item.value if item else None
-
-def set_config_value(db, key: str, value: str | None):
-    item = db.query(Config).filter(Config.key == key).one_or_none()
-    if item:
-        item.value = value
-    else:
-        item = Config(key=key, value=value)
-        db.add(item)
-    db.commit()
-
 @app.post("/docs/analyze")
 def docs_analyze():
     """
@@ -172,51 +207,358 @@ def docs_analyze():
     if token is None:
         return jsonify({"error": "Token não configurado"}), 400
 
-    gh = GitHubClient(token)
+    gh = get_client(token)
     try:
-        fv = gh.get_file_content(owner, repo, path, ref)
+        fv = get_file_view(gh, owner, repo, ref, path)
+    except GitHubRateLimited as e:
+        return _rate_limited(e)
     except Exception as e:
         return jsonify({"error": f"Falha ao obter arquivo: {e}"}), 502
 
+    if fv and fv.get("too_large"):
+        return jsonify({"error": f"Arquivo maior que o limite de leitura ({fv.get('size')} bytes)."}), 413
     if not fv or fv.get("type") != "file" or not fv.get("is_text"):
         return jsonify({"error": "Arquivo não é texto ou não foi possível obter conteúdo."}), 415
 
-    code = fv.get("text") or ""
-    det  = detect_language(path, code)
-    units = analyze_units(code, det.language, path, mode="per_unit" if mode != "whole_file" else "whole_file")
-
-    analysis = {
-        "version": "1.0.0",
-        "file": {
-            "path": path,
-            "sha": fv.get("sha") or "unknown",
-            "repo": repo,
-            "owner": owner,
-            "size_bytes": fv.get("size") or 0
-        },
-        "ref": ref,
-        "language": det.language,
-        "detector": {
-            "method": det.method,
-            "confidence": det.confidence
-        },
-        "units": units,
-        "summary": {
-            "unit_count": len(units),
-            "diagram_suggestion": "flowchart",
-            "notes": "Resultado mock do router; LangChain será plugado aqui."
-        }
+    with session_scope() as db, track_usage() as usage:
+        analysis, cache_status = analyze_file_view(db, owner=owner, repo=repo, ref=ref, path=path, fv=fv, mode=mode)
+    _log_usage(path, usage)
+
+    # Validação contra o schema: envelope + cada unidade uma vez (services/schemas.py).
+    # Antes de gravar: só análises válidas vão para o armazém.
+    try:
+        validate_analysis(analysis)
+    except Exception as e:
+        # se der problema, retorna 500 para ficarmos sabendo em dev
+        return jsonify({"error": f"Saída não compatível com schema: {e}"}), 500
+    analysis_id = _persist_analysis(gh, analysis, mode)
+
+    headers = {"X-Analysis-Cache": cache_status, **_usage_headers(usage)}
+    if analysis_id is not None:
+        headers["X-Analysis-Id"] = str(analysis_id)
+    return jsonify(analysis), 200, headers
+
+def _usage_headers(usage) -> dict:
+    u = usage.as_dict()
+    return {"X-LLM-Calls": str(u["calls"]), "X-LLM-Input-Tokens": str(u["input_tokens"]),
+            "X-LLM-Output-Tokens": str(u["output_tokens"]), "X-LLM-Cached-Tokens": str(u["cached_input_tokens"])}
+
+def _log_usage(path: str, usage):
+    u = usage.as_dict()
+    if u["calls"]:
+        app.logger.info("Análise de %s: %d chamadas, %d tokens de entrada (%d em cache), %d de saída, %.1fs",
+                        path, u["calls"], u["input_tokens"], u["cached_input_tokens"], u["output_tokens"], u["seconds"])
+
+def _persist_analysis(gh, analysis: dict, mode: str) -> int | None:
+    """Grava no armazém de análises pelo escritor único; falha aqui não derruba a resposta."""
+    f = analysis["file"]
+    try:
+        sha = REF_RESOLVER.resolve(gh, f["owner"], f["repo"], analysis["ref"])
+        return DB_WRITER.submit_wait(_save_analysis_op, analysis, sha, normalize_mode(mode))
+    except Exception as e:
+        app.logger.warning("Falha ao gravar análise de %s: %s", f.get("path"), e)
+        return None
+
+def _save_analysis_op(db, analysis: dict, sha: str, mode: str) -> int | None:
+    row = save_analysis(db, analysis, sha=sha, mode=mode, commit=False)
+    return row.id if row is not None else None
+
+def _sse(event: str, data) -> str:
+    """Formata um evento Server-Sent Events (data em JSON numa linha)."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/docs/analyze/stream")
+def docs_analyze_stream():
+    """
+    Igual a POST /docs/analyze, mas em Server-Sent Events (query: owner, repo, ref, path, mode).
+    Eventos: meta -> unit (uma por unidade, assim que fica pronta) -> analysis
+    (envelope final validado) -> diagram (um por unidade) -> done.
+    Falhas depois do início do stream chegam como evento 'failure' {"error": ...}.
+    """
+    owner = request.args.get("owner")
+    repo  = request.args.get("repo")
+    ref   = (request.args.get("ref") or "").strip()
+    path  = request.args.get("path")
+    mode  = request.args.get("mode") or "per_unit"
+
+    if not all([owner, repo, ref, path]):
+        return jsonify({"error": "Campos obrigatórios: owner, repo, ref, path"}), 400
+
+    token = _require_token()
+    if token is None:
+        return jsonify({"error": "Token não configurado"}), 400
+
+    def generate():
+        gh = get_client(token)
+        try:
+            fv = get_file_view(gh, owner, repo, ref, path)
+        except Exception as e:
+            yield _sse("failure", {"error": f"Falha ao obter arquivo: {e}"})
+            return
+        if fv and fv.get("too_large"):
+            yield _sse("failure", {"error": f"Arquivo maior que o limite de leitura ({fv.get('size')} bytes)."})
+            return
+        if not fv or fv.get("type") != "file" or not fv.get("is_text"):
+            yield _sse("failure", {"error": "Arquivo não é texto ou não foi possível obter conteúdo."})
+            return
+
+        try:
+            with session_scope() as db, track_usage() as usage:
+                analysis = yield from _stream_events(db, owner, repo, ref, path, fv, mode)
+            _log_usage(path, usage)
+            analysis_id = _persist_analysis(gh, analysis, mode) if analysis else None
+        except Exception as e:
+            yield _sse("failure", {"error": f"Falha na análise: {e}"})
+            return
+        yield _sse("done", {"analysis_id": analysis_id, "tokens": usage.as_dict()})
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _stream_events(db, owner, repo, ref, path, fv, mode):
+    """
+    Eventos SSE da análise; devolve (via StopIteration) o envelope final, já
+    validado: se a validação falhar, a exceção sobe e nada é gravado.
+    """
+    analysis = None
+    for event, data in stream_file_view(db, owner=owner, repo=repo, ref=ref, path=path, fv=fv, mode=mode):
+        if event == "analysis":
+            validate_analysis(data)
+            analysis = data
+            yield _sse("analysis", data)
+            for dg in DIAGRAM_CACHE.to_mermaid(data).get("diagrams", []):
+                yield _sse("diagram", dg)
+        else:
+            yield _sse(event, data)
+    return analysis
+
+@app.get("/docs/cache/stats")
+def docs_cache_stats():
+    """Contadores de hit/miss e ocupação do cache de análises, do single-flight e dos diagramas."""
+    with session_scope() as db:
+        return jsonify({**cache_stats(db), "single_flight": SINGLE_FLIGHT.stats(),
+                        "diagrams": DIAGRAM_CACHE.stats()}), 200
+
+@app.get("/db/stats")
+def db_stats():
+    """Fila/commits do escritor único e ocupação do pool de conexões."""
+    return jsonify({"writer": DB_WRITER.stats(), "pool": engine.pool.status(),
+                    "dialect": engine.dialect.name}), 200
+
+@app.get("/github/cache/stats")
+def github_cache_stats():
+    """Contadores do cache HTTP condicional (ETag/Last-Modified), das árvores, do blob store e das sessões."""
+    return jsonify({"http": HTTP_CACHE.stats(), "trees": TREE_CACHE.stats(),
+                    "tree_listings": TREE_LISTING_CACHE.stats(), "blobs": BLOB_STORE.stats(),
+                    "sessions": SESSION_POOL.stats()}), 200
+
+@app.get("/github/ratelimit")
+def github_ratelimit():
+    """Cota restante por token (hash), pausas e filas do agendador de rate limit."""
+    return jsonify(GITHUB_SCHEDULER.stats()), 200
+
+@app.get("/llm/stats")
+def llm_stats():
+    """Chamadas, retries, falhas, estado do circuit breaker e tokens acumulados do processo."""
+    return jsonify({**get_executor().stats(), "tokens": TOKEN_TOTALS.as_dict(),
+                    "tokenizer": tokenizer_name()}), 200
+
+@app.post("/batch/jobs")
+def batch_submit():
+    """
+    Body JSON:
+    {
+      "owner": "...", "repo": "...", "ref": "main" | "sha",   # ref opcional (default_branch)
+      "include": ["src/**/*.cbl"], "exclude": ["**/test/*"],  # globs opcionais (fnmatch)
+      "mode": "per_unit" | "whole_file",
+      "base_ref": "v1.2" | "sha"                               # opcional: job 'diff'
     }
+    Enfileira a análise de todos os arquivos reconhecidos do repositório. Com base_ref,
+    só os arquivos adicionados/modificados/renomeados desde base_ref, e nos modificados
+    só as unidades tocadas pelos hunks voltam ao LLM. Acompanhe via GET /batch/jobs/<id>.
+    """
+    payload = request.get_json(silent=True) or {}
+    owner = payload.get("owner")
+    repo = payload.get("repo")
+    ref = (payload.get("ref") or "").strip()
+    include = payload.get("include") or []
+    exclude = payload.get("exclude") or []
+    base_ref = (payload.get("base_ref") or "").strip() or None
+    if not all([owner, repo]):
+        return jsonify({"error": "Campos obrigatórios: owner, repo"}), 400
+    if not isinstance(include, list) or not isinstance(exclude, list):
+        return jsonify({"error": "include/exclude devem ser listas de globs"}), 400
+
+    token = _require_token()
+    if token is None:
+        return jsonify({"error": "Token não configurado"}), 400
+    if not ref:
+        try:
+            ref = get_client(token).get_default_branch(owner, repo)
+        except Exception as e:
+            return jsonify({"error": f"Falha ao obter branch padrão: {e}"}), 502
+
+    with session_scope() as db:
+        job = batch.submit_job(db, owner=owner, repo=repo, ref=ref, include=include,
+                               exclude=exclude, mode=payload.get("mode"), base_ref=base_ref)
+        return jsonify(batch.job_to_dict(job)), 202
+
+@app.get("/batch/jobs")
+def batch_list():
+    with session_scope() as db:
+        jobs = db.query(BatchJob).order_by(BatchJob.id.desc()).limit(50).all()
+        return jsonify({"jobs": [batch.job_to_dict(j) for j in jobs]}), 200
+
+@app.get("/batch/jobs/<int:job_id>")
+def batch_status(job_id):
+    with session_scope() as db:
+        job = db.get(BatchJob, job_id)
+        if job is None:
+            return jsonify({"error": "Job não encontrado"}), 404
+        return jsonify(batch.job_to_dict(job)), 200
+
+@app.post("/batch/jobs/<int:job_id>/cancel")
+def batch_cancel(job_id):
+    with session_scope() as db:
+        job = db.get(BatchJob, job_id)
+        if job is None:
+            return jsonify({"error": "Job não encontrado"}), 404
+        batch.cancel_job(db, job)
+        return jsonify(batch.job_to_dict(job)), 200
+
+@app.get("/batch/jobs/<int:job_id>/files")
+def batch_files(job_id):
+    """Lista os arquivos do job (sem o resultado). Query params: status, offset, limit."""
+    with session_scope() as db:
+        try:
+            offset = max(0, int(request.args.get("offset", 0)))
+            limit = min(1000, max(1, int(request.args.get("limit", 100))))
+        except ValueError:
+            return jsonify({"error": "offset/limit devem ser inteiros"}), 400
+        q = db.query(BatchJobFile).filter(BatchJobFile.job_id == job_id)
+        status = request.args.get("status")
+        if status:
+            q = q.filter(BatchJobFile.status == status)
+        total = q.count()
+        files = q.order_by(BatchJobFile.id).offset(offset).limit(limit).all()
+        return jsonify({"total": total, "offset": offset, "limit": limit,
+                        "files": [batch.file_to_dict(f) for f in files]}), 200
+
+@app.get("/batch/jobs/<int:job_id>/files/<int:file_id>")
+def batch_file_result(job_id, file_id):
+    with session_scope() as db:
+        f = db.query(BatchJobFile).filter(BatchJobFile.job_id == job_id, BatchJobFile.id == file_id).one_or_none()
+        if f is None:
+            return jsonify({"error": "Arquivo não encontrado no job"}), 404
+        return jsonify(batch.file_to_dict(f, with_result=True)), 200
+
+def _bool_arg(name: str) -> bool | None:
+    v = request.args.get(name)
+    if v is None or v == "":
+        return None
+    return v.lower() in ("1", "true", "yes", "sim")
 
-    # Validação contra o schema (opcional)
-    if ANALYSIS_VALIDATOR is not None:
+@app.get("/analyses")
+def analyses_list():
+    """
+    Análises gravadas. Query params: owner, repo, sha | ref, language, path_prefix,
+    has_risks (true/false), offset, limit.
+    """
+    try:
+        with session_scope() as db:
+            total, items = list_analyses(
+                db, owner=request.args.get("owner"), repo=request.args.get("repo"),
+                sha=request.args.get("sha"), ref=request.args.get("ref"),
+                language=request.args.get("language"), path_prefix=request.args.get("path_prefix"),
+                has_risks=_bool_arg("has_risks"),
+                offset=request.args.get("offset", 0), limit=request.args.get("limit", 50))
+    except ValueError:
+        return jsonify({"error": "offset/limit devem ser inteiros"}), 400
+    return jsonify({"total": total, "analyses": items}), 200
+
+@app.get("/analyses/<int:analysis_id>")
+def analyses_get(analysis_id):
+    with session_scope() as db:
+        item = get_analysis(db, analysis_id)
+    if item is None:
+        return jsonify({"error": "Análise não encontrada"}), 404
+    return jsonify(item), 200
+
+@app.get("/analyses/<int:analysis_id>/diagrams")
+def analyses_diagrams(analysis_id):
+    """Diagramas Mermaid de uma análise gravada (sem reenviar o JSON como em /docs/to_mermaid)."""
+    with session_scope() as db:
+        item = get_analysis(db, analysis_id, with_payload=False)
+        if item is None:
+            return jsonify({"error": "Análise não encontrada"}), 404
         try:
-            ANALYSIS_VALIDATOR.validate(analysis)
+            diagrams = DIAGRAM_CACHE.for_analyses(db, [analysis_id])[analysis_id]
         except Exception as e:
-            # se der problema, retorna 500 para ficarmos sabendo em dev
-            return jsonify({"error": f"Saída não compatível com schema: {e}"}), 500
+            return jsonify({"error": f"Falha ao gerar Mermaid: {e}"}), 500
+    return jsonify({"analysis_id": analysis_id, "path": item["path"], "sha": item["sha"],
+                    "diagrams": diagrams}), 200
 
-    return jsonify(analysis), 200
+@app.get("/analyses/diagrams/stream")
+def analyses_diagrams_stream():
+    """
+    Todos os diagramas de um repositório em SSE: um evento 'file' por análise
+    ({analysis_id, path, sha, diagrams}) e 'done' no fim. Query params: owner e
+    repo (obrigatórios), sha | ref, language, path_prefix, page_size.
+    """
+    owner, repo = request.args.get("owner"), request.args.get("repo")
+    if not owner or not repo:
+        return jsonify({"error": "Parâmetros 'owner' e 'repo' são obrigatórios."}), 400
+    try:
+        page_size = int(request.args.get("page_size", 200))
+    except ValueError:
+        return jsonify({"error": "page_size deve ser inteiro"}), 400
+    filters = {"owner": owner, "repo": repo, "sha": request.args.get("sha"), "ref": request.args.get("ref"),
+               "language": request.args.get("language"), "path_prefix": request.args.get("path_prefix")}
+
+    def generate():
+        files = diagrams = 0
+        started = time.monotonic()
+        try:
+            with session_scope() as db:
+                for page in iter_analyses(db, page_size=page_size, **filters):
+                    # diagramas da página inteira de uma vez (índice/cache, sem payload)
+                    found = DIAGRAM_CACHE.for_analyses(db, [i["id"] for i in page])
+                    for item in page:
+                        files += 1
+                        dgs = found.get(item["id"], [])
+                        diagrams += len(dgs)
+                        yield _sse("file", {"analysis_id": item["id"], "path": item["path"], "sha": item["sha"],
+                                            "language": item["language"], "mode": item["mode"],
+                                            "diagrams": dgs})
+        except Exception as e:
+            yield _sse("failure", {"error": f"Falha ao gerar Mermaid: {e}"})
+            return
+        yield _sse("done", {"files": files, "diagrams": diagrams,
+                            "seconds": round(time.monotonic() - started, 3)})
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/analyses/units")
+def analyses_units():
+    """
+    Busca de unidades. Query params: name (exato, ou prefixo terminando em '*'),
+    calls (alvo de PERFORM/CALL/chamada), call_kind, language, owner, repo,
+    sha | ref, has_risks, offset, limit.
+    Ex.: /analyses/units?language=cobol&calls=PGMX&call_kind=call
+    """
+    try:
+        with session_scope() as db:
+            total, items = search_units(
+                db, name=request.args.get("name"), calls=request.args.get("calls"),
+                call_kind=request.args.get("call_kind"), language=request.args.get("language"),
+                owner=request.args.get("owner"), repo=request.args.get("repo"),
+                sha=request.args.get("sha"), ref=request.args.get("ref"),
+                has_risks=_bool_arg("has_risks"),
+                offset=request.args.get("offset", 0), limit=request.args.get("limit", 50))
+    except ValueError:
+        return jsonify({"error": "offset/limit devem ser inteiros"}), 400
+    return jsonify({"total": total, "units": items}), 200
 
 @app.post("/docs/to_mermaid")
 def docs_to_mermaid():
@@ -225,7 +567,7 @@ def docs_to_mermaid():
     if not isinstance(analysis, dict):
         return jsonify({"error": "Campo 'analysis' é obrigatório e deve ser um objeto."}), 400
     try:
-        result = to_mermaid(analysis)
+        result = DIAGRAM_CACHE.to_mermaid(analysis)
         return jsonify(result), 200
     except Exception as e:
         return jsonify({"error": f"Falha ao gerar Mermaid: {e}"}), 500
@@ -233,9 +575,7 @@ def docs_to_mermaid():
 
 @app.get("/")
 def index():
-    db = next(get_db())
-    enc_token = get_config_value(db, "github_token")
-    has_token = enc_token is not None
+    has_token = get_config("github_token") is not None
     return render_template("index.html", has_token=has_token)
 
 @app.get("/health")
@@ -245,33 +585,29 @@ def health():
 @app.get("/settings")
 def settings_get():
     # Mostra se o token existe (mas sem exibi-lo)
-    db = next(get_db())
-    enc_token = get_config_value(db, "github_token")
-    has_token = enc_token is not None
+    has_token = get_config("github_token") is not None
     return render_template("settings.html", has_token=has_token)
 
 @app.post("/settings")
 def settings_post():
-    db = next(get_db())
     token = request.form.get("github_token") or ""
     if not token.strip():
         flash("Informe um token do GitHub (PAT).", "error")
         return redirect(url_for("settings_get"))
     enc = encrypt(token.strip())
-    set_config_value(db, "github_token", enc)
+    with session_scope() as db:
+        set_config_value(db, "github_token", enc)
     flash("Token salvo com sucesso.", "success")
     return redirect(url_for("settings_get"))
 
 @app.post("/settings/test")
 def settings_test():
-    db = next(get_db())
-    enc_token = get_config_value(db, "github_token")
-    token = decrypt(enc_token) if enc_token else None
+    token = get_github_token()
     if not token:
         flash("Token não configurado.", "error")
         return redirect(url_for("settings_get"))
     try:
-        gh = GitHubClient(token)
+        gh = get_client(token)
         data = gh.get_user()
         flash(f"Autenticado como: {data.get('login')}", "success")
     except Exception as e:
@@ -280,38 +616,41 @@ def settings_test():
 
 @app.get("/github/repos")
 def github_repos():
-    db = next(get_db())
-    enc_token = get_config_value(db, "github_token")
-    token = decrypt(enc_token) if enc_token else None
+    token = get_github_token()
     if not token:
         flash("Configure o token do GitHub primeiro.", "error")
         return redirect(url_for("settings_get"))
+    org = (request.args.get("org") or "").strip()
+    gh = get_client(token)
     try:
-        gh = GitHubClient(token)
-        repos = gh.list_repos()
-        # mapeia campos relevantes para a view
-        view = [
-            {
-                "name": r.get("name"),
-                "html_url": r.get("html_url"),
-                "private": r.get("private"),
-                "updated_at": r.get("updated_at"),
-                "description": r.get("description"),
-                "owner": r.get("owner", {}).get("login"),
-            }
-            for r in repos
-        ]
-        return render_template("repos.html", repos=view)
+        # a primeira página é buscada aqui para que erros (token inválido, org
+        # inexistente) ainda virem flash + redirect; o resto vem em stream
+        pages = gh.iter_pages(f"/orgs/{org}/repos" if org else "/user/repos", {"sort": "updated"})
+        first = next(pages)
     except Exception as e:
         flash(f"Erro ao listar repositórios: {e}", "error")
         return redirect(url_for("settings_get"))
+
+    def view():
+        # mapeia campos relevantes para a view, página a página
+        for page in itertools.chain([first], pages):
+            for r in page:
+                yield {
+                    "name": r.get("name"),
+                    "html_url": r.get("html_url"),
+                    "private": r.get("private"),
+                    "updated_at": r.get("updated_at"),
+                    "description": r.get("description"),
+                    "owner": r.get("owner", {}).get("login"),
+                }
+
+    # stream_template: o navegador começa a renderizar a tabela antes das últimas páginas
+    return Response(stream_with_context(stream_template("repos.html", repos=view(), org=org)))
     
 @app.get("/enter")
 def enter():
     """Decide automaticamente pra onde ir ao clicar em 'Entrar' na home."""
-    db = next(get_db())
-    enc_token = get_config_value(db, "github_token")
-    if enc_token:
+    if get_config("github_token"):
         return redirect(url_for("github_repos"))
     return redirect(url_for("settings_get"))    
 
@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, UniqueConstraint, Index, func
+from services.db import Base
+
+class AnalysisCacheEntry(Base):
+    """
+    Cache de análises endereçado por conteúdo: a chave é derivada do blob sha do
+    arquivo + linguagem + modo + modelo + versão do prompt/schema. Como o blob sha
+    identifica o conteúdo, o mesmo resultado serve para qualquer branch/ref.
+    """
+    __tablename__ = "analysis_cache"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    cache_key = Column(String(64), nullable=False)
+    blob_sha = Column(String(64), nullable=False)
+    language = Column(String(40), nullable=False)
+    mode = Column(String(20), nullable=False)
+    model = Column(String(100), nullable=False)
+    version = Column(String(40), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON das units
+    size_bytes = Column(Integer, nullable=False, default=0)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, server_default=func.now())
+    last_access_at = Column(DateTime, server_default=func.now())
+    expires_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("cache_key", name="uq_analysis_cache_key"),
+        Index("ix_analysis_cache_last_access", "last_access_at"),
+    )
+
+class AnalysisLock(Base):
+    """
+    Lease de uma análise em andamento (single-flight entre processos): uma linha
+    por chave do cache enquanto algum processo calcula aquele resultado.
+    """
+    __tablename__ = "analysis_locks"
+    cache_key = Column(String(64), primary_key=True)
+    owner = Column(String(100), nullable=False)  # host:pid:id da chamada
+    acquired_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
@@ -0,0 +1,108 @@
+from sqlalchemy import (
+    Boolean, Column, Float, Integer, String, Text, DateTime, ForeignKey, UniqueConstraint, Index, func,
+)
+from sqlalchemy.orm import relationship
+from services.db import Base
+
+# Armazém persistente das análises: diferente do analysis_cache (chave -> JSON das
+# units, com TTL/LRU), aqui cada análise vira linhas consultáveis por repositório,
+# commit, linguagem, nome de unidade e alvo de chamada.
+
+class Repository(Base):
+    __tablename__ = "repositories"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    owner = Column(String(200), nullable=False)
+    name = Column(String(200), nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (UniqueConstraint("owner", "name", name="uq_repositories_owner_name"),)
+
+class RepoRef(Base):
+    """Último commit visto para um branch/tag (refs se movem; o histórico fica em source_files)."""
+    __tablename__ = "repo_refs"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    repository_id = Column(Integer, ForeignKey("repositories.id", ondelete="CASCADE"), nullable=False)
+    ref = Column(String(255), nullable=False)
+    sha = Column(String(40), nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (UniqueConstraint("repository_id", "ref", name="uq_repo_refs_repo_ref"),)
+
+class SourceFile(Base):
+    """Um arquivo em um commit."""
+    __tablename__ = "source_files"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    repository_id = Column(Integer, ForeignKey("repositories.id", ondelete="CASCADE"), nullable=False)
+    sha = Column(String(40), nullable=False)  # commit
+    path = Column(String, nullable=False)
+    blob_sha = Column(String(40), nullable=True)
+    language = Column(String(40), nullable=True)
+    size = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("repository_id", "sha", "path", name="uq_source_files_repo_sha_path"),
+        Index("ix_source_files_language", "language"),
+        Index("ix_source_files_blob_sha", "blob_sha"),
+    )
+
+class Analysis(Base):
+    """Análise de um arquivo (uma por modo; reanalisar substitui a anterior)."""
+    __tablename__ = "analyses"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    file_id = Column(Integer, ForeignKey("source_files.id", ondelete="CASCADE"), nullable=False)
+    mode = Column(String(20), nullable=False)
+    language = Column(String(40), nullable=False)
+    model = Column(String(100), nullable=False)
+    version = Column(String(40), nullable=False)
+    detector_method = Column(String(40), nullable=True)
+    detector_confidence = Column(Float, nullable=True)
+    unit_count = Column(Integer, nullable=False, default=0)
+    risk_count = Column(Integer, nullable=False, default=0)
+    payload = Column(Text, nullable=False)  # JSON completo (analysis.schema.json)
+    created_at = Column(DateTime, server_default=func.now())
+
+    file = relationship("SourceFile")
+    units = relationship("AnalysisUnit", back_populates="analysis", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        UniqueConstraint("file_id", "mode", name="uq_analyses_file_mode"),
+        Index("ix_analyses_language", "language"),
+        Index("ix_analyses_risk_count", "risk_count"),
+    )
+
+class AnalysisUnit(Base):
+    __tablename__ = "analysis_units"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    analysis_id = Column(Integer, ForeignKey("analyses.id", ondelete="CASCADE"), nullable=False)
+    unit_id = Column(String(64), nullable=False)
+    name = Column(String(200), nullable=False)
+    kind = Column(String(20), nullable=False)  # generic | cobol
+    language = Column(String(40), nullable=False)  # copiado da análise: filtro sem join
+    start_line = Column(Integer, nullable=False)
+    end_line = Column(Integer, nullable=False)
+    purpose = Column(Text, nullable=True)
+    risk_count = Column(Integer, nullable=False, default=0)
+    has_risks = Column(Boolean, nullable=False, default=False)
+
+    analysis = relationship("Analysis", back_populates="units")
+    calls = relationship("UnitCall", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index("ix_analysis_units_analysis", "analysis_id"),
+        Index("ix_analysis_units_name", "name"),
+        Index("ix_analysis_units_language_name", "language", "name"),
+        Index("ix_analysis_units_has_risks", "has_risks"),
+    )
+
+class UnitCall(Base):
+    """Chamadas de uma unidade: PERFORM/GO TO/CALL no COBOL, logic.calls nas genéricas."""
+    __tablename__ = "unit_calls"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    unit_pk = Column(Integer, ForeignKey("analysis_units.id", ondelete="CASCADE"), nullable=False)
+    target = Column(String(300), nullable=False)
+    kind = Column(String(20), nullable=False)  # perform | goto | call | api | db | queue | method | function
+
+    __table_args__ = (
+        Index("ix_unit_calls_target", "target"),
+        Index("ix_unit_calls_unit", "unit_pk"),
+    )
@@ -0,0 +1,64 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, UniqueConstraint, Index, func
+from services.db import Base
+
+class BatchJob(Base):
+    """
+    Job de análise em lote de um repositório. O estado fica no banco para que
+    um restart retome o job de onde parou (arquivos 'done' não são refeitos).
+    status: queued | enumerating | running | done | failed | cancelled
+    kind: full (todos os arquivos do ref) | diff (só o que mudou de base_ref para ref)
+    """
+    __tablename__ = "batch_jobs"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(10), nullable=False, default="full")
+    owner = Column(String(200), nullable=False)
+    repo = Column(String(200), nullable=False)
+    ref = Column(String(255), nullable=False)
+    sha = Column(String(40), nullable=True)  # fixado na enumeração: o job todo usa o mesmo commit
+    base_ref = Column(String(255), nullable=True)  # jobs 'diff'
+    base_sha = Column(String(40), nullable=True)
+    mode = Column(String(20), nullable=False, default="per_unit")
+    include = Column(Text, nullable=True)    # JSON: lista de globs
+    exclude = Column(Text, nullable=True)    # JSON: lista de globs
+    status = Column(String(20), nullable=False, default="queued")
+    error = Column(Text, nullable=True)
+    total = Column(Integer, nullable=False, default=0)
+    done = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    cached = Column(Integer, nullable=False, default=0)
+    reused_units = Column(Integer, nullable=False, default=0)  # unidades aproveitadas da base (diff)
+    worker_id = Column(String(100), nullable=True)   # host:pid do processo que executa o job
+    heartbeat_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_batch_jobs_status", "status"),)
+
+class BatchJobFile(Base):
+    """
+    Um arquivo dentro de um job. status: pending | done | failed
+    change (jobs diff): added | modified | renamed | unchanged
+    """
+    __tablename__ = "batch_job_files"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(Integer, ForeignKey("batch_jobs.id", ondelete="CASCADE"), nullable=False)
+    path = Column(String, nullable=False)
+    blob_sha = Column(String(40), nullable=True)
+    size = Column(Integer, nullable=True)
+    language = Column(String(40), nullable=True)
+    change = Column(String(10), nullable=True)
+    previous_path = Column(String, nullable=True)     # renomeados
+    base_blob_sha = Column(String(40), nullable=True)
+    hunks = Column(Text, nullable=True)               # JSON: [[início antigo, qtd, início novo, qtd], ...]
+    status = Column(String(20), nullable=False, default="pending")
+    cache_status = Column(String(10), nullable=True)  # hit | miss | partial | shared
+    attempts = Column(Integer, nullable=False, default=0)
+    result = Column(Text, nullable=True)  # JSON da análise (analysis.schema.json)
+    error = Column(Text, nullable=True)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("job_id", "path", name="uq_batch_job_file_path"),
+        Index("ix_batch_job_files_job_status", "job_id", "status"),
+    )
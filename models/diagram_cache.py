@@ -0,0 +1,29 @@
+from sqlalchemy import Column, ForeignKey, Integer, String, Text, DateTime, func
+from services.db import Base
+
+class DiagramCacheEntry(Base):
+    """
+    Diagrama Mermaid já gerado, endereçado pelo hash do conteúdo da unidade
+    (JSON canônico + versão do gerador). Unidades iguais em arquivos, commits ou
+    análises diferentes compartilham a mesma linha; como o conteúdo define o
+    resultado, as entradas não expiram.
+    """
+    __tablename__ = "diagram_cache"
+    unit_hash = Column(String(64), primary_key=True)
+    type = Column(String(40), nullable=False)
+    code = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+class AnalysisDiagram(Base):
+    """
+    Índice dos diagramas de uma análise gravada: hash de cada unidade, na ordem
+    do payload. Com ele, rediagramar análises gravadas é um join com
+    diagram_cache, sem ler o payload nem recalcular hashes.
+    """
+    __tablename__ = "analysis_diagrams"
+    analysis_id = Column(Integer, ForeignKey("analyses.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(String(20), primary_key=True)  # MERMAID_VERSION
+    position = Column(Integer, primary_key=True)
+    unit_id = Column(Text, nullable=True)
+    unit_name = Column(Text, nullable=True)
+    unit_hash = Column(String(64), nullable=False)
@@ -0,0 +1,213 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import bindparam, func, update
+from models.analysis_cache import AnalysisCacheEntry
+from services.db_writer import DB_WRITER, DB_WRITER_TIMEOUT
+
+# Política de retenção (configurável via .env)
+CACHE_TTL_SECONDS = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+# A limpeza (_evict_op, agregado sobre a tabela) roda a cada N gravações ou quando a contagem
+# aproximada do processo passa dos limites
+CACHE_EVICT_EVERY = int(os.getenv("ANALYSIS_CACHE_EVICT_EVERY", "50"))
+# Acessos (hits/last_access_at) acumulados em memória e gravados em lote pelo escritor único
+CACHE_HIT_FLUSH_KEYS = int(os.getenv("ANALYSIS_CACHE_HIT_FLUSH_KEYS", "100"))
+CACHE_HIT_FLUSH_SECONDS = float(os.getenv("ANALYSIS_CACHE_HIT_FLUSH_SECONDS", "5"))
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+_approx = {"entries": None, "bytes": 0, "stores": 0}  # ocupação estimada desde a última limpeza
+_pending_hits: dict[str, list] = {}  # chave -> [hits, último acesso]
+_last_flush = time.monotonic()
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _count(name: str, n: int = 1):
+    with _stats_lock:
+        _stats[name] += n
+
+def make_cache_key(blob_sha: str, language: str, mode: str, model: str, version: str) -> str:
+    raw = "|".join([blob_sha or "", (language or "").lower(), mode or "", model or "", version or ""])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+# Operações do escritor único (*_op) não mexem nos contadores: o DbWriter pode
+# refazê-las uma a uma quando o lote falha. Contagem só no callback do Future.
+
+def _drop_expired_op(db, key: str, now: datetime) -> int:
+    return db.query(AnalysisCacheEntry).filter(
+        AnalysisCacheEntry.cache_key == key,
+        AnalysisCacheEntry.expires_at <= now,
+    ).delete(synchronize_session=False)
+
+def _on_dropped(fut):
+    if fut.exception() is None and fut.result():
+        _count("evictions", fut.result())
+
+def _touch_op(db, rows: list[dict]) -> int:
+    table = AnalysisCacheEntry.__table__
+    db.execute(update(table).where(table.c.cache_key == bindparam("k"))
+                 .values(hits=table.c.hits + bindparam("n"), last_access_at=bindparam("ts")), rows)
+    return len(rows)
+
+def flush_hits():
+    """Envia ao escritor único os acessos acumulados (um UPDATE em lote)."""
+    global _last_flush
+    with _stats_lock:
+        pending = dict(_pending_hits)
+        _pending_hits.clear()
+        _last_flush = time.monotonic()
+    if pending:
+        DB_WRITER.submit(_touch_op, [{"k": k, "n": n, "ts": ts} for k, (n, ts) in pending.items()])
+
+def _record_hit(key: str, now: datetime):
+    with _stats_lock:
+        _stats["hits"] += 1
+        item = _pending_hits.setdefault(key, [0, now])
+        item[0] += 1
+        item[1] = now
+        due = (len(_pending_hits) >= CACHE_HIT_FLUSH_KEYS
+               or time.monotonic() - _last_flush >= CACHE_HIT_FLUSH_SECONDS)
+    if due:
+        flush_hits()
+
+def get_cached_units(db, key: str) -> list[dict] | None:
+    """
+    Retorna as units em cache (ou None). Só lê: a remoção de entradas expiradas e
+    os contadores de acesso vão para o escritor único, sem segurar o lock de escrita.
+    """
+    row = (db.query(AnalysisCacheEntry.payload, AnalysisCacheEntry.expires_at)
+             .filter(AnalysisCacheEntry.cache_key == key).one_or_none())
+    if row is None:
+        _count("misses")
+        return None
+    payload, expires_at = row
+    now = _utcnow()
+    if expires_at is not None and expires_at <= now:
+        DB_WRITER.submit(_drop_expired_op, key, now).add_done_callback(_on_dropped)
+        _count("misses")
+        return None
+    _record_hit(key, now)
+    return json.loads(payload)
+
+def _evict_due(size_bytes: int) -> bool:
+    with _stats_lock:
+        if _approx["entries"] is None:
+            return True  # primeira gravação do processo: sincroniza a contagem
+        _approx["entries"] += 1
+        _approx["bytes"] += size_bytes
+        _approx["stores"] += 1
+        return (_approx["stores"] >= CACHE_EVICT_EVERY or _approx["entries"] > CACHE_MAX_ENTRIES
+                or _approx["bytes"] > CACHE_MAX_BYTES)
+
+_REFRESHED = ("payload", "size_bytes", "last_access_at", "expires_at")
+
+def _put_op(db, key: str, *, blob_sha: str, language: str, mode: str,
+            model: str, version: str, units: list[dict]) -> int:
+    """
+    Upsert pela chave: se outro processo gravou a mesma chave antes (lease
+    vencido, corrida), só atualiza a linha em vez de falhar com IntegrityError.
+    Retorna o tamanho gravado.
+    """
+    payload = json.dumps(units, ensure_ascii=False, separators=(",", ":"))
+    now = _utcnow()
+    values = {"cache_key": key, "blob_sha": blob_sha, "language": language, "mode": mode, "model": model,
+              "version": version, "payload": payload, "size_bytes": len(payload.encode("utf-8")),
+              "last_access_at": now,
+              "expires_at": now + timedelta(seconds=CACHE_TTL_SECONDS) if CACHE_TTL_SECONDS > 0 else None}
+
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        ins = dialect_insert(AnalysisCacheEntry).values(**values)
+        db.execute(ins.on_conflict_do_update(index_elements=["cache_key"],
+                                             set_={k: ins.excluded[k] for k in _REFRESHED}))
+    else:
+        item = db.query(AnalysisCacheEntry).filter(AnalysisCacheEntry.cache_key == key).one_or_none()
+        if item is None:
+            db.add(AnalysisCacheEntry(**values))
+        else:
+            for k in _REFRESHED:
+                setattr(item, k, values[k])
+        db.flush()
+    return values["size_bytes"]
+
+def _on_stored(fut):
+    if fut.exception() is not None:
+        return
+    _count("stores")
+    if _evict_due(fut.result()):
+        schedule_evict()
+
+def put_cached_units(key: str, *, blob_sha: str, language: str, mode: str,
+                     model: str, version: str, units: list[dict]):
+    """
+    Grava no cache pelo escritor único e espera o commit; dispara evict() quando
+    devido (ver _evict_due). Levanta a exceção da gravação, se houver.
+    """
+    fut = DB_WRITER.submit(_put_op, key, blob_sha=blob_sha, language=language, mode=mode,
+                           model=model, version=version, units=units)
+    fut.add_done_callback(_on_stored)
+    fut.result(DB_WRITER_TIMEOUT)
+
+def _evict_op(db) -> tuple[int, int, int]:
+    """
+    Remove entradas expiradas e, se o cache passar dos limites de quantidade/tamanho,
+    descarta as menos acessadas recentemente (LRU). (removidas, entradas, bytes).
+    """
+    removed = db.query(AnalysisCacheEntry).filter(
+        AnalysisCacheEntry.expires_at.isnot(None),
+        AnalysisCacheEntry.expires_at <= _utcnow(),
+    ).delete(synchronize_session=False)
+
+    count, total = db.query(func.count(AnalysisCacheEntry.id), func.coalesce(func.sum(AnalysisCacheEntry.size_bytes), 0)).one()
+    if count > CACHE_MAX_ENTRIES or total > CACHE_MAX_BYTES:
+        rows = (db.query(AnalysisCacheEntry.id, AnalysisCacheEntry.size_bytes)
+                  .order_by(AnalysisCacheEntry.last_access_at.asc(), AnalysisCacheEntry.id.asc())
+                  .all())
+        drop = []
+        for rid, size in rows:
+            if count <= CACHE_MAX_ENTRIES and total <= CACHE_MAX_BYTES:
+                break
+            drop.append(rid)
+            count -= 1
+            total -= size or 0
+        if drop:
+            removed += db.query(AnalysisCacheEntry).filter(AnalysisCacheEntry.id.in_(drop)).delete(synchronize_session=False)
+    return removed, count, int(total)
+
+def _on_evicted(fut):
+    if fut.exception() is not None:
+        return
+    removed, count, total = fut.result()
+    with _stats_lock:
+        _approx.update(entries=count, bytes=total, stores=0)
+        _stats["evictions"] += removed
+
+def schedule_evict():
+    """Enfileira evict no escritor único, sem esperar."""
+    DB_WRITER.submit(_evict_op).add_done_callback(_on_evicted)
+
+def cache_stats(db) -> dict:
+    with _stats_lock:
+        out = dict(_stats)
+    count, total = db.query(func.count(AnalysisCacheEntry.id), func.coalesce(func.sum(AnalysisCacheEntry.size_bytes), 0)).one()
+    lookups = out["hits"] + out["misses"]
+    out.update({
+        "entries": count,
+        "size_bytes": int(total),
+        "hit_ratio": round(out["hits"] / lookups, 4) if lookups else 0.0,
+        "max_entries": CACHE_MAX_ENTRIES,
+        "max_bytes": CACHE_MAX_BYTES,
+        "ttl_seconds": CACHE_TTL_SECONDS,
+    })
+    return out
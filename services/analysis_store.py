@@ -0,0 +1,263 @@
+from __future__ import annotations
+import json
+from typing import Iterator, List, Tuple
+from sqlalchemy import exists, insert, select
+from sqlalchemy.orm import defer
+from models.analysis_store import Analysis, AnalysisUnit, RepoRef, Repository, SourceFile, UnitCall
+from models.diagram_cache import AnalysisDiagram
+from services.analyzer.router import analyzer_identity, is_fallback_units
+
+# Persistência das análises em tabelas consultáveis (models/analysis_store.py).
+# Quem grava: /docs/analyze, o stream SSE e os jobs em lote; quem lê: /analyses*.
+
+MAX_PAGE = 500
+
+def _repository(db, owner: str, name: str) -> Repository:
+    repo = db.query(Repository).filter(Repository.owner == owner, Repository.name == name).one_or_none()
+    if repo is None:
+        repo = Repository(owner=owner, name=name)
+        db.add(repo)
+        db.flush()
+    return repo
+
+def record_ref(db, repo: Repository, ref: str | None, sha: str):
+    if not ref or ref == sha:
+        return
+    item = db.query(RepoRef).filter(RepoRef.repository_id == repo.id, RepoRef.ref == ref).one_or_none()
+    if item is None:
+        db.add(RepoRef(repository_id=repo.id, ref=ref, sha=sha))
+    elif item.sha != sha:
+        item.sha = sha
+
+def _unit_calls(unit: dict) -> Iterator[Tuple[str, str]]:
+    """(alvo, tipo) das chamadas de uma unidade, sem repetir."""
+    seen = set()
+    def emit(target, kind):
+        target = str(target or "").strip()[:300]
+        if target and (target, kind) not in seen:
+            seen.add((target, kind))
+            yield target, kind
+    cf = unit.get("control_flow") or {}
+    for name in cf.get("perform") or []:
+        yield from emit(name, "perform")
+    for name in cf.get("goto") or []:
+        yield from emit(name, "goto")
+    for call in cf.get("call") or []:
+        yield from emit(call.get("program") if isinstance(call, dict) else call, "call")
+    for call in (unit.get("logic") or {}).get("calls") or []:
+        if isinstance(call, dict):
+            yield from emit(call.get("target"), (call.get("kind") or "function")[:20])
+
+def _delete_analysis(db, analysis_id: int):
+    unit_ids = select(AnalysisUnit.id).where(AnalysisUnit.analysis_id == analysis_id)
+    db.query(UnitCall).filter(UnitCall.unit_pk.in_(unit_ids)).delete(synchronize_session=False)
+    db.query(AnalysisUnit).filter(AnalysisUnit.analysis_id == analysis_id).delete(synchronize_session=False)
+    db.query(AnalysisDiagram).filter(AnalysisDiagram.analysis_id == analysis_id).delete(synchronize_session=False)
+    db.query(Analysis).filter(Analysis.id == analysis_id).delete(synchronize_session=False)
+
+def save_analysis(db, analysis: dict, *, sha: str, mode: str, commit: bool = True) -> Analysis | None:
+    """
+    Grava (ou substitui) a análise de um arquivo em um commit. Unidades de
+    contingência (falha do LLM) não são gravadas, como no cache de análises.
+    """
+    units = analysis.get("units") or []
+    if is_fallback_units(units):
+        return None
+    f = analysis["file"]
+    language = analysis.get("language") or "unknown"
+    repo = _repository(db, f["owner"], f["repo"])
+    record_ref(db, repo, analysis.get("ref"), sha)
+
+    sf = db.query(SourceFile).filter(SourceFile.repository_id == repo.id, SourceFile.sha == sha,
+                                     SourceFile.path == f["path"]).one_or_none()
+    if sf is None:
+        sf = SourceFile(repository_id=repo.id, sha=sha, path=f["path"])
+        db.add(sf)
+    sf.blob_sha = f.get("sha") if f.get("sha") != "unknown" else None
+    sf.language = language
+    sf.size = f.get("size_bytes")
+    db.flush()
+
+    old = db.query(Analysis.id).filter(Analysis.file_id == sf.id, Analysis.mode == mode).scalar()
+    if old is not None:
+        _delete_analysis(db, old)
+
+    model, version = analyzer_identity(language)
+    detector = analysis.get("detector") or {}
+    unit_rows, unit_calls, total_risks = [], [], 0
+    for u in units:
+        risks = len(u.get("risks") or [])
+        total_risks += risks
+        rng = u.get("range") or {}
+        unit_rows.append({"unit_id": str(u.get("id") or "")[:64], "name": str(u.get("name") or "")[:200],
+                          "kind": u.get("kind") or "generic", "language": language,
+                          "start_line": rng.get("start_line") or 1, "end_line": rng.get("end_line") or 1,
+                          "purpose": u.get("purpose"), "risk_count": risks, "has_risks": risks > 0})
+        unit_calls.append(list(_unit_calls(u)))
+
+    row = Analysis(file_id=sf.id, mode=mode, language=language, model=model, version=version,
+                   detector_method=detector.get("method"), detector_confidence=detector.get("confidence"),
+                   unit_count=len(units), risk_count=total_risks,
+                   payload=json.dumps(analysis, ensure_ascii=False))
+    db.add(row)
+    db.flush()
+
+    # unidades e chamadas em INSERTs em lote (executemany / insertmanyvalues)
+    if unit_rows:
+        for r in unit_rows:
+            r["analysis_id"] = row.id
+        ids = db.scalars(insert(AnalysisUnit).returning(AnalysisUnit.id, sort_by_parameter_order=True),
+                         unit_rows).all()
+        call_rows = [{"unit_pk": pk, "target": t, "kind": k}
+                     for pk, calls in zip(ids, unit_calls) for t, k in calls]
+        if call_rows:
+            db.execute(insert(UnitCall), call_rows)
+    if commit:
+        db.commit()
+    return row
+
+# ------------------ consultas ------------------
+
+def _page(offset, limit) -> Tuple[int, int]:
+    return max(0, int(offset or 0)), min(MAX_PAGE, max(1, int(limit or 50)))
+
+def analysis_to_dict(a: Analysis, sf: SourceFile, repo: Repository, with_payload: bool = False) -> dict:
+    out = {
+        "id": a.id,
+        "owner": repo.owner,
+        "repo": repo.name,
+        "sha": sf.sha,
+        "path": sf.path,
+        "blob_sha": sf.blob_sha,
+        "language": a.language,
+        "mode": a.mode,
+        "model": a.model,
+        "version": a.version,
+        "unit_count": a.unit_count,
+        "risk_count": a.risk_count,
+        "created_at": a.created_at.isoformat() if a.created_at else None,
+    }
+    if with_payload:
+        out["analysis"] = json.loads(a.payload)
+    return out
+
+def _filter_repo(db, q, owner, repo, sha, ref):
+    """Filtros de repositório/commit; None se o ref nunca foi gravado (resultado vazio)."""
+    if owner:
+        q = q.filter(Repository.owner == owner)
+    if repo:
+        q = q.filter(Repository.name == repo)
+    if sha:
+        return q.filter(SourceFile.sha == sha)
+    if ref:
+        # ref -> último commit gravado para ele
+        rq = db.query(RepoRef.sha).join(Repository, Repository.id == RepoRef.repository_id).filter(RepoRef.ref == ref)
+        if owner:
+            rq = rq.filter(Repository.owner == owner)
+        if repo:
+            rq = rq.filter(Repository.name == repo)
+        shas = [s for (s,) in rq.all()]
+        if not shas:
+            return None
+        q = q.filter(SourceFile.sha.in_(shas))
+    return q
+
+def list_analyses(db, *, owner=None, repo=None, sha=None, ref=None, language=None, path_prefix=None,
+                  has_risks=None, offset=0, limit=50) -> Tuple[int, List[dict]]:
+    q = (db.query(Analysis, SourceFile, Repository)
+           .join(SourceFile, SourceFile.id == Analysis.file_id)
+           .join(Repository, Repository.id == SourceFile.repository_id))
+    q = _filter_repo(db, q, owner, repo, sha, ref)
+    if q is None:
+        return 0, []
+    if language:
+        q = q.filter(Analysis.language == language.lower())
+    if path_prefix:
+        q = q.filter(SourceFile.path.startswith(path_prefix, autoescape=True))
+    if has_risks is not None:
+        q = q.filter(Analysis.risk_count > 0 if has_risks else Analysis.risk_count == 0)
+    offset, limit = _page(offset, limit)
+    total = q.count()
+    rows = q.order_by(SourceFile.path, Analysis.mode).offset(offset).limit(limit).all()
+    return total, [analysis_to_dict(a, sf, r) for a, sf, r in rows]
+
+def get_analysis(db, analysis_id: int, with_payload: bool = True) -> dict | None:
+    q = (db.query(Analysis, SourceFile, Repository)
+           .join(SourceFile, SourceFile.id == Analysis.file_id)
+           .join(Repository, Repository.id == SourceFile.repository_id))
+    if not with_payload:
+        q = q.options(defer(Analysis.payload))
+    row = q.filter(Analysis.id == analysis_id).one_or_none()
+    return analysis_to_dict(*row, with_payload=with_payload) if row else None
+
+def iter_analyses(db, *, owner=None, repo=None, sha=None, ref=None, language=None, path_prefix=None,
+                  page_size=200, with_payload=False) -> Iterator[List[dict]]:
+    """
+    Páginas de análises em ordem de id, por keyset: cada página é uma consulta
+    curta (sem OFFSET), então dá para percorrer o repositório inteiro.
+    """
+    q = (db.query(Analysis, SourceFile, Repository)
+           .join(SourceFile, SourceFile.id == Analysis.file_id)
+           .join(Repository, Repository.id == SourceFile.repository_id))
+    if not with_payload:
+        q = q.options(defer(Analysis.payload))
+    q = _filter_repo(db, q, owner, repo, sha, ref)
+    if q is None:
+        return
+    if language:
+        q = q.filter(Analysis.language == language.lower())
+    if path_prefix:
+        q = q.filter(SourceFile.path.startswith(path_prefix, autoescape=True))
+    _, page_size = _page(0, page_size)
+    last_id = 0
+    while True:
+        rows = q.filter(Analysis.id > last_id).order_by(Analysis.id).limit(page_size).all()
+        if not rows:
+            return
+        last_id = rows[-1][0].id
+        yield [analysis_to_dict(a, sf, r, with_payload=with_payload) for a, sf, r in rows]
+        if len(rows) < page_size:
+            return
+
+def search_units(db, *, name=None, calls=None, call_kind=None, language=None, owner=None, repo=None,
+                 sha=None, ref=None, has_risks=None, offset=0, limit=50) -> Tuple[int, List[dict]]:
+    """
+    Unidades por nome (prefixo com '*' no fim, senão exato), linguagem, riscos e
+    alvo de chamada: ex. language=cobol&calls=PGMX&call_kind=call.
+    """
+    q = (db.query(AnalysisUnit, Analysis, SourceFile, Repository)
+           .join(Analysis, Analysis.id == AnalysisUnit.analysis_id)
+           .join(SourceFile, SourceFile.id == Analysis.file_id)
+           .join(Repository, Repository.id == SourceFile.repository_id))
+    q = _filter_repo(db, q, owner, repo, sha, ref)
+    if q is None:
+        return 0, []
+    if language:
+        q = q.filter(AnalysisUnit.language == language.lower())
+    if name:
+        q = (q.filter(AnalysisUnit.name.startswith(name[:-1], autoescape=True)) if name.endswith("*")
+             else q.filter(AnalysisUnit.name == name))
+    if has_risks is not None:
+        q = q.filter(AnalysisUnit.has_risks.is_(bool(has_risks)))
+    if calls:
+        cond = [UnitCall.unit_pk == AnalysisUnit.id, UnitCall.target == calls]
+        if call_kind:
+            cond.append(UnitCall.kind == call_kind)
+        q = q.filter(exists().where(*cond))
+    offset, limit = _page(offset, limit)
+    total = q.count()
+    rows = q.order_by(SourceFile.path, AnalysisUnit.start_line).offset(offset).limit(limit).all()
+    return total, [{
+        "analysis_id": a.id,
+        "owner": r.owner,
+        "repo": r.name,
+        "sha": sf.sha,
+        "path": sf.path,
+        "language": u.language,
+        "unit_id": u.unit_id,
+        "name": u.name,
+        "kind": u.kind,
+        "range": {"start_line": u.start_line, "end_line": u.end_line},
+        "purpose": u.purpose,
+        "risk_count": u.risk_count,
+    } for u, a, sf, r in rows]
@@ -0,0 +1,158 @@
+from __future__ import annotations
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+from services.llm.tokens import count_tokens
+
+log = logging.getLogger(__name__)
+
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "12000"))
+CHUNK_OVERLAP_LINES = int(os.getenv("CHUNK_OVERLAP_LINES", "20"))
+CHUNK_MAX_CHUNKS = int(os.getenv("CHUNK_MAX_CHUNKS", "64"))
+
+# Linhas onde uma unidade pode começar (funções/classes/parágrafos), por linguagem.
+_JVM_LIKE = re.compile(
+    r"^\s*(?!(?:return|new|else|throw|if|while|for|switch|case|catch)\b)"
+    r"(?:(?:public|private|protected|internal|static|final|abstract|override|"
+    r"virtual|async|sealed|open|suspend)\s+)*(?:class|interface|enum|record|struct|fun|void|[\w<>\[\],.?]+)\s+\w+\s*[({<:]"
+)
+BOUNDARIES: Dict[str, re.Pattern] = {
+    "python": re.compile(r"^(?:@|(?:async\s+)?def\s|class\s)"),
+    "javascript": re.compile(r"^\s*(?:export\s+(?:default\s+)?)?(?:async\s+)?(?:function\b|class\b|(?:const|let|var)\s+\w+\s*=\s*(?:async\s*)?(?:function\b|\())"),
+    "typescript": re.compile(r"^\s*(?:export\s+(?:default\s+)?)?(?:abstract\s+)?(?:async\s+)?(?:function\b|class\b|interface\b|(?:const|let|var)\s+\w+\s*=\s*(?:async\s*)?(?:function\b|\())"),
+    "java": _JVM_LIKE,
+    "csharp": _JVM_LIKE,
+    "kotlin": _JVM_LIKE,
+    "go": re.compile(r"^(?:func|type)\s"),
+    "ruby": re.compile(r"^\s*(?:def|class|module)\s"),
+    "php": re.compile(r"^\s*(?:(?:public|private|protected|static|abstract|final)\s+)*(?:function|class)\s"),
+    "shell": re.compile(r"^\s*(?:function\s+[\w-]+|[\w-]+\s*\(\)\s*\{?)"),
+    # parágrafo/section na área A (colunas 8-11 no formato fixo)
+    "cobol": re.compile(r"^(?:.{6}[ ])?[ ]{0,3}[A-Za-z0-9][A-Za-z0-9-]*(?:\s+SECTION)?\s*\.\s*$", re.IGNORECASE),
+}
+
+@dataclass
+class Chunk:
+    text: str
+    start_line: int  # linha (1-based, no arquivo) da primeira linha do trecho
+    end_line: int    # linha (1-based, no arquivo) da última linha do trecho
+    own_start: int   # primeira linha que "pertence" ao trecho (após a sobreposição)
+
+def boundary_lines(lines: Sequence[str], language: str) -> List[int]:
+    """Índices (0-based) das linhas onde começa uma unidade; sempre inclui 0."""
+    pat = BOUNDARIES.get((language or "").lower())
+    out = [0]
+    if pat is None:
+        return out
+    for i, ln in enumerate(lines):
+        if i and pat.match(ln):
+            # decorators/anotações consecutivos pertencem à mesma unidade
+            if out and out[-1] == i - 1 and lines[i - 1].lstrip().startswith("@"):
+                continue
+            out.append(i)
+    return out
+
+def split_into_chunks(code: str, language: str, max_chars: int = CHUNK_MAX_CHARS,
+                      overlap_lines: int = CHUNK_OVERLAP_LINES, max_chunks: int = CHUNK_MAX_CHUNKS,
+                      max_tokens: int | None = None) -> List[Chunk]:
+    """
+    Divide o arquivo em trechos de até ~max_chars (ou ~max_tokens, se dado),
+    cortando em fronteiras de unidade. Uma unidade maior que o limite é quebrada
+    por linhas. Cada trecho (exceto o primeiro) repete as 'overlap_lines' linhas
+    anteriores como contexto. Acima de max_chunks trechos, o final do arquivo
+    fica de fora (ver unanalyzed_tail).
+    """
+    size_of, limit = (count_tokens, max_tokens) if max_tokens else (len, max_chars)
+    if size_of(code) <= limit:
+        return [Chunk(code, 1, max(1, code.count("\n") + 1), 1)]
+
+    lines = code.splitlines(keepends=True)
+    bounds = boundary_lines(lines, language) + [len(lines)]
+
+    # segmentos [a, b) entre fronteiras, quebrando os grandes demais
+    segments: List[Tuple[int, int, int]] = []  # (início, fim, tamanho)
+    for a, b in zip(bounds, bounds[1:]):
+        start, size = a, 0
+        for i in range(a, b):
+            n = size_of(lines[i])
+            if size and size + n > limit:
+                segments.append((start, i, size))
+                start, size = i, 0
+            size += n
+        if b > start:
+            segments.append((start, b, size))
+
+    # empacota segmentos consecutivos até o limite
+    groups: List[Tuple[int, int]] = []
+    cur_a, cur_b, cur_size = segments[0][0], segments[0][1], segments[0][2]
+    for a, b, size in segments[1:]:
+        if cur_size + size > limit:
+            groups.append((cur_a, cur_b))
+            cur_a, cur_size = a, 0
+        cur_b = b
+        cur_size += size
+    groups.append((cur_a, cur_b))
+
+    if len(groups) > max_chunks:
+        log.warning("arquivo com %d trechos (limite %d): linhas %d-%d não serão analisadas",
+                    len(groups), max_chunks, groups[max_chunks][0] + 1, len(lines))
+    chunks = []
+    for a, b in groups[:max_chunks]:
+        ctx = max(0, a - overlap_lines) if chunks else a
+        chunks.append(Chunk("".join(lines[ctx:b]), ctx + 1, b, a + 1))
+    return chunks
+
+def unanalyzed_tail(chunks: List[Chunk], code: str) -> Tuple[int, int] | None:
+    """(primeira, última) linha que ficou fora dos trechos por causa de max_chunks, ou None."""
+    total = len((code or "").splitlines())
+    if not chunks or chunks[-1].end_line >= total:
+        return None
+    return chunks[-1].end_line + 1, total
+
+def remap_units(units: List[dict], chunk: Chunk) -> List[dict]:
+    """Converte 'range' relativo ao trecho (linha 1 = início do trecho) para linhas do arquivo."""
+    offset = chunk.start_line - 1
+    for u in units:
+        rng = u.get("range") or {}
+        sl = min(chunk.end_line, max(chunk.start_line, int(rng.get("start_line") or 1) + offset))
+        el = min(chunk.end_line, max(sl, int(rng.get("end_line") or 1) + offset))
+        u["range"] = {"start_line": sl, "end_line": el}
+    return units
+
+def _overlaps(a: dict, b: dict) -> bool:
+    ra, rb = a["range"], b["range"]
+    return ra["start_line"] <= rb["end_line"] and rb["start_line"] <= ra["end_line"]
+
+def merge_chunk_units(per_chunk: List[List[dict]]) -> List[dict]:
+    """
+    Junta as unidades de todos os trechos (já remapeadas). Duplicatas vindas da
+    sobreposição — mesmo nome e ranges que se cruzam — viram uma só: fica a mais
+    detalhada, com o range unido. IDs repetidos entre unidades distintas ganham sufixo.
+    """
+    merged: List[dict] = []
+    for units in per_chunk:
+        for u in units:
+            name = str(u.get("name") or "").lower()
+            dup = next((m for m in merged if str(m.get("name") or "").lower() == name and _overlaps(m, u)), None)
+            if dup is None:
+                merged.append(u)
+                continue
+            rng = {"start_line": min(dup["range"]["start_line"], u["range"]["start_line"]),
+                   "end_line": max(dup["range"]["end_line"], u["range"]["end_line"])}
+            if len((u.get("logic") or {}).get("steps") or []) > len((dup.get("logic") or {}).get("steps") or []):
+                merged[merged.index(dup)] = u
+                dup = u
+            dup["range"] = rng
+
+    merged.sort(key=lambda u: (u["range"]["start_line"], u["range"]["end_line"]))
+    seen: Dict[str, int] = {}
+    for u in merged:
+        uid = str(u.get("id") or "u")
+        if uid in seen:
+            seen[uid] += 1
+            u["id"] = f"{uid[:60]}_{seen[uid]}"
+        else:
+            seen[uid] = 1
+    return merged
@@ -0,0 +1,31 @@
+from __future__ import annotations
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Extratores locais de unidades por linguagem: recebem o código e devolvem
+# unidades no formato do schema genérico (ranges, assinatura e chamadas exatos),
+# ou None quando não conseguem (ex.: erro de sintaxe) — aí o LLM lê o arquivo todo.
+Extractor = Callable[[str], Optional[List[dict]]]
+
+_EXTRACTORS: Dict[str, Tuple[Extractor, str]] = {}
+
+def register_extractor(language: str, version: str = "1"):
+    """Decorator: registra o extrator da linguagem (a versão entra na chave do cache)."""
+    def deco(fn: Extractor) -> Extractor:
+        _EXTRACTORS[language.lower()] = (fn, version)
+        return fn
+    return deco
+
+def get_extractor(language: str | None) -> Optional[Extractor]:
+    item = _EXTRACTORS.get((language or "").lower())
+    return item[0] if item else None
+
+def extractor_version(language: str | None) -> Optional[str]:
+    item = _EXTRACTORS.get((language or "").lower())
+    return item[1] if item else None
+
+def extract_units(code: str, language: str | None) -> Optional[List[dict]]:
+    fn = get_extractor(language)
+    return fn(code or "") if fn else None
+
+# registra os extratores embutidos
+from services.analyzer.extractors import python_ast  # noqa: E402,F401
@@ -0,0 +1,215 @@
+from __future__ import annotations
+import ast
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from services.analyzer.extractors import register_extractor
+
+# Unidades de Python a partir do AST da stdlib: funções e métodos com range,
+# assinatura e chamadas exatos. A lógica (steps/decisions) é um esqueleto
+# dos comandos do corpo; o LLM pode reescrevê-la depois (enrich_units_llm).
+
+MAX_CALLS = 30
+MAX_STEPS = 30
+MAX_DECISIONS = 15
+
+_API_ROOTS = {"requests", "httpx", "urllib", "aiohttp", "session"}
+_API_METHODS = {"get", "post", "put", "patch", "delete", "head", "request", "urlopen"}
+_DB_METHODS = {"execute", "executemany", "commit", "rollback", "query", "add", "add_all", "flush",
+               "fetchone", "fetchall", "fetchmany", "merge", "bulk_save_objects"}
+_QUEUE_METHODS = {"publish", "send_message", "basic_publish", "enqueue", "put_nowait"}
+_IO_CALLS = {"open", "print", "input"}
+
+def _unparse(node: ast.AST | None, limit: int = 200) -> Optional[str]:
+    if node is None:
+        return None
+    try:
+        return ast.unparse(node)[:limit]
+    except Exception:
+        return None
+
+def _default(node: ast.AST) -> Any:
+    if isinstance(node, ast.Constant) and isinstance(node.value, (str, int, float, bool, type(None))):
+        return node.value
+    return _unparse(node)
+
+def _signature(fn: ast.FunctionDef | ast.AsyncFunctionDef, is_method: bool) -> Dict[str, Any]:
+    a = fn.args
+    positional = a.posonlyargs + a.args
+    defaults = [None] * (len(positional) - len(a.defaults)) + list(a.defaults)
+    decorators = {_unparse(d) for d in fn.decorator_list}
+    skip_first = is_method and "staticmethod" not in decorators
+
+    params: List[Dict[str, Any]] = []
+    for i, (arg, dflt) in enumerate(zip(positional, defaults)):
+        if i == 0 and skip_first:
+            continue
+        params.append(_param(arg, dflt))
+    if a.vararg:
+        params.append(_param(a.vararg, None, "*"))
+    for arg, dflt in zip(a.kwonlyargs, a.kw_defaults):
+        params.append(_param(arg, dflt))
+    if a.kwarg:
+        params.append(_param(a.kwarg, None, "**"))
+    return {"parameters": params, "returns": _unparse(fn.returns)}
+
+def _param(arg: ast.arg, dflt: ast.AST | None, prefix: str = "") -> Dict[str, Any]:
+    p: Dict[str, Any] = {"name": prefix + arg.arg}
+    if arg.annotation is not None:
+        p["type"] = _unparse(arg.annotation)
+    if dflt is not None:
+        p["default"] = _default(dflt)
+    return p
+
+def _call_kind(func: ast.AST) -> str:
+    if isinstance(func, ast.Attribute):
+        root = func
+        while isinstance(root, ast.Attribute):
+            root = root.value
+        root_name = root.id if isinstance(root, ast.Name) else ""
+        if func.attr in _API_METHODS and root_name in _API_ROOTS:
+            return "api"
+        if func.attr in _DB_METHODS:
+            return "db"
+        if func.attr in _QUEUE_METHODS:
+            return "queue"
+        return "method"
+    return "function"
+
+def _calls(fn: ast.AST) -> List[Dict[str, Any]]:
+    out, seen = [], set()
+    for node in ast.walk(fn):
+        if isinstance(node, ast.Call):
+            target = _unparse(node.func)
+            if not target or target in seen:
+                continue
+            seen.add(target)
+            out.append({"target": target, "kind": _call_kind(node.func)})
+            if len(out) >= MAX_CALLS:
+                break
+    return out
+
+def _step_kind(stmt: ast.stmt) -> str:
+    if isinstance(stmt, (ast.Return, ast.Raise)):
+        return "return"
+    if isinstance(stmt, (ast.For, ast.AsyncFor, ast.While)):
+        return "loop"
+    if isinstance(stmt, (ast.Assign, ast.AnnAssign)):
+        return "assign"
+    if isinstance(stmt, ast.AugAssign):
+        return "calc"
+    if isinstance(stmt, ast.Try) or type(stmt).__name__ == "TryStar":
+        return "try"
+    if isinstance(stmt, (ast.With, ast.AsyncWith)):
+        return "io"
+    if isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call) and \
+            isinstance(stmt.value.func, ast.Name) and stmt.value.func.id in _IO_CALLS:
+        return "io"
+    return "action"
+
+def _step_text(stmt: ast.stmt) -> str:
+    if isinstance(stmt, ast.If):
+        return "se " + (_unparse(stmt.test, 56) or "")
+    if isinstance(stmt, (ast.For, ast.AsyncFor)):
+        return f"para {_unparse(stmt.target, 20)} em {_unparse(stmt.iter, 36)}"
+    if isinstance(stmt, ast.While):
+        return "enquanto " + (_unparse(stmt.test, 50) or "")
+    if isinstance(stmt, ast.Try):
+        return "bloco try"
+    if isinstance(stmt, (ast.With, ast.AsyncWith)):
+        return "with " + ", ".join(_unparse(i.context_expr, 40) or "" for i in stmt.items)[:55]
+    text = (_unparse(stmt, 400) or type(stmt).__name__).splitlines()[0]
+    return text[:60]
+
+def _logic(fn: ast.FunctionDef | ast.AsyncFunctionDef) -> Dict[str, Any]:
+    body = list(fn.body)
+    if body and isinstance(body[0], ast.Expr) and isinstance(getattr(body[0], "value", None), ast.Constant) \
+            and isinstance(body[0].value.value, str):
+        body = body[1:]  # docstring
+
+    steps: List[Dict[str, Any]] = []
+    decisions: List[Dict[str, Any]] = []
+    for stmt in body[:MAX_STEPS]:
+        sid = f"s{len(steps) + 1}"
+        steps.append({"id": sid, "text": _step_text(stmt), "kind": _step_kind(stmt)})
+        if isinstance(stmt, ast.If) and len(decisions) < MAX_DECISIONS:
+            decisions.append({"id": f"d{len(decisions) + 1}",
+                              "condition": _unparse(stmt.test, 300) or "",
+                              "true_path": [sid]})
+    return {"steps": steps, "decisions": decisions, "calls": _calls(fn)}
+
+def _io(sig: Dict[str, Any], calls: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    side = [f"{c['kind']}: {c['target']}" for c in calls if c["kind"] in ("api", "db", "queue")]
+    return {
+        "inputs": [p["name"] + (f": {p['type']}" if p.get("type") else "") for p in sig["parameters"]],
+        "outputs": [sig["returns"]] if sig.get("returns") else [],
+        "side_effects": side,
+    }
+
+def _iter_functions(body: List[ast.stmt], prefix: str = "", in_class: bool = False
+                    ) -> Iterator[Tuple[str, ast.FunctionDef | ast.AsyncFunctionDef, bool]]:
+    """Funções de módulo e métodos (inclusive de classes aninhadas); funções internas ficam no pai."""
+    for node in body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            yield prefix + node.name, node, in_class
+        elif isinstance(node, ast.ClassDef):
+            yield from _iter_functions(node.body, f"{prefix}{node.name}.", True)
+
+def _unit_id(qualname: str) -> str:
+    return ("u_" + re.sub(r"[^A-Za-z0-9_.:-]", "_", qualname))[:64]
+
+@register_extractor("python", version="1")
+def extract_python_units(code: str) -> Optional[List[dict]]:
+    try:
+        tree = ast.parse(code or "")
+    except (SyntaxError, ValueError):
+        return None
+
+    units: List[dict] = []
+    seen: Dict[str, int] = {}
+    for qualname, fn, is_method in _iter_functions(tree.body):
+        start = min([fn.lineno] + [d.lineno for d in fn.decorator_list])
+        sig = _signature(fn, is_method)
+        logic = _logic(fn)
+        doc = (ast.get_docstring(fn) or "").strip()
+        kind = "Método" if is_method else "Função"
+
+        uid = _unit_id(qualname)
+        if uid in seen:  # redefinições (ex.: @property + setter)
+            seen[uid] += 1
+            uid = f"{uid[:60]}_{seen[uid]}"
+        else:
+            seen[uid] = 1
+
+        units.append({
+            "kind": "generic",
+            "id": uid,
+            "name": qualname,
+            "range": {"start_line": start, "end_line": fn.end_lineno or fn.lineno},
+            "signature": sig,
+            "purpose": (doc.split("\n\n")[0][:4000] if doc else f"{kind} {qualname}."),
+            "io": _io(sig, logic["calls"]),
+            "logic": logic,
+            "risks": [],
+            "diagram_suggestion": "flowchart",
+        })
+
+    if not units:
+        # só código de módulo (script): uma unidade cobrindo o arquivo
+        lines = max(1, len((code or "").splitlines()))
+        module = ast.FunctionDef(name="module", args=ast.arguments(posonlyargs=[], args=[], kwonlyargs=[],
+                                 kw_defaults=[], defaults=[]), body=tree.body or [ast.Pass()], decorator_list=[])
+        doc = (ast.get_docstring(tree) or "").strip()
+        logic = _logic(module)
+        units.append({
+            "kind": "generic",
+            "id": "u_module",
+            "name": "module",
+            "range": {"start_line": 1, "end_line": lines},
+            "signature": {"parameters": [], "returns": None},
+            "purpose": doc.split("\n\n")[0][:4000] if doc else "Código de nível de módulo (script).",
+            "io": _io({"parameters": [], "returns": None}, logic["calls"]),
+            "logic": logic,
+            "risks": [],
+            "diagram_suggestion": "flowchart",
+        })
+    return units
@@ -0,0 +1,116 @@
+from __future__ import annotations
+import re
+from typing import List, Optional, Sequence, Tuple
+from services.analyzer.chunking import Chunk, merge_chunk_units, remap_units
+from services.analyzer.extractors import extract_units
+from services.analyzer.router import analyze_units, llm_enabled
+from services.analyzer.specialists.generic_llm import analyze_units_generic_llm, enrich_units_llm
+
+# Reanálise incremental de um arquivo modificado: só as unidades cujas linhas
+# cruzam os hunks do diff voltam ao LLM; as demais são reaproveitadas da
+# análise do blob anterior, com os ranges deslocados.
+
+Hunk = Tuple[int, int, int, int]  # (início antigo, qtd antiga, início novo, qtd nova)
+
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@", re.MULTILINE)
+
+def parse_hunks(patch: str | None) -> List[Hunk]:
+    """Cabeçalhos '@@ -a,b +c,d @@' de um diff unificado (campo 'patch' do compare)."""
+    out = []
+    for m in _HUNK_RE.finditer(patch or ""):
+        a, b, c, d = m.groups()
+        out.append((int(a), int(b) if b is not None else 1, int(c), int(d) if d is not None else 1))
+    return out
+
+def changed_ranges(hunks: Sequence[Hunk]) -> List[Tuple[int, int]]:
+    """Linhas do arquivo novo tocadas pelos hunks (remoção pura marca as duas linhas vizinhas)."""
+    return [(c, c + d - 1) if d else (max(c, 1), c + 1) for _, _, c, d in hunks]
+
+def _old_touched(hunks: Sequence[Hunk], start: int, end: int) -> bool:
+    for a, b, _, _ in hunks:
+        if b == 0:
+            # inserção logo após a linha 'a' antiga: afeta a unidade se cair dentro dela
+            if start <= a < end:
+                return True
+        elif a <= end and start <= a + b - 1:
+            return True
+    return False
+
+def map_line(old: int, hunks: Sequence[Hunk]) -> int:
+    """Linha antiga -> linha nova (linhas dentro de um trecho alterado vão para a borda do hunk)."""
+    delta = 0
+    for a, b, c, d in hunks:
+        old_end = a + b - 1
+        if old < a or (b == 0 and old <= a):
+            break
+        if old <= old_end:
+            return c + min(old - a, max(d - 1, 0))
+        # primeira linha depois do hunk, no antigo e no novo (b/d == 0: hunk "após a linha a/c")
+        delta = (c + d if d else c + 1) - (a + b if b else a + 1)
+    return max(1, old + delta)
+
+def _intersects(rng: dict, ranges: Sequence[Tuple[int, int]]) -> bool:
+    return any(rng["start_line"] <= e and s <= rng["end_line"] for s, e in ranges)
+
+def _merge_intervals(items: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    out: List[Tuple[int, int]] = []
+    for s, e in sorted(items):
+        if out and s <= out[-1][1] + 1:
+            out[-1] = (out[-1][0], max(out[-1][1], e))
+        else:
+            out.append((s, e))
+    return out
+
+def reanalyze_units(code: str, language: str, path: str, base_units: Optional[List[dict]],
+                    hunks: Sequence[Hunk]) -> Tuple[List[dict], int]:
+    """
+    Unidades do arquivo novo a partir das do blob anterior + hunks.
+    Retorna (unidades, quantas foram reaproveitadas). Sem base ou sem hunks
+    (diff grande demais para o GitHub mandar o patch), analisa o arquivo inteiro.
+    """
+    lang = (language or "unknown").lower()
+    if lang == "cobol" or not llm_enabled():
+        # parser/extrator locais são baratos: refaz tudo
+        return analyze_units(code, lang, path), 0
+    if not base_units or not hunks:
+        return analyze_units(code, lang, path), 0
+
+    changed = changed_ranges(hunks)
+    by_name = {u.get("name"): u for u in base_units}
+
+    head_units = extract_units(code, lang)
+    if head_units is not None:
+        # ranges exatos do extrator; o LLM só descreve as unidades tocadas
+        keep, dirty = [], []
+        for u in head_units:
+            old = by_name.get(u["name"])
+            if old is None or _intersects(u["range"], changed):
+                dirty.append(u)
+                continue
+            keep.append({**u, "purpose": old.get("purpose") or u["purpose"],
+                         "logic": {**(old.get("logic") or {}), "calls": u["logic"]["calls"]},
+                         "risks": old.get("risks") or []})
+        units = keep + enrich_units_llm(dirty, code, lang, path)
+        units.sort(key=lambda x: (x["range"]["start_line"], x["range"]["end_line"]))
+        return units, len(keep)
+
+    # sem extrator: desloca as unidades intactas e reanalisa só as regiões alteradas
+    keep, regions = [], list(changed)
+    for u in base_units:
+        rng = u["range"]
+        new_rng = {"start_line": map_line(rng["start_line"], hunks),
+                   "end_line": max(map_line(rng["start_line"], hunks), map_line(rng["end_line"], hunks))}
+        if _old_touched(hunks, rng["start_line"], rng["end_line"]):
+            regions.append((new_rng["start_line"], new_rng["end_line"]))
+        else:
+            keep.append({**u, "range": new_rng})
+
+    lines = code.splitlines(keepends=True)
+    fresh: List[List[dict]] = []
+    for s, e in _merge_intervals(regions):
+        s, e = max(1, s), min(len(lines), e)
+        if s > e:
+            continue
+        region = Chunk("".join(lines[s - 1:e]), s, e, s)
+        fresh.append(remap_units(analyze_units_generic_llm(region.text, lang, path), region))
+    return merge_chunk_units([keep] + fresh), len(keep)
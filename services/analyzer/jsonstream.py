@@ -0,0 +1,59 @@
+from __future__ import annotations
+import json
+from typing import Any, List
+
+class JsonArrayStream:
+    """
+    Parser incremental de um array JSON de objetos vindo em pedaços (streaming do LLM).
+    feed(texto) devolve os objetos do array que ficaram completos com esse pedaço.
+    Ignora o que vier antes do primeiro '[' ou '{' (ex.: cercas ```json). Se a saída
+    for um único objeto em vez de um array, ele é devolvido quando fechar.
+    """
+    def __init__(self):
+        self._buf: List[str] = []  # texto do elemento atual
+        self._depth = 0            # profundidade dentro do elemento atual
+        self._in_array = False
+        self._in_string = False
+        self._escape = False
+        self.done = False
+
+    def feed(self, text: str) -> List[Any]:
+        out: List[Any] = []
+        for ch in text:
+            if self.done:
+                break
+            if self._depth == 0:
+                # fora de qualquer elemento: procura início do array/objeto
+                if ch == "[" and not self._in_array:
+                    self._in_array = True
+                elif ch == "{":
+                    self._depth = 1
+                    self._buf = [ch]
+                elif ch == "]" and self._in_array:
+                    self.done = True
+                continue
+
+            self._buf.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        out.append(json.loads("".join(self._buf)))
+                    except ValueError:
+                        pass  # elemento malformado: descarta e segue
+                    self._buf = []
+                    if not self._in_array:
+                        self.done = True
+        return out
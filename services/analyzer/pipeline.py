@@ -0,0 +1,142 @@
+from __future__ import annotations
+import logging
+from typing import Any, Iterator, Literal, Tuple
+from services.analyzer.router import (
+    Detection, detect_language, analyze_units, analyzer_identity, is_fallback_units, stream_units,
+)
+from services.analyzer.chunking import merge_chunk_units
+from services.analysis_cache import make_cache_key, get_cached_units, put_cached_units
+from services.db import session_scope
+from services.singleflight import SINGLE_FLIGHT
+
+log = logging.getLogger(__name__)
+
+Mode = Literal["per_unit", "whole_file"]
+
+def normalize_mode(mode: str | None) -> Mode:
+    return "whole_file" if mode == "whole_file" else "per_unit"
+
+def cache_key_for(blob_sha: str | None, language: str, mode: Mode) -> Tuple[str | None, str, str]:
+    """(chave, modelo, versão) do cache de análises; chave None se não houver blob sha."""
+    model, version = analyzer_identity(language)
+    key = make_cache_key(blob_sha, language, mode, model, version) if blob_sha else None
+    return key, model, version
+
+def build_analysis(*, owner: str, repo: str, ref: str, path: str, blob_sha: str | None,
+                   size: int | None, det: Detection, units: list[dict]) -> dict:
+    """Monta o envelope compatível com analysis.schema.json."""
+    return {
+        "version": "1.0.0",
+        "file": {
+            "path": path,
+            "sha": blob_sha or "unknown",
+            "repo": repo,
+            "owner": owner,
+            "size_bytes": size or 0
+        },
+        "ref": ref,
+        "language": det.language,
+        "detector": {
+            "method": det.method,
+            "confidence": det.confidence
+        },
+        "units": units,
+        "summary": {
+            "unit_count": len(units),
+            "diagram_suggestion": "flowchart",
+            "notes": "Resultado mock do router; LangChain será plugado aqui."
+        }
+    }
+
+def store_units(key: str | None, *, blob_sha: str | None, language: str, mode: Mode,
+                model: str, version: str, units: list[dict]):
+    """
+    Grava no cache pelo escritor único, exceto unidades de contingência (falha do
+    LLM). Espera o commit: seguidores do single-flight em outros processos leem o
+    resultado assim que o lease é liberado. Falha ao gravar não derruba a análise.
+    """
+    if not key or is_fallback_units(units):
+        return
+    try:
+        put_cached_units(key, blob_sha=blob_sha, language=language, mode=mode,
+                         model=model, version=version, units=units)
+    except Exception as e:
+        log.warning("Falha ao gravar no cache de análises (%s): %s", key[:12], e)
+
+def lookup_cached_units(key: str) -> list[dict] | None:
+    """Leitura do cache numa sessão própria (seguidores do single-flight, workers sem sessão)."""
+    with session_scope() as db:
+        return get_cached_units(db, key)
+
+def analyze_file_view(db, *, owner: str, repo: str, ref: str, path: str, fv: dict,
+                      mode: str | None) -> Tuple[dict, str]:
+    """
+    Analisa um arquivo já baixado (saída de GitHubClient.get_file_content).
+    Retorna (analysis, "hit" | "miss" | "shared") conforme o cache de análises;
+    "shared": outra requisição (ou processo) analisava o mesmo blob e o
+    resultado dela foi reaproveitado (single-flight por chave do cache).
+    """
+    code = fv.get("text") or ""
+    det = detect_language(path, code)
+    analysis_mode = normalize_mode(mode)
+
+    # Cache endereçado por conteúdo: mesmo blob sha => mesmo resultado em qualquer ref
+    blob_sha = fv.get("sha")
+    key, model, version = cache_key_for(blob_sha, det.language, analysis_mode)
+    units = get_cached_units(db, key) if key else None
+    cache_status = "hit" if units is not None else "miss"
+    if units is None:
+        with SINGLE_FLIGHT.flight(key, lambda: lookup_cached_units(key)) as flight:
+            if flight.result is not None:
+                units, cache_status = flight.result, "shared"
+            else:
+                units = analyze_units(code, det.language, path, mode=analysis_mode)
+                store_units(key, blob_sha=blob_sha, language=det.language, mode=analysis_mode,
+                            model=model, version=version, units=units)
+                flight.set(units)
+
+    analysis = build_analysis(owner=owner, repo=repo, ref=ref, path=path, blob_sha=blob_sha,
+                              size=fv.get("size"), det=det, units=units)
+    return analysis, cache_status
+
+def stream_file_view(db, *, owner: str, repo: str, ref: str, path: str, fv: dict,
+                     mode: str | None) -> Iterator[Tuple[str, Any]]:
+    """
+    Versão incremental de analyze_file_view. Gera eventos (nome, dados):
+      ("meta", {...})       linguagem, detector e status do cache
+      ("unit", unit)        cada unidade assim que fica pronta
+      ("analysis", dict)    envelope final (unidades unidas e ordenadas; já no cache)
+    """
+    code = fv.get("text") or ""
+    det = detect_language(path, code)
+    analysis_mode = normalize_mode(mode)
+
+    blob_sha = fv.get("sha")
+    key, model, version = cache_key_for(blob_sha, det.language, analysis_mode)
+    cached = get_cached_units(db, key) if key else None
+    yield "meta", {"path": path, "language": det.language, "cache": "hit" if cached is not None else "miss",
+                   "detector": {"method": det.method, "confidence": det.confidence}}
+
+    if cached is not None:
+        units = cached
+        for u in units:
+            yield "unit", u
+    else:
+        # mesma chave em andamento noutra requisição: espera e repete as unidades dela
+        with SINGLE_FLIGHT.flight(key, lambda: lookup_cached_units(key)) as flight:
+            if flight.result is not None:
+                units = flight.result
+                for u in units:
+                    yield "unit", u
+            else:
+                streamed = []
+                for u in stream_units(code, det.language, path, mode=analysis_mode):
+                    streamed.append(u)
+                    yield "unit", u
+                units = merge_chunk_units([streamed])
+                store_units(key, blob_sha=blob_sha, language=det.language, mode=analysis_mode,
+                            model=model, version=version, units=units)
+                flight.set(units)
+
+    yield "analysis", build_analysis(owner=owner, repo=repo, ref=ref, path=path, blob_sha=blob_sha,
+                                     size=fv.get("size"), det=det, units=units)
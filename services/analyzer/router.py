@@ -1,9 +1,13 @@
 from __future__ import annotations
-import re
 from dataclasses import dataclass
-from typing import Literal, Tuple
+from typing import Iterator, Literal, Tuple
 import os
-from services.analyzer.specialists.generic_llm import analyze_units_generic_llm
+from services.analyzer.specialists.generic_llm import (
+    analyze_units_generic_llm, enrich_units_llm, is_fallback_units, iter_enriched_units,
+    stream_units_generic_llm, PROMPT_VERSION, SCHEMA_DIGEST,
+)
+from services.analyzer.extractors import extract_units, extractor_version
+from services.analyzer.specialists.cobol_parser import parse_cobol_units, PARSER_VERSION as COBOL_PARSER_VERSION
 
 Language = Literal["cobol", "python", "javascript", "typescript", "java", "csharp", "go", "ruby", "php", "shell", "unknown"]
 
@@ -99,40 +103,24 @@ def analyze_units_generic(code: str, language: str) -> list[dict]:
     }]
 
 def analyze_units_cobol(code: str) -> list[dict]:
+    """COBOL é analisado pelo parser determinístico (parágrafos/sections reais, sem LLM)."""
+    units = parse_cobol_units(code)
+    if units:
+        return units
+    # sem PROCEDURE DIVISION (ex.: copybook): uma unidade cobrindo o arquivo
     start, end = _mk_range_from_content(code)
-    # extrai um possível parágrafo como nome (mock leve)
-    m = re.search(r"^\s*([A-Z0-9-]+)\.\s*$", code.upper(), re.MULTILINE)
-    unit_name = m.group(1) if m else "MAIN-PARAGRAPH"
     return [{
         "kind": "cobol",
-        "id": f"u-{unit_name}",
-        "name": unit_name,
+        "id": "u-SOURCE",
+        "name": "SOURCE",
         "range": {"start_line": start, "end_line": end},
-        "division": "PROCEDURE",
-        "purpose": "Parágrafo principal (mock): valida e processa registros.",
-        "io": {
-            "working_storage": [],
-            "files": [],
-            "inputs": [],
-            "outputs": [],
-            "side_effects": []
-        },
-        "control_flow": {
-            "perform": [],
-            "goto": [],
-            "call": []
-        },
-        "logic": {
-            "steps": [
-                {"id": "s1", "text": "Ler registros de entrada", "kind": "io"},
-                {"id": "s2", "text": "Validar campos", "kind": "other"},
-                {"id": "s3", "text": "Gravar saída", "kind": "io"},
-                {"id": "s4", "text": "EXIT", "kind": "exit"}
-            ],
-            "decisions": []
-        },
+        "division": "DATA",
+        "purpose": "Fonte sem PROCEDURE DIVISION (copybook ou definição de dados).",
+        "io": {"working_storage": [], "files": [], "inputs": [], "outputs": [], "side_effects": []},
+        "control_flow": {"perform": [], "goto": [], "call": []},
+        "logic": {"steps": [], "decisions": []},
         "diagram_suggestion": "flowchart",
-        "notes": ""
+        "notes": "Extraído pelo parser COBOL determinístico.",
     }]
 
 def analyze_units(code: str, language: str, mode: Literal["per_unit", "whole_file"] = "per_unit") -> list[dict]:
@@ -146,19 +134,62 @@ def analyze_units(code: str, language: str, mode: Literal["per_unit", "whole_fil
     # demais linguagens caem no genérico
     return analyze_units_generic(code or "", language=lang)
 
+def llm_enabled() -> bool:
+    return os.getenv("ANALYZE_WITH_LLM", "false").lower() in ("1","true","yes","on")
+
+def analyzer_identity(language: str | None = None) -> Tuple[str, str]:
+    """
+    (modelo, versão) que produzem as análises atuais. Usado na chave do cache:
+    trocar de modelo ou de prompt/schema invalida naturalmente as entradas antigas.
+    """
+    if (language or "").lower() == "cobol":
+        return "cobol-parser", f"c{COBOL_PARSER_VERSION}-s{SCHEMA_DIGEST}"
+    xv = extractor_version(language)
+    suffix = f"-x{xv}" if xv else ""
+    if llm_enabled():
+        return os.getenv("LLM_MODEL", "gpt-4o-mini"), f"p{PROMPT_VERSION}{suffix}-s{SCHEMA_DIGEST}"
+    if xv:
+        return "extractor", f"x{xv}-s{SCHEMA_DIGEST}"
+    return "mock", f"mock-s{SCHEMA_DIGEST}"
+
 def analyze_units(code: str, language: str, path: str, mode: Literal["per_unit", "whole_file"] = "per_unit") -> list[dict]:
     """
-    Se ANALYZE_WITH_LLM=true, usa o especialista genérico (todas as linguagens).
-    Caso contrário, mantém o mock atual.
+    COBOL vai sempre para o parser determinístico. Linguagens com extrator local
+    (ex.: Python/ast) têm as unidades extraídas aqui e, com ANALYZE_WITH_LLM=true,
+    o LLM só descreve cada trecho. As demais usam o especialista genérico
+    (arquivo inteiro) se ANALYZE_WITH_LLM=true; caso contrário, o mock.
     """
-    use_llm = os.getenv("ANALYZE_WITH_LLM", "false").lower() in ("1","true","yes","on")
     lang = (language or "unknown").lower()
+    if lang == "cobol":
+        return analyze_units_cobol(code or "")
+
+    units = extract_units(code or "", lang)
+    if units is not None:
+        return enrich_units_llm(units, code, lang, path) if llm_enabled() else units
 
-    if use_llm:
-        # para POC, use sempre o genérico (independente da linguagem)
+    if llm_enabled():
         return analyze_units_generic_llm(code, lang, path)
 
     # --- MOCK antigo (fallback) ---
-    if lang == "cobol":
-        return analyze_units_cobol(code or "")
     return analyze_units_generic(code or "", language=lang)
+
+def stream_units(code: str, language: str, path: str, mode: Literal["per_unit", "whole_file"] = "per_unit") -> Iterator[dict]:
+    """
+    Mesmo roteamento de analyze_units, entregando cada unidade assim que fica
+    pronta (ordem de conclusão, não de linha). Com LLM no caminho genérico, as
+    duplicatas da sobreposição entre trechos ainda não foram unidas.
+    """
+    lang = (language or "unknown").lower()
+    if lang == "cobol":
+        yield from analyze_units_cobol(code or "")
+        return
+
+    units = extract_units(code or "", lang)
+    if units is not None:
+        yield from (iter_enriched_units(units, code, lang, path) if llm_enabled() else units)
+        return
+
+    if llm_enabled():
+        yield from stream_units_generic_llm(code, lang, path)
+        return
+    yield from analyze_units_generic(code or "", language=lang)
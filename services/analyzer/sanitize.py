@@ -0,0 +1,319 @@
+from __future__ import annotations
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List
+from services.schemas import UNIT_GENERIC_SCHEMA
+
+# Normalizador de unidades genéricas (saída do LLM) em uma única passada.
+# O schema unit.generic.schema.json é compilado uma vez numa árvore de funções:
+# cada nó coage o valor para o seu tipo, trunca em maxLength, encaixa enum e ids
+# no pattern, descarta chaves fora de 'properties' e preenche 'required'. A tabela
+# RULES acrescenta o que o schema não diz: aliases que o LLM costuma usar,
+# defaults, limites mais curtos pedidos no prompt e o remapeamento dos ids de
+# steps usados em true_path/false_path. Como cada nó só devolve valores válidos
+# para o seu sub-schema (ou _DROP), o resultado já sai válido e não precisa de
+# uma segunda validação.
+
+_DROP = object()      # valor que não pôde ser coagido
+_MISSING = object()   # regra sem default
+
+@dataclass(frozen=True)
+class Rule:
+    aliases: tuple = ()                       # chaves alternativas no objeto pai
+    default: Any = _MISSING                   # valor bruto (ou fn(out, ctx)) quando ausente/inválido
+    max_length: int | None = None             # limite mais curto que o maxLength do schema
+    strip: bool = False
+    before: Callable[[Any, "_Ctx"], Any] | None = None           # pré-processa o valor bruto
+    after: Callable[[Dict[str, Any], Any, "_Ctx"], Any] | None = None  # objeto pronto, valor bruto
+
+class _Ctx:
+    """Estado de uma unidade: índice do item atual e ids de steps/decisions."""
+    __slots__ = ("index", "idmap", "step_ids", "decision_ids")
+
+    def __init__(self):
+        self.index = 0
+        self.idmap: Dict[str, str] = {}
+        self.step_ids: set[str] = set()
+        self.decision_ids: set[str] = set()
+
+def _to_str(v: Any) -> str:
+    if isinstance(v, str):
+        return v
+    if isinstance(v, (dict, list)):
+        return json.dumps(v, ensure_ascii=False)
+    return str(v)
+
+# ------------------ regras específicas ------------------
+
+def parse_signature(sig: str) -> Dict[str, Any]:
+    """'def f(a: int, b) -> str' -> {"parameters": [...], "returns": "str"} (bruto, antes do schema)."""
+    params = []
+    returns = None
+    mret = re.search(r"->\s*([a-zA-Z0-9_\[\],\.]+)", sig)
+    if mret:
+        returns = mret.group(1).strip()
+    m = re.search(r"\((.*)\)", sig)
+    if m:
+        for p in (p.strip() for p in m.group(1).split(",")):
+            if not p or p in ("self", "cls"):
+                continue
+            m2 = re.match(r"([a-zA-Z_][a-zA-Z0-9_]*)\s*:\s*([^=]+)", p)
+            params.append({"name": m2.group(1).strip(), "type": m2.group(2).strip()} if m2 else {"name": p})
+    return {"parameters": params, "returns": returns}
+
+def _signature(v, ctx):
+    return parse_signature(v) if isinstance(v, str) else v
+
+def _param(v, ctx):
+    return v if isinstance(v, dict) else {"name": _to_str(v)}
+
+def _io_item(v, ctx):
+    # o LLM às vezes descreve entradas/saídas como objetos: vira "nome tipo descrição"
+    if isinstance(v, dict):
+        parts = [v.get("name") or v.get("var") or v.get("field"), v.get("type"),
+                 v.get("description") or v.get("desc")]
+        return " ".join(str(p) for p in parts if p) or json.dumps(v, ensure_ascii=False)[:60]
+    return v
+
+def _step(v, ctx):
+    return {"text": v} if isinstance(v, str) else v
+
+def _decision(v, ctx):
+    return v if isinstance(v, dict) else {"condition": _to_str(v)}
+
+def _call(v, ctx):
+    return {"target": v} if isinstance(v, str) else v
+
+def _unique(nid: str, used: set[str]) -> str:
+    base, k = nid, 2
+    while nid in used:
+        sfx = f"_{k}"
+        nid = base[:32 - len(sfx)] + sfx  # corta a base, não o sufixo (ids já com 32 chars)
+        k += 1
+    used.add(nid)
+    return nid
+
+def _step_done(out, raw, ctx):
+    out["id"] = _unique(out["id"], ctx.step_ids)
+    raw_id = raw.get("id") if isinstance(raw, dict) else None
+    ctx.idmap[str(raw_id or f"s{ctx.index}")] = out["id"]
+    return out
+
+def _decision_done(out, raw, ctx):
+    out["id"] = _unique(out["id"], ctx.decision_ids)
+    return out
+
+def _path_id(v, ctx):
+    return ctx.idmap.get(_to_str(v), v)
+
+def _range_done(out, raw, ctx):
+    if out["end_line"] < out["start_line"]:
+        out["end_line"] = out["start_line"]
+    return out
+
+# Chave: caminho no schema ("logic.steps[]" = itens de logic.steps; "" = a unidade)
+RULES: Dict[str, Rule] = {
+    "id": Rule(default="u_main"),
+    "name": Rule(default=lambda out, ctx: out["id"]),
+    "range": Rule(default={}, after=_range_done),
+    "range.start_line": Rule(default=1),
+    "range.end_line": Rule(default=lambda out, ctx: out["start_line"]),
+    "signature": Rule(default={}, before=_signature),
+    "signature.parameters": Rule(default=[]),
+    "signature.parameters[]": Rule(before=_param),
+    "signature.parameters[].name": Rule(default="param"),
+    "signature.returns": Rule(default=None),
+    "purpose": Rule(strip=True, max_length=200,
+                    default=lambda out, ctx: f"Auto-gerada para {out.get('name') or 'unit'}"),
+    "io": Rule(default={}),
+    "io.inputs": Rule(default=[]),
+    "io.inputs[]": Rule(before=_io_item),
+    "io.outputs": Rule(default=[]),
+    "io.outputs[]": Rule(before=_io_item),
+    "io.side_effects": Rule(default=[]),
+    "io.side_effects[]": Rule(before=_io_item),
+    "logic": Rule(default={}),
+    "logic.steps": Rule(default=[]),
+    "logic.steps[]": Rule(before=_step, after=_step_done),
+    "logic.steps[].id": Rule(default=lambda out, ctx: f"s{ctx.index}"),
+    "logic.steps[].text": Rule(aliases=("label",), max_length=60, default=""),
+    "logic.steps[].kind": Rule(default="action"),
+    "logic.decisions": Rule(default=[]),
+    "logic.decisions[]": Rule(before=_decision, after=_decision_done),
+    "logic.decisions[].id": Rule(default=lambda out, ctx: f"d{ctx.index}"),
+    "logic.decisions[].condition": Rule(aliases=("text",), default=""),
+    "logic.decisions[].true_path": Rule(default=[]),
+    "logic.decisions[].true_path[]": Rule(before=_path_id),
+    "logic.decisions[].false_path": Rule(default=[]),
+    "logic.decisions[].false_path[]": Rule(before=_path_id),
+    "logic.calls": Rule(default=[]),
+    "logic.calls[]": Rule(before=_call),
+    "logic.calls[].kind": Rule(default="other"),
+    "risks": Rule(default=[]),
+}
+
+# ------------------ compilação do schema ------------------
+
+_NO_RULE = Rule()
+_ANNOTATIONS = {"$schema", "$id", "title", "description", "default", "examples", "$comment"}
+_SUPPORTED = {"type", "const", "enum", "pattern", "minLength", "maxLength", "minimum", "maximum",
+              "properties", "required", "additionalProperties", "items"}
+# patterns de id do schema: ^[classe]{1,N}$
+_ID_PATTERN = re.compile(r"^\^\[([^\]]+)\]\{(\d+),(\d+)\}\$$")
+
+Coercer = Callable[[Any, _Ctx], Any]
+
+def _pattern_fixer(pattern: str) -> Callable[[str], str]:
+    m = _ID_PATTERN.match(pattern)
+    if not m:
+        raise NotImplementedError(f"pattern {pattern}")
+    invalid = re.compile(f"[^{m.group(1)}]")
+    lo, hi = int(m.group(2)), int(m.group(3))
+    def fix(s: str) -> str:
+        s = invalid.sub("_", s)[:hi]
+        return s if len(s) >= lo else ""
+    return fix
+
+def _string(schema: Dict[str, Any], rule: Rule) -> Coercer:
+    enum = {str(e).lower(): e for e in schema.get("enum", ())}
+    limits = [n for n in (schema.get("maxLength"), rule.max_length) if n is not None]
+    max_len = min(limits) if limits else None
+    min_len = schema.get("minLength", 0)
+    fix = _pattern_fixer(schema["pattern"]) if "pattern" in schema else None
+    if fix:
+        min_len = max(min_len, 1)
+    strip = rule.strip
+    def coerce(v, ctx):
+        s = v if type(v) is str else _to_str(v)
+        if strip:
+            s = s.strip()
+        if enum:
+            return enum.get(s.strip().lower(), _DROP)
+        if fix:
+            s = fix(s)
+        if max_len is not None and len(s) > max_len:
+            s = s[:max_len]
+        return s if len(s) >= min_len else _DROP
+    return coerce
+
+def _integer(schema: Dict[str, Any], rule: Rule) -> Coercer:
+    lo, hi = schema.get("minimum"), schema.get("maximum")
+    def coerce(v, ctx):
+        if isinstance(v, bool):
+            return _DROP
+        try:
+            n = int(v)
+        except (TypeError, ValueError):
+            return _DROP
+        if lo is not None and n < lo:
+            n = lo
+        if hi is not None and n > hi:
+            n = hi
+        return n
+    return coerce
+
+_TYPE_CHECKS = {
+    "string": lambda v: isinstance(v, str),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+def _union(types: List[str]) -> Coercer:
+    checks = [_TYPE_CHECKS[t] for t in types]
+    as_string = "string" in types
+    def coerce(v, ctx):
+        if any(c(v) for c in checks):
+            return v
+        return _to_str(v) if as_string else _DROP
+    return coerce
+
+def _array(schema: Dict[str, Any], path: str) -> Coercer:
+    item = _build(schema.get("items", {}), path + "[]")
+    def coerce(v, ctx):
+        if not isinstance(v, list):
+            v = [v]
+        out, prev = [], ctx.index
+        for i, x in enumerate(v, start=1):
+            ctx.index = i
+            x = item(x, ctx)
+            if x is not _DROP:
+                out.append(x)
+        ctx.index = prev
+        return out
+    return coerce
+
+def _object(schema: Dict[str, Any], path: str, rule: Rule) -> Coercer:
+    if schema.get("additionalProperties", True) is not False:
+        raise NotImplementedError(f"{path or '<unidade>'}: additionalProperties")
+    required = set(schema.get("required", ()))
+    props = []
+    for key, sub in schema.get("properties", {}).items():
+        sub_path = f"{path}.{key}" if path else key
+        prule = RULES.get(sub_path, _NO_RULE)
+        props.append((key, _build(sub, sub_path), prule.aliases, prule.default, key in required, "const" in sub))
+    before, after = rule.before, rule.after
+    def coerce(v, ctx):
+        if before:
+            v = before(v, ctx)
+        if not isinstance(v, dict):
+            return _DROP
+        out: Dict[str, Any] = {}
+        for key, fn, aliases, default, req, const in props:
+            raw = v.get(key)
+            if aliases and raw in (None, ""):
+                for alias in aliases:
+                    raw = v.get(alias)
+                    if raw not in (None, ""):
+                        break
+            val = fn(raw, ctx) if raw is not None or const else _DROP
+            if val is _DROP and default is not _MISSING:
+                val = fn(default(out, ctx) if callable(default) else default, ctx)
+            if val is _DROP:
+                if req:
+                    return _DROP
+                continue
+            out[key] = val
+        return after(out, v, ctx) if after else out
+    return coerce
+
+def _build(schema: Dict[str, Any], path: str) -> Coercer:
+    unknown = set(schema) - _SUPPORTED - _ANNOTATIONS
+    if unknown:
+        raise NotImplementedError(f"{path or '<unidade>'}: {', '.join(sorted(unknown))}")
+    rule = RULES.get(path, _NO_RULE)
+    if "const" in schema:
+        const = schema["const"]
+        return lambda v, ctx: const
+    t = schema.get("type")
+    if isinstance(t, list):
+        fn = _union(t)
+    elif t == "object":
+        return _object(schema, path, rule)
+    elif t == "array":
+        fn = _array(schema, path)
+    elif t == "string":
+        fn = _string(schema, rule)
+    elif t == "integer":
+        fn = _integer(schema, rule)
+    else:
+        raise NotImplementedError(f"{path}: type {t}")
+    if rule.before is None:
+        return fn
+    before = rule.before
+    return lambda v, ctx: fn(before(v, ctx), ctx)
+
+_UNIT = _build(UNIT_GENERIC_SCHEMA, "")
+
+def sanitize_unit(unit: Any) -> Dict[str, Any] | None:
+    """Unidade bruta do LLM -> unidade válida no unit.generic.schema.json (None se não for objeto)."""
+    out = _UNIT(unit, _Ctx())
+    return None if out is _DROP else out
+
+def sanitize_units(units: Any) -> List[Dict[str, Any]]:
+    if isinstance(units, dict):
+        units = [units]
+    if not isinstance(units, list):
+        return []
+    return [u for u in map(sanitize_unit, units) if u is not None]
@@ -0,0 +1,433 @@
+from __future__ import annotations
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Parser estrutural determinístico de COBOL (sem LLM).
+# Lê linha a linha (formato fixo ou livre), encontra DIVISIONs, SECTIONs e
+# parágrafos com ranges exatos, e extrai PERFORM / GO TO / CALL, arquivos
+# (SELECT/FD + verbos de I/O) e itens da WORKING-STORAGE referenciados.
+
+# Incrementar ao mudar a saída do parser (entra na chave do cache de análises)
+PARSER_VERSION = "1"
+
+MAX_STEPS = 40
+MAX_DECISIONS = 20
+MAX_WS_REFS = 50
+
+_DIVISION_RE = re.compile(r"^(IDENTIFICATION|ID|ENVIRONMENT|DATA|PROCEDURE)\s+DIVISION\b")
+_SECTION_RE = re.compile(r"^([A-Z0-9][A-Z0-9-]*)\s+SECTION\s*(?:\d+\s*)?\.")
+_PARAGRAPH_RE = re.compile(r"^([A-Z0-9][A-Z0-9-]*)\s*\.(?:\s|$)")
+_DATA_ITEM_RE = re.compile(r"^(\d{1,2})\s+([A-Z0-9][A-Z0-9-]*)\b")
+_FD_RE = re.compile(r"^(?:FD|SD)\s+([A-Z0-9][A-Z0-9-]*)")
+_SELECT_RE = re.compile(r"\bSELECT\s+(?:OPTIONAL\s+)?([A-Z0-9][A-Z0-9-]*)")
+_TAIL_RE = re.compile(r"\s+(?:END-(?:IF|EVALUATE|PERFORM|READ|WRITE|REWRITE|DELETE|START|RETURN|CALL|COMPUTE|"
+                      r"ADD|SUBTRACT|MULTIPLY|DIVIDE|STRING|UNSTRING|SEARCH|ACCEPT|DISPLAY|EXEC)|WHEN|ELSE)(?![A-Z0-9-])")
+_EVALUATE_RE = re.compile(r"(?<![A-Z0-9-])EVALUATE(?![A-Z0-9-])(.*?)(?:END-EVALUATE|$)")
+_WORD_RE = re.compile(r"[A-Z0-9][A-Z0-9-]*")
+_LITERAL_RE = re.compile(r"'[^']*'|\"[^\"]*\"")
+
+# Palavras que, sozinhas com ponto, são comandos e não nomes de parágrafo (formato livre)
+_NOT_PARAGRAPH = {"EXIT", "GOBACK", "CONTINUE", "END-IF", "END-EVALUATE", "END-PERFORM", "END-READ",
+                  "END-CALL", "END-SEARCH", "END-COMPUTE", "END-STRING", "END-WRITE", "ELSE", "STOP"}
+
+_VERBS = ("ACCEPT", "ADD", "CALL", "CANCEL", "CLOSE", "COMPUTE", "CONTINUE", "DELETE", "DISPLAY",
+          "DIVIDE", "EVALUATE", "EXIT", "GO", "GOBACK", "IF", "INITIALIZE", "INSPECT", "MERGE",
+          "MOVE", "MULTIPLY", "OPEN", "PERFORM", "READ", "RELEASE", "RETURN", "REWRITE", "SEARCH",
+          "SET", "SORT", "START", "STOP", "STRING", "SUBTRACT", "UNSTRING", "WRITE", "EXEC")
+_VERB_RE = re.compile(r"(?<![A-Z0-9-])(" + "|".join(_VERBS) + r")(?![A-Z0-9-])")
+_STEP_KIND = {
+    "MOVE": "move", "INITIALIZE": "move", "SET": "move",
+    "COMPUTE": "compute", "ADD": "compute", "SUBTRACT": "compute", "MULTIPLY": "compute", "DIVIDE": "compute",
+    "READ": "io", "WRITE": "io", "REWRITE": "io", "DELETE": "io", "START": "io", "OPEN": "io", "CLOSE": "io",
+    "DISPLAY": "io", "ACCEPT": "io", "RELEASE": "io", "RETURN": "io", "EXEC": "io",
+    "PERFORM": "perform", "CALL": "call", "EVALUATE": "evaluate", "IF": "if",
+    "GO": "exit", "EXIT": "exit", "GOBACK": "exit", "STOP": "exit",
+}
+_RESERVED = set(_VERBS) | {
+    "TO", "FROM", "BY", "GIVING", "INTO", "UNTIL", "VARYING", "TIMES", "THRU", "THROUGH", "USING",
+    "REFERENCE", "CONTENT", "VALUE", "OMITTED", "RETURNING", "WHEN", "OTHER", "ALSO", "THEN", "ELSE",
+    "NOT", "AND", "OR", "END", "AT", "INVALID", "KEY", "RECORD", "INPUT", "OUTPUT", "I-O", "EXTEND",
+    "WITH", "TEST", "BEFORE", "AFTER", "ZERO", "ZEROS", "ZEROES", "SPACE", "SPACES", "TRUE", "FALSE",
+    "RUN", "UPON", "ON", "EXCEPTION", "OVERFLOW", "SIZE", "ERROR", "IS", "EQUAL", "GREATER", "LESS",
+    "THAN", "DEPENDING", "ROUNDED", "CORRESPONDING", "CORR", "ALL", "FILLER", "END-IF", "END-EVALUATE",
+    "END-PERFORM", "END-READ", "END-CALL", "END-WRITE", "END-COMPUTE", "HIGH-VALUES", "LOW-VALUES",
+}
+
+@dataclass
+class SourceLine:
+    number: int      # linha física (1-based) no arquivo
+    text: str        # conteúdo sem área de sequência/indicador/comentários, em maiúsculas
+    area_a: bool     # começa na área A (colunas 8-11 no formato fixo)
+
+@dataclass
+class CobolUnit:
+    name: str
+    division: str
+    section: Optional[str]
+    start_line: int
+    end_line: int
+    is_section: bool = False
+    lines: List[SourceLine] = field(default_factory=list)
+
+@dataclass
+class CobolProgram:
+    program_id: Optional[str]
+    free_format: bool
+    divisions: Dict[str, Tuple[int, int]]
+    units: List[CobolUnit]
+    files: List[str]                 # SELECT / FD
+    record_to_file: Dict[str, str]   # registro 01 sob FD -> arquivo
+    data_items: Dict[str, str]       # nome -> section (WORKING-STORAGE, LINKAGE, ...)
+    total_lines: int
+
+# ------------------ leitura de linhas ------------------
+
+def detect_free_format(lines: Iterable[str], sample: int = 200) -> bool:
+    """Formato livre se houver diretiva >>SOURCE FREE ou se as colunas 1-7 não seguirem o layout fixo."""
+    fixed = total = 0
+    for i, ln in enumerate(lines):
+        if i >= sample:
+            break
+        up = ln.upper()
+        if ">>SOURCE" in up and "FREE" in up:
+            return True
+        if not ln.strip():
+            continue
+        total += 1
+        seq, ind = ln[:6], ln[6:7]
+        if (seq.strip() == "" or seq.strip().isdigit() or len(ln) < 7) and ind in ("", " ", "*", "/", "-", "D", "d"):
+            fixed += 1
+    return total > 0 and fixed / total < 0.8
+
+def iter_source_lines(lines: Iterable[str], free_format: bool) -> Iterator[SourceLine]:
+    """
+    Gera as linhas de código (sem comentários) já normalizadas. Linhas de
+    continuação ('-' na coluna 7) são emendadas à anterior.
+    """
+    pending: Optional[SourceLine] = None
+    for number, raw in enumerate(lines, start=1):
+        raw = raw.rstrip("\r\n")
+        if free_format:
+            if raw.lstrip().startswith(">>"):
+                continue  # diretivas de compilação
+            text = raw.split("*>", 1)[0]
+            area_a = bool(text[:1].strip())
+            continuation = False
+        else:
+            indicator = raw[6:7]
+            if indicator in ("*", "/", "D", "d"):
+                continue
+            text = raw[7:72].split("*>", 1)[0]
+            area_a = bool(text[:4].strip())
+            continuation = indicator == "-"
+        if not text.strip():
+            continue
+        text = text.upper()
+
+        if continuation and pending is not None:
+            cont = text.strip()
+            if cont[:1] in ("'", '"'):
+                cont = cont[1:]
+                pending.text = pending.text.rstrip() + cont
+            else:
+                pending.text = pending.text.rstrip() + " " + cont
+            continue
+        if pending is not None:
+            yield pending
+        pending = SourceLine(number, text.strip(), area_a)
+    if pending is not None:
+        yield pending
+
+# ------------------ estrutura ------------------
+
+def parse_structure(code: str) -> CobolProgram:
+    """Uma passada pelo fonte: divisões, sections, parágrafos, arquivos e itens de dados."""
+    raw_lines = code.splitlines()
+    free = detect_free_format(raw_lines)
+
+    program_id = None
+    divisions: Dict[str, Tuple[int, int]] = {}
+    units: List[CobolUnit] = []
+    files: List[str] = []
+    record_to_file: Dict[str, str] = {}
+    data_items: Dict[str, str] = {}
+
+    division = None
+    data_section = None
+    proc_section = None
+    current_fd = None
+    current: Optional[CobolUnit] = None
+
+    for ln in iter_source_lines(raw_lines, free):
+        text = ln.text
+
+        m = _DIVISION_RE.match(text)
+        if m:
+            name = "IDENTIFICATION" if m.group(1) == "ID" else m.group(1)
+            if division:
+                divisions[division] = (divisions[division][0], ln.number - 1)
+            division = name
+            divisions[name] = (ln.number, ln.number)
+            data_section = proc_section = current_fd = None
+            if name == "PROCEDURE":
+                # comandos antes do primeiro parágrafo formam uma unidade implícita
+                current = CobolUnit("PROCEDURE-DIVISION", "PROCEDURE", None, ln.number, ln.number)
+                units.append(current)
+            continue
+
+        if division == "IDENTIFICATION" and text.startswith("PROGRAM-ID"):
+            words = _WORD_RE.findall(_LITERAL_RE.sub(lambda x: x.group(0).strip("'\""), text[10:]))
+            program_id = words[0] if words else None
+            continue
+
+        if division == "ENVIRONMENT":
+            for f in _SELECT_RE.findall(text):
+                if f not in files:
+                    files.append(f)
+            continue
+
+        if division == "DATA":
+            m = _SECTION_RE.match(text)
+            if m:
+                data_section = m.group(1)
+                current_fd = None
+                continue
+            m = _FD_RE.match(text)
+            if m:
+                current_fd = m.group(1)
+                if current_fd not in files:
+                    files.append(current_fd)
+                continue
+            m = _DATA_ITEM_RE.match(text)
+            if m and m.group(2) != "FILLER":
+                level, item = int(m.group(1)), m.group(2)
+                if data_section == "FILE" and current_fd and level == 1:
+                    record_to_file[item] = current_fd
+                elif data_section:
+                    data_items.setdefault(item, data_section)
+            continue
+
+        if division == "PROCEDURE":
+            m = _SECTION_RE.match(text)
+            if m and (ln.area_a or free):
+                proc_section = m.group(1)
+                current = CobolUnit(proc_section, "PROCEDURE", proc_section, ln.number, ln.number, is_section=True)
+                units.append(current)
+                rest = text[m.end():].strip()
+                if rest:
+                    current.lines.append(SourceLine(ln.number, rest, False))
+                continue
+            m = _PARAGRAPH_RE.match(text)
+            if m and (ln.area_a if not free else True) and m.group(1) not in _NOT_PARAGRAPH \
+                    and not _VERB_RE.fullmatch(m.group(1)):
+                current = CobolUnit(m.group(1), "PROCEDURE", proc_section, ln.number, ln.number)
+                units.append(current)
+                rest = text[m.end():].strip()
+                if rest:
+                    current.lines.append(SourceLine(ln.number, rest, False))
+                continue
+            if current is not None:
+                current.lines.append(ln)
+                current.end_line = ln.number
+
+    if division:
+        divisions[division] = (divisions[division][0], len(raw_lines))
+
+    # descarta a unidade implícita / sections sem comandos próprios
+    units = [u for u in units if u.lines or not (u.is_section or u.name == "PROCEDURE-DIVISION")]
+    return CobolProgram(program_id, free, divisions, units, files, record_to_file, data_items, len(raw_lines))
+
+# ------------------ comandos de cada unidade ------------------
+
+def _split_statements(text: str) -> List[Tuple[str, str]]:
+    """Quebra o texto de um parágrafo em (verbo, comando), ignorando verbos dentro de literais."""
+    literals: List[str] = []
+
+    def _hide(m):
+        literals.append(m.group(0))
+        return f"\x00{len(literals) - 1}\x00"
+
+    masked = _LITERAL_RE.sub(_hide, text)
+    spans = [(m.start(), m.group(1)) for m in _VERB_RE.finditer(masked)]
+    out = []
+    for i, (pos, verb) in enumerate(spans):
+        end = spans[i + 1][0] if i + 1 < len(spans) else len(masked)
+        stmt = masked[pos:end].strip().rstrip(".").strip()
+        # terminadores de escopo e cláusulas de EVALUATE/IF não fazem parte do comando
+        stmt = _TAIL_RE.split(stmt)[0].strip() or stmt
+        stmt = re.sub(r"\x00(\d+)\x00", lambda m: literals[int(m.group(1))], stmt)
+        out.append((verb, stmt))
+    return out
+
+def _names(fragment: str) -> List[str]:
+    return [w for w in _WORD_RE.findall(_LITERAL_RE.sub(" ", fragment))
+            if w not in _RESERVED and not w.isdigit()]
+
+def _add(lst: List[str], value: str):
+    if value and value not in lst:
+        lst.append(value)
+
+def build_unit(prog: CobolProgram, unit: CobolUnit, known_names: set[str]) -> dict:
+    """Converte uma unidade estrutural no formato de unit.cobol.schema.json."""
+    text = " ".join(ln.text for ln in unit.lines)
+    statements = _split_statements(text)
+
+    perform: List[str] = []
+    goto: List[str] = []
+    calls: List[dict] = []
+    files: List[str] = []
+    inputs: List[str] = []
+    outputs: List[str] = []
+    side_effects: List[str] = []
+    steps: List[dict] = []
+    decisions: List[dict] = []
+
+    for verb, stmt in statements:
+        body = stmt[len(verb):].strip()
+        if verb == "PERFORM":
+            words = _names(body.split(" UNTIL ")[0].split(" VARYING ")[0])
+            if words and words[0] in known_names:
+                _add(perform, words[0])
+                m = re.search(r"\b(?:THRU|THROUGH)\s+([A-Z0-9][A-Z0-9-]*)", body)
+                if m:
+                    _add(perform, m.group(1))
+        elif verb == "GO":
+            targets = re.sub(r"^TO\b", "", body).split(" DEPENDING ")[0]
+            for w in _names(targets):
+                _add(goto, w)
+        elif verb == "CALL":
+            m = re.match(r"(['\"])(.*?)\1|([A-Z0-9][A-Z0-9-]*)", body)
+            if m:
+                program = m.group(2) if m.group(2) is not None else m.group(3)
+                call = {"program": program}
+                mu = re.search(r"\bUSING\b(.*?)(?:\bRETURNING\b|\bON\s+EXCEPTION\b|\bON\s+OVERFLOW\b|\bEND-CALL\b|$)", body)
+                if mu:
+                    call["using"] = _names(mu.group(1))
+                if not any(c["program"] == program for c in calls):
+                    calls.append(call)
+                _add(side_effects, f"CALL {program}")
+        elif verb == "OPEN":
+            mode = None
+            for w in _WORD_RE.findall(body):
+                if w in ("INPUT", "OUTPUT", "I-O", "EXTEND"):
+                    mode = w
+                elif w in prog.files:
+                    _add(files, w)
+                    if mode in ("INPUT", "I-O"):
+                        _add(inputs, w)
+                    if mode in ("OUTPUT", "EXTEND", "I-O"):
+                        _add(outputs, w)
+        elif verb in ("READ", "RETURN"):
+            w = _names(body)[:1]
+            if w:
+                _add(files, w[0])
+                _add(inputs, w[0])
+        elif verb in ("WRITE", "REWRITE", "DELETE", "RELEASE"):
+            w = _names(body)[:1]
+            if w:
+                f = prog.record_to_file.get(w[0], w[0])
+                _add(files, f)
+                _add(outputs, f)
+                _add(side_effects, f"{verb} {f}")
+        elif verb == "START" or verb == "CLOSE":
+            for w in _names(body):
+                if w in prog.files:
+                    _add(files, w)
+        elif verb == "DISPLAY":
+            _add(side_effects, "DISPLAY (console)")
+        elif verb == "EXEC":
+            _add(side_effects, stmt.split("END-EXEC")[0][:80])
+
+        if verb in ("IF", "EVALUATE") and len(decisions) < MAX_DECISIONS:
+            did = f"d{len(decisions) + 1}"
+            if verb == "IF":
+                cond = re.split(r"\bTHEN\b", body)[0].strip()
+                decisions.append({"id": did, "form": "IF", "condition": cond[:400],
+                                  "branches": [{"label": "Sim"}, {"label": "Não"}]})
+            else:
+                decisions.append({"id": did, "form": "EVALUATE", "condition": body[:400], "branches": []})
+
+        if len(steps) < MAX_STEPS:
+            kind = _STEP_KIND.get(verb, "other")
+            if verb == "PERFORM" and re.search(r"\b(?:UNTIL|VARYING|TIMES)\b", body):
+                kind = "loop"
+            steps.append({"id": f"s{len(steps) + 1}", "text": stmt[:400], "kind": kind})
+
+    # ramo "Sim" do IF começa no step seguinte (melhor esforço para o diagrama)
+    if_steps = [i for i, s in enumerate(steps) if s["kind"] == "if"]
+    for d, i in zip([d for d in decisions if d["form"] == "IF"], if_steps):
+        if i + 1 < len(steps):
+            d["branches"][0]["path"] = [steps[i + 1]["id"]]
+    # ramos do EVALUATE: os WHENs até o END-EVALUATE (texto completo do parágrafo)
+    evaluates = [d for d in decisions if d["form"] == "EVALUATE"]
+    for d, m in zip(evaluates, _EVALUATE_RE.finditer(text)):
+        clauses = re.split(r"(?<![A-Z0-9-])WHEN(?![A-Z0-9-])", m.group(1))
+        d["condition"] = clauses[0].strip()[:400] or "EVALUATE"
+        d["branches"] = [{"label": _VERB_RE.split(c)[0].strip()[:80] or "WHEN"} for c in clauses[1:11]]
+
+    tokens = set(_WORD_RE.findall(_LITERAL_RE.sub(" ", text)))
+    working_storage = [n for n in prog.data_items if n in tokens][:MAX_WS_REFS]
+
+    kind = "Section" if unit.is_section else "Parágrafo"
+    parts = []
+    if perform:
+        parts.append("executa " + ", ".join(perform[:5]))
+    if inputs:
+        parts.append("lê " + ", ".join(inputs[:5]))
+    if outputs:
+        parts.append("grava " + ", ".join(outputs[:5]))
+    if calls:
+        parts.append("chama " + ", ".join(c["program"] for c in calls[:5]))
+    if goto:
+        parts.append("desvia para " + ", ".join(goto[:5]))
+    purpose = f"{kind} {unit.name}" + (": " + "; ".join(parts) if parts else f" ({len(statements)} comandos)") + "."
+
+    return {
+        "kind": "cobol",
+        "id": f"u-{unit.name}",
+        "name": unit.name,
+        "range": {"start_line": unit.start_line, "end_line": max(unit.start_line, unit.end_line)},
+        "division": unit.division,
+        "purpose": purpose[:4000],
+        "io": {
+            "working_storage": working_storage,
+            "files": files,
+            "inputs": inputs,
+            "outputs": outputs,
+            "side_effects": side_effects,
+        },
+        "control_flow": {
+            "perform": perform,
+            "goto": goto,
+            "call": calls,
+        },
+        "logic": {
+            "steps": steps,
+            "decisions": decisions,
+        },
+        "diagram_suggestion": "flowchart",
+        "notes": "Extraído pelo parser COBOL determinístico.",
+    }
+
+def parse_cobol_units(code: str) -> List[dict]:
+    """Unidades (parágrafos/sections da PROCEDURE DIVISION) no formato do schema COBOL."""
+    prog = parse_structure(code)
+    known = {u.name for u in prog.units}
+    out: List[dict] = []
+    seen: Dict[str, int] = {}
+    for u in prog.units:
+        unit = build_unit(prog, u, known)
+        # parágrafos homônimos em sections diferentes: qualifica o id com a section
+        if unit["id"] in seen and u.section:
+            unit["id"] = f"u-{u.section}.{u.name}"[:64]
+        # ainda repetido (fora de section, ou mesmo nome de uma section): sufixo numérico,
+        # pois unit_id, o índice de diagramas e /analyses/units contam com ids únicos no arquivo
+        base = unit["id"]
+        while unit["id"] in seen:
+            seen[base] += 1
+            sfx = f"-{seen[base]}"
+            unit["id"] = base[:64 - len(sfx)] + sfx
+        seen[unit["id"]] = 1
+        out.append(unit)
+    return out
@@ -1,18 +1,32 @@
 from __future__ import annotations
-import json
-import re
-from typing import List, Dict, Any
-from pathlib import Path
+import os
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 from services.llm.client import get_llm
-from jsonschema import Draft202012Validator
-
-# Carrega o schema de unidade genérica para instruir a saída
-ROOT = Path(__file__).resolve().parents[3]
-SCHEMA_PATH = ROOT / "schemas" / "unit.generic.schema.json"
-UNIT_GENERIC_SCHEMA: Dict[str, Any] = json.loads(SCHEMA_PATH.read_text(encoding="utf-8"))
-UNIT_VALIDATOR = Draft202012Validator(UNIT_GENERIC_SCHEMA)
+from services.llm.executor import STREAM_END, get_executor
+from services.analyzer.jsonstream import JsonArrayStream
+from services.llm.tokens import count_tokens, current_usage, truncate_to_tokens
+from services.analyzer.chunking import (
+    Chunk, CHUNK_MAX_CHUNKS, CHUNK_OVERLAP_LINES, merge_chunk_units, remap_units, split_into_chunks, unanalyzed_tail,
+)
+from services.analyzer.sanitize import sanitize_unit, sanitize_units
+from services.schemas import SCHEMA_DIGEST, UNIT_GENERIC_SCHEMA
+
+# Versão do prompt + digest do schema: entram na chave do cache de análises,
+# então qualquer mudança em SYSTEM/HUMAN deve incrementar PROMPT_VERSION.
+PROMPT_VERSION = "4"
+
+# Prefixos de 'purpose' das unidades de contingência (não devem ir para cache)
+FALLBACK_PURPOSE_PREFIXES = ("Falha no LLM:", "Fallback:")
+
+# Orçamento por requisição: prompt completo (sistema + instruções + código) em
+# tokens. O código é dividido/cortado para caber no que sobra depois do prompt fixo.
+LLM_MAX_PROMPT_TOKENS = int(os.getenv("LLM_MAX_PROMPT_TOKENS", "4000"))
+LLM_MIN_CODE_TOKENS = int(os.getenv("LLM_MIN_CODE_TOKENS", "500"))
+# saída esperada por chamada: só entra na reserva do rate limit de tokens/min
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "800"))
 
 
 SYSTEM = """Você é um assistente que lê código-fonte e devolve documentação ESTRUTURADA.
@@ -20,7 +34,7 @@ SEM TEXTO LIVRE. Saída deve ser JSON estrito, obedecendo unit.generic.schema.js
 Regras:
 - Identifique UNIDADES (funções/métodos) no código.
 - Para cada unidade, produza campos: kind="generic", id, name, range, signature, purpose, io, logic, risks?, diagram_suggestion?
-- IDs de steps/decisions curtos (ex.: s1, s2, d1). 'range' com start_line/end_line aproximados.
+- IDs de steps/decisions curtos (ex.: s1, s2, d1). 'range' com start_line/end_line exatos, contados dentro do trecho.
 - Em 'logic':
   - steps: sequência sucinta do que a função faz
   - decisions: condições principais; true_path/false_path (listas de IDs de steps)
@@ -28,304 +42,37 @@ Regras:
 - Em diagram_suggestion, sugira "flowchart" ou "sequence" ou "state" ou "class" ou "er" ou "dfd" ou "none" se fizer sentido. Mas nunca diferente disso.
 - Limite rótulos (text) a 60 caracteres aprox.
 - NUNCA inclua comentários fora do JSON.
-"""
-
-HUMAN = """Linguagem: {language}
-Arquivo: {path}
-Trecho analisado (pode estar truncado):
-{code}
 Esquema JSON (unit.generic.schema.json, resumo):
 {schema_summary}
-
 Saída esperada: um ARRAY JSON de unidades (ex.: [ {{...}}, {{...}} ]).
-IMPORTANTE: apenas o JSON do array. Nada além disso."""
-
-# ------------------ SANITIZERS ------------------
-
-_ALLOWED_UNIT_KEYS = {
-    "kind", "id", "name", "range", "signature", "purpose",
-    "io", "logic", "risks", "diagram_suggestion"
-}
-_ALLOWED_LOGIC_KEYS = {"steps", "decisions", "calls"}
-_ALLOWED_IO_KEYS = {"inputs", "outputs", "side_effects"}
-
-_STEP_KIND_SAFE = {"action", "io", "return", "exit", "other"}
-
-def _parse_signature(sig: str) -> Dict[str, Any]:
-    params = []
-    returns = None
-
-    mret = re.search(r"->\s*([a-zA-Z0-9_\[\],\.]+)", sig)
-    if mret:
-        returns = mret.group(1).strip()
-
-    m = re.search(r"\((.*)\)", sig)
-    if m:
-        raw = m.group(1)
-        parts = [p.strip() for p in raw.split(",") if p.strip()]
-        for p in parts:
-            if p in ("self", "cls"):
-                continue
-            name = p
-            typ = None
-            m2 = re.match(r"([a-zA-Z_][a-zA-Z0-9_]*)\s*:\s*([^=]+)", p)
-            if m2:
-                name = m2.group(1).strip()
-                typ = m2.group(2).strip()
-            params.append(_sanitize_param({"name": name, "type": typ}))
-    return {"parameters": params, "returns": returns}
-
-_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,32}$")  # p/ steps e decisions
-def _norm_step_id(raw: str, fallback: str) -> str:
-    """
-    Normaliza um id de step/decision para casar com o schema:
-    - troca qualquer char inválido por '_'
-    - trunca a 32 chars
-    - garante não vazio (usa fallback)
-    """
-    s = (raw or fallback)
-    s = re.sub(r"[^A-Za-z0-9_-]", "_", s)
-    if not s:
-        s = fallback
-    return s[:32]
-
-def _map_path_ids(path_list, idmap):
-    """aplica idmap, e normaliza qualquer id que ainda fique fora do padrão"""
-    if not isinstance(path_list, list):
-        return []
-    out = []
-    for x in path_list:
-        rid = str(x)
-        nid = idmap.get(rid) or _norm_step_id(rid, rid or "s1")
-        out.append(nid)
-    return out
-
-def _coerce_steps_with_map(steps):
-    """
-    Retorna (lista_de_steps_normalizados, mapa_ids)
-    mapa_ids: {id_original -> id_normalizado}
-    """
-    out, idmap = [], {}
-    if not isinstance(steps, list):
-        return out, idmap
-
-    used = set()
-    for i, s in enumerate(steps, start=1):
-        # extrai campos
-        if isinstance(s, str):
-            raw_id = f"s{i}"
-            text = s
-            kind = "action"
-        else:
-            raw_id = (s.get("id") if isinstance(s, dict) else None) or f"s{i}"
-            text = (s.get("text") if isinstance(s, dict) else "") or (s.get("label") if isinstance(s, dict) else "") or ""
-            kind = (s.get("kind") if isinstance(s, dict) else "action") or "action"
-
-        # normaliza id
-        nid = _norm_step_id(str(raw_id), f"s{i}")
-        # resolve colisão
-        base, k = nid, 2
-        while nid in used:
-            nid = (base + f"_{k}")[:32]
-            k += 1
-        used.add(nid)
-        idmap[str(raw_id)] = nid
-
-        # normaliza kind pro enum do schema
-        if kind.lower() not in {"action","io","calc","loop","assign","return","try","catch","finally"}:
-            kind = "action"
-
-        out.append({
-            "id": nid,
-            "text": str(text)[:60],
-            "kind": kind.lower()
-        })
-    return out, idmap
-
-
-_STEP_KIND_ALLOWED = {"action","io","calc","loop","assign","return","try","catch","finally"}
-
-def _coerce_steps(steps):
-    out = []
-    if isinstance(steps, list):
-        for i, s in enumerate(steps, start=1):
-            if isinstance(s, str):
-                out.append({"id": f"s{i}", "text": s[:60], "kind": "action"})
-            elif isinstance(s, dict):
-                sid  = s.get("id") or f"s{i}"
-                txt  = (s.get("text") or s.get("label") or "").strip()[:60]
-                kind = (s.get("kind") or "action").lower()
-                if kind not in _STEP_KIND_ALLOWED:
-                    kind = "action"
-                out.append({"id": sid, "text": txt, "kind": kind})
-    return out
-
-# depois dos imports
-_PARAM_ALLOWED = {"name", "type", "mode", "default"}
-
-def _sanitize_param(p) -> dict:
-    # aceita string ("token") ou dict; remove chaves não permitidas e valores None
-    if isinstance(p, str):
-        return {"name": p}
-    if not isinstance(p, dict):
-        return {"name": str(p)}
-    out = {}
-    for k in _PARAM_ALLOWED:
-        if k in p and p[k] is not None:
-            out[k] = p[k]
-    # garante name
-    if "name" not in out or not out["name"]:
-        out["name"] = p.get("name") or "param"
-    # normaliza mode se vier errado
-    if "mode" in out and out["mode"] not in ("in", "out", "inout"):
-        out.pop("mode", None)
-    return out
-
-def _coerce_calls(calls) -> list[Dict[str, Any]]:
-    out = []
-    if isinstance(calls, list):
-        for c in calls:
-            if isinstance(c, dict):
-                target = c.get("target")
-                kind = (c.get("kind") or "other").lower()
-                out.append({"target": target, "kind": kind})
-            elif isinstance(c, str):
-                out.append({"target": c, "kind": "other"})
-    return out
-
-def _to_string_list(x):
-    if x is None: return []
-    if isinstance(x, list):
-        res = []
-        for item in x:
-            if isinstance(item, dict):
-                name = item.get("name") or item.get("var") or item.get("field")
-                typ  = item.get("type")
-                desc = item.get("description") or item.get("desc")
-                s = " ".join(str(y) for y in [name, typ, desc] if y)
-                res.append(s or json.dumps(item, ensure_ascii=False)[:60])
-            else:
-                res.append(str(item))
-        return res
-    return [str(x)]
-
-def _strip_additional_props(d: Dict[str, Any], allowed: set[str]) -> Dict[str, Any]:
-    return {k: v for k, v in d.items() if k in allowed}
-
-def _coerce_decisions(decisions, idmap):
-    out = []
-    if not isinstance(decisions, list):
-        return out
-    used = set()
-    for i, d in enumerate(decisions, start=1):
-        # id e condição
-        raw_id = (d.get("id") if isinstance(d, dict) else None) or f"d{i}"
-        did = _norm_step_id(str(raw_id), f"d{i}")
-        # resolve colisão
-        base, k = did, 2
-        while did in used:
-            did = (base + f"_{k}")[:32]
-            k += 1
-        used.add(did)
-
-        cond = ""
-        if isinstance(d, dict):
-            cond = (d.get("condition") or d.get("text") or "")[:300]
-        else:
-            cond = str(d)[:300]
-
-        # formato generic (true/false) ou ignorar branches COBOL aqui
-        tp = fp = []
-        if isinstance(d, dict):
-            tp = _map_path_ids(d.get("true_path") or [], idmap)
-            fp = _map_path_ids(d.get("false_path") or [], idmap)
-
-        out.append({
-            "id": did,
-            "condition": cond,
-            "true_path": tp,
-            "false_path": fp
-        })
-    return out
-
-def _coerce_generic_unit(u: Dict[str, Any]) -> Dict[str, Any]:
-    v = {k: u[k] for k in u if k in _ALLOWED_UNIT_KEYS}
-    v["kind"] = "generic"
-
-    # range
-    rng = u.get("range") or {}
-    sl = rng.get("start_line") or 1
-    el = rng.get("end_line") or max(1, sl)
-    try:
-        sl = int(sl)
-        el = int(el)
-    except Exception:
-        sl, el = 1, 1
-    if el < sl:
-        el = sl
-    v["range"] = {"start_line": sl, "end_line": el}
-
-    # signature
-    sig = u.get("signature")
-    if isinstance(sig, str):
-        v["signature"] = _parse_signature(sig)
-    elif isinstance(sig, dict):
-        # normaliza campos mínimos
-        params = sig.get("parameters") if isinstance(sig.get("parameters"), list) else []
-        params2 = []
-        for p in params:
-            if isinstance(p, dict):
-                params2.append({
-                    "name": p.get("name"),
-                    "type": p.get("type"),
-                    "description": p.get("description"),
-                })
-            else:
-                params2.append({"name": str(p), "type": None, "description": None})
-        v["signature"] = {"parameters": params2, "returns": sig.get("returns")}
-    else:
-        v["signature"] = {"parameters": [], "returns": None}
-
-    # purpose
-    v["purpose"] = (u.get("purpose") or "").strip()[:200] or f"Auto-gerada para {u.get('name') or u.get('id') or 'unit'}"
-
-    # io
-    io = u.get("io") or {}
-    io = _strip_additional_props(io, _ALLOWED_IO_KEYS)
-    v["io"] = {
-        "inputs": _to_string_list(io.get("inputs")),
-        "outputs": _to_string_list(io.get("outputs")),
-        "side_effects": _to_string_list(io.get("side_effects")),
-    }
-
-    # logic
-    lg = u.get("logic") or {}
-    steps_norm, idmap = _coerce_steps_with_map(lg.get("steps") or [])
-    decisions_norm = _coerce_decisions(lg.get("decisions") or [], idmap)
-    calls_norm = _coerce_calls(lg.get("calls") or [])
-
-    v["logic"] = {
-        "steps": steps_norm,
-        "decisions": decisions_norm,
-        "calls": calls_norm
-    }
-
-    # opcionais
-    risks = u.get("risks")
-    v["risks"] = [str(r) for r in risks] if isinstance(risks, list) else []
-
-    if isinstance(u.get("diagram_suggestion"), str):
-        v["diagram_suggestion"] = u["diagram_suggestion"]
-    else:
-        v.pop("diagram_suggestion", None)
-
-    # id/name
-    v["id"] = u.get("id") or "u_main"
-    v["name"] = u.get("name") or v["id"]
+IMPORTANTE: apenas o JSON do array. Nada além disso.
+"""
 
-    return v
+# Parte variável por último: o prefixo (SYSTEM com o resumo do schema) é idêntico
+# em todas as chamadas e pode ser reaproveitado pelo cache de prompt do provedor.
+HUMAN = """Linguagem: {language}
+Arquivo: {path}
+Trecho analisado ({chunk_info}); 'range' relativo ao trecho (linha 1 = primeira linha abaixo):
+{code}"""
 
+# Unidade já extraída localmente (ranges/assinatura/chamadas exatos): o LLM só descreve.
+ENRICH_SYSTEM = """Você documenta UMA unidade de código (função/método) já identificada.
+SEM TEXTO LIVRE. Saída: um OBJETO JSON estrito com apenas as chaves purpose, logic e risks.
+Regras:
+- purpose: 1-3 frases sobre o que a unidade faz e por quê.
+- logic.steps: sequência sucinta ({{"id": "s1", "text": "...", "kind": "action|io|calc|loop|assign|return|try|catch|finally"}}).
+- logic.decisions: condições principais ({{"id": "d1", "condition": "...", "true_path": ["s2"], "false_path": ["s3"]}}).
+- risks: lista curta de riscos (pode ser vazia).
+- Limite rótulos (text) a 60 caracteres aprox.
+- NUNCA inclua comentários fora do JSON.
+Saída esperada: {{"purpose": "...", "logic": {{"steps": [...], "decisions": [...]}}, "risks": [...]}}
+IMPORTANTE: apenas o JSON do objeto. Nada além disso.
+"""
 
+ENRICH_HUMAN = """Linguagem: {language}
+Arquivo: {path}
+Unidade: {name} (linhas {start_line}-{end_line})
+{code}"""
 
 def _schema_summary(schema: Dict[str, Any]) -> str:
     # resumo compacto para o prompt (evita enviar o schema inteiro)
@@ -334,73 +81,235 @@ def _schema_summary(schema: Dict[str, Any]) -> str:
     return "Campos obrigatórios: " + ", ".join(k for k in keys if k in schema.get("required", [])) + \
            ". Outros campos: " + ", ".join(k for k in keys if k not in schema.get("required", []))
 
+SCHEMA_SUMMARY = _schema_summary(UNIT_GENERIC_SCHEMA)
+
+# Templates montados uma vez por processo; as chains (prompt | llm | parser) são
+# criadas no primeiro uso, porque get_llm() exige a chave da API.
+UNITS_PROMPT = ChatPromptTemplate.from_messages([("system", SYSTEM), ("human", HUMAN)]) \
+    .partial(schema_summary=SCHEMA_SUMMARY)
+ENRICH_PROMPT = ChatPromptTemplate.from_messages([("system", ENRICH_SYSTEM), ("human", ENRICH_HUMAN)])
+
+@lru_cache(maxsize=None)
+def _chain(kind: str):
+    if kind == "units":
+        return UNITS_PROMPT | get_llm() | JsonOutputParser()
+    if kind == "units_stream":
+        return UNITS_PROMPT | get_llm() | StrOutputParser()
+    return ENRICH_PROMPT | get_llm() | JsonOutputParser()
+
+def _tracked(chain):
+    """Chain com o callback de uso de tokens da análise corrente (track_usage), se houver."""
+    usage = current_usage()
+    return chain.with_config(callbacks=[usage]) if usage is not None else chain
+
+def _prompt_tokens(prompt: ChatPromptTemplate, **values) -> int:
+    return sum(count_tokens(m.content) for m in prompt.format_messages(**values))
+
+def _code_budget(prompt: ChatPromptTemplate, **values) -> int:
+    """Tokens que sobram para o código depois do prompt fixo (com o código vazio)."""
+    return max(LLM_MIN_CODE_TOKENS, LLM_MAX_PROMPT_TOKENS - _prompt_tokens(prompt, code="", **values))
+
+def _reserve(prompt_tokens: List[int]) -> List[int]:
+    """Reserva no rate limit de tokens/min: prompt + saída esperada; soma a estimativa na análise."""
+    usage = current_usage()
+    if usage is not None:
+        usage.add_estimate(sum(prompt_tokens))
+    return [t + LLM_EXPECTED_OUTPUT_TOKENS for t in prompt_tokens]
+
+def is_fallback_units(units: List[Dict[str, Any]]) -> bool:
+    """True se o resultado é a unidade de contingência (falha/saída inválida do LLM)."""
+    return any(str(u.get("purpose") or "").startswith(FALLBACK_PURPOSE_PREFIXES) for u in units)
+
+def _fallback_unit(purpose: str, code: str, chunk: Chunk | None = None, n: int = 0) -> Dict[str, Any]:
+    """Unidade de contingência: do arquivo inteiro ou, com chunk, do trecho n que falhou."""
+    if chunk is not None:
+        uid, name, rng = f"u_chunk_{n + 1}", f"trecho_{n + 1}", {"start_line": chunk.own_start, "end_line": chunk.end_line}
+    else:
+        uid, name, rng = "u_main", "main", {"start_line": 1, "end_line": max(1, (code or "").count("\n")+1)}
+    return {
+        "kind": "generic",
+        "id": uid,
+        "name": name,
+        "range": rng,
+        "signature": {"parameters": [], "returns": None},
+        "purpose": purpose,
+        "io": {"inputs": [], "outputs": [], "side_effects": []},
+        "logic": {"steps": [{"id":"s1","text":"Processo principal","kind":"action"}], "decisions": [], "calls": []},
+        "risks": []
+    }
+
+def _failed_chunk_unit(chunk: Chunk, n: int, error: BaseException, code: str) -> Dict[str, Any]:
+    # marca o resultado como parcial: is_fallback_units => não vai para o cache nem para o armazém
+    return _fallback_unit(f"Falha no LLM: trecho {n + 1} (linhas {chunk.own_start}-{chunk.end_line}) "
+                          f"não analisado: {error}"[:4000], code, chunk, n)
+
+def _truncation_unit(chunks: List[Chunk], code: str) -> Dict[str, Any] | None:
+    """
+    Marcador do final não analisado (arquivo acima de CHUNK_MAX_CHUNKS trechos).
+    Não é contingência: o corte é determinístico, então o resultado pode ir para o cache.
+    """
+    tail = unanalyzed_tail(chunks, code)
+    if tail is None:
+        return None
+    unit = _fallback_unit(f"Trecho não analisado: linhas {tail[0]}-{tail[1]} excedem o limite de "
+                          f"{CHUNK_MAX_CHUNKS} trechos por arquivo (CHUNK_MAX_CHUNKS).", code)
+    unit.update(id="u_truncated", name="trecho_nao_analisado",
+                range={"start_line": tail[0], "end_line": tail[1]})
+    return unit
+
+def _chunk_info(chunk: Chunk, total: int) -> str:
+    if total == 1:
+        return "arquivo completo"
+    ctx = chunk.own_start - chunk.start_line
+    info = f"linhas {chunk.start_line}-{chunk.end_line} do arquivo"
+    if ctx:
+        info += f"; as {ctx} primeiras linhas são só contexto (já analisadas no trecho anterior), não as documente"
+    return info
+
+def _unit_inputs(code: str, language: str, path: str):
+    """Trechos do arquivo dentro do orçamento de tokens, entradas do prompt e tokens de cada chamada."""
+    # o orçamento considera a maior chunk_info possível (trecho com linhas de contexto)
+    worst = Chunk("", 99999, 99999, 99999 + CHUNK_OVERLAP_LINES)
+    fixed = {"language": language, "path": path, "chunk_info": _chunk_info(worst, 2)}
+    budget = _code_budget(UNITS_PROMPT, **fixed)
+    code_tokens = count_tokens(code or "")
+    if code_tokens > budget:
+        # trechos seguintes repetem CHUNK_OVERLAP_LINES linhas de contexto além do orçamento do grupo
+        per_line = code_tokens / max(1, (code or "").count("\n") + 1)
+        budget = max(LLM_MIN_CODE_TOKENS, budget - int(CHUNK_OVERLAP_LINES * per_line))
+    chunks = split_into_chunks(code or "", language, max_tokens=budget)
+    inputs = [{"language": language, "path": path, "code": c.text, "chunk_info": _chunk_info(c, len(chunks))}
+              for c in chunks]
+    return chunks, inputs, _reserve([_prompt_tokens(UNITS_PROMPT, **i) for i in inputs])
+
 def analyze_units_generic_llm(code: str, language: str, path: str) -> List[Dict[str, Any]]:
     """
     Usa LLM para produzir uma lista de unidades no formato do schema genérico.
-    Para POC, se o arquivo for muito grande, enviamos só um trecho.
+    Arquivos que não cabem no orçamento de tokens (LLM_MAX_PROMPT_TOKENS) são
+    divididos em trechos nas fronteiras de unidades (services.analyzer.chunking),
+    analisados em paralelo pelo executor e depois reunidos com os ranges
+    convertidos para linhas do arquivo.
     """
-    # Truncagem simples para POC (ex.: 300 linhas)
-    MAX_CHARS = 12000
-    snippet = code[:MAX_CHARS]
-
-    llm = get_llm()
-    parser = JsonOutputParser()  # espera JSON puro
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", SYSTEM),
-        ("human", HUMAN),
-    ]).partial(
-        language=language,
-        path=path,
-        schema_summary=_schema_summary(UNIT_GENERIC_SCHEMA)
-    )
-
-    chain = prompt | llm | parser
-
+    chunks, inputs, tokens = _unit_inputs(code, language, path)
     try:
-        units = chain.invoke({"code": snippet})
+        # concorrência, rate limit, retries e circuit breaker ficam no executor compartilhado
+        results = get_executor().batch(_tracked(_chain("units")), inputs, tokens=tokens)
     except Exception as e:
-        units = [{
-            "kind": "generic",
-            "id": "u_main",
-            "name": "main",
-            "range": {"start_line": 1, "end_line": max(1, snippet.count("\n")+1)},
-            "signature": {"parameters": [], "returns": None},
-            "purpose": f"Falha no LLM: {e}. Mock de contingência.",
-            "io": {"inputs": [], "outputs": [], "side_effects": []},
-            "logic": {"steps": [{"id":"s1","text":"Processo principal","kind":"action"}], "decisions": [], "calls": []},
-            "risks": []
-        }]
-
-    if isinstance(units, dict):
-        units = [units]
-    
-    sane: List[Dict[str, Any]] = []
-    for u in units:
-        cu = _coerce_generic_unit(u or {})
-        try:
-            UNIT_VALIDATOR.validate(cu)
-            sane.append(cu)
-        except Exception:
-            # tentativa mínima extra: garantir ao menos um step
-            if not cu["logic"]["steps"]:
-                cu["logic"]["steps"] = [{"id": "s1", "text": cu["purpose"][:60], "kind": "action"}]
-            try:
-                UNIT_VALIDATOR.validate(cu)
-                sane.append(cu)
-            except Exception:
-                continue
-
+        results = [e] * len(chunks)
+
+    per_chunk: List[List[Dict[str, Any]]] = []
+    errors: List[BaseException] = []
+    gaps: List[Dict[str, Any]] = []
+    for n, (chunk, res) in enumerate(zip(chunks, results)):
+        if isinstance(res, BaseException):
+            errors.append(res)
+            gaps.append(_failed_chunk_unit(chunk, n, res, code))
+            continue
+        per_chunk.append(remap_units(sanitize_units(res), chunk))
+
+    if not per_chunk:
+        return [_fallback_unit(f"Falha no LLM: {errors[0] if errors else 'sem resposta'}. Mock de contingência.", code)]
+
+    sane = merge_chunk_units(per_chunk)
     if not sane:
-        sane = [{
-            "kind": "generic",
-            "id": "u_main",
-            "name": "main",
-            "range": {"start_line": 1, "end_line": max(1, (code or "").count("\n")+1)},
-            "signature": {"parameters": [], "returns": None},
-            "purpose": "Fallback: nenhuma unidade válida retornada pelo LLM.",
-            "io": {"inputs": [], "outputs": [], "side_effects": []},
-            "logic": {"steps": [{"id":"s1","text":"Processo principal","kind":"action"}], "decisions": [], "calls": []},
-            "risks": []
-        }]
-    return sane
\ No newline at end of file
+        sane = [_fallback_unit("Fallback: nenhuma unidade válida retornada pelo LLM.", code)]
+    truncated = _truncation_unit(chunks, code)
+    if gaps or truncated:  # trechos que falharam / final cortado ficam marcados no resultado
+        sane = merge_chunk_units([sane, gaps + ([truncated] if truncated else [])])
+    return sane
+
+def _enrich_inputs(units: List[Dict[str, Any]], code: str, language: str, path: str):
+    lines = (code or "").splitlines()
+    inputs = []
+    for u in units:
+        rng = u["range"]
+        values = {"language": language, "path": path, "name": u["name"],
+                  "start_line": rng["start_line"], "end_line": rng["end_line"]}
+        snippet = "\n".join(lines[rng["start_line"] - 1:rng["end_line"]])
+        # unidade maior que o orçamento: corta em fronteira de linha (o LLM vê o início)
+        values["code"], _ = truncate_to_tokens(snippet, _code_budget(ENRICH_PROMPT, **values))
+        inputs.append(values)
+    return inputs, _reserve([_prompt_tokens(ENRICH_PROMPT, **i) for i in inputs])
+
+def _merge_enriched(u: Dict[str, Any], res: Any) -> Dict[str, Any]:
+    """Junta a resposta do LLM (purpose/logic/risks) à unidade extraída."""
+    if isinstance(res, dict):
+        merged = {**u, "purpose": res.get("purpose") or u["purpose"],
+                  "logic": {**(res.get("logic") or {}), "calls": u["logic"]["calls"]},
+                  "risks": res.get("risks") or []}
+        cu = sanitize_unit(merged)
+        # signature e io do extrator são exatas: prevalecem sobre a versão normalizada
+        cu["signature"], cu["io"] = u["signature"], u["io"]
+        return cu
+    reason = res if isinstance(res, BaseException) else "saída inválida"
+    return {**u, "purpose": f"Fallback: {u['purpose']} (LLM: {reason})"[:4000]}
+
+def enrich_units_llm(units: List[Dict[str, Any]], code: str, language: str, path: str) -> List[Dict[str, Any]]:
+    """
+    Completa unidades vindas de um extrator local (services.analyzer.extractors):
+    o LLM recebe só o trecho exato de cada unidade e devolve purpose/logic/risks.
+    id, name, range, signature, io e calls continuam os do extrator. Unidades
+    cuja chamada falhar mantêm o esqueleto local, marcado como contingência.
+    """
+    inputs, tokens = _enrich_inputs(units, code, language, path)
+    try:
+        results = get_executor().batch(_tracked(_chain("enrich")), inputs, tokens=tokens)
+    except Exception as e:
+        results = [e] * len(units)
+    return [_merge_enriched(u, res) for u, res in zip(units, results)]
+
+def iter_enriched_units(units: List[Dict[str, Any]], code: str, language: str, path: str
+                        ) -> Iterator[Dict[str, Any]]:
+    """Como enrich_units_llm, mas entrega cada unidade assim que a sua chamada termina."""
+    if not units:
+        return
+    inputs, tokens = _enrich_inputs(units, code, language, path)
+    try:
+        chain = _tracked(_chain("enrich"))
+    except Exception as e:  # chave/modelo inválidos: esqueletos locais marcados como contingência
+        for u in units:
+            yield _merge_enriched(u, e)
+        return
+    for n, res in get_executor().as_completed(chain, inputs, tokens=tokens):
+        yield _merge_enriched(units[n], res)
+
+def stream_units_generic_llm(code: str, language: str, path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Versão em streaming de analyze_units_generic_llm: a resposta de cada trecho é
+    lida token a token e cada unidade do array é entregue assim que fecha e valida.
+    Unidades que começam na sobreposição de contexto ficam com o trecho anterior;
+    duplicatas restantes são resolvidas pelo chamador com merge_chunk_units.
+    """
+    chunks, inputs, tokens = _unit_inputs(code, language, path)
+    try:
+        chain = _tracked(_chain("units_stream"))
+    except Exception as e:  # chave/modelo inválidos: mesma contingência de analyze_units_generic_llm
+        yield _fallback_unit(f"Falha no LLM: {e}. Mock de contingência.", code)
+        return
+    parsers = [JsonArrayStream() for _ in chunks]
+    emitted, errors = 0, {}
+    for n, piece in get_executor().stream_many(chain, inputs, tokens=tokens):
+        if piece is STREAM_END:
+            continue
+        if isinstance(piece, BaseException):
+            errors[n] = piece
+            continue
+        chunk = chunks[n]
+        for obj in parsers[n].feed(piece):
+            for u in remap_units(sanitize_units(obj), chunk):
+                if n and u["range"]["start_line"] < chunk.own_start:
+                    continue
+                emitted += 1
+                yield u
+
+    if not emitted:
+        reason = f"Falha no LLM: {next(iter(errors.values()))}. Mock de contingência." if errors \
+            else "Fallback: nenhuma unidade válida retornada pelo LLM."
+        yield _fallback_unit(reason, code)
+        return
+    # resultado parcial: um marcador por trecho que falhou (não vai para o cache)
+    for n in sorted(errors):
+        yield _failed_chunk_unit(chunks[n], n, errors[n], code)
+    truncated = _truncation_unit(chunks, code)
+    if truncated:
+        yield truncated
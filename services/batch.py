@@ -0,0 +1,462 @@
+from __future__ import annotations
+import fnmatch
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta, timezone
+from jsonschema import ValidationError
+from sqlalchemy import insert, or_, update
+from models.batch_job import BatchJob, BatchJobFile
+from services.db import SessionLocal
+from services.db_writer import DB_WRITER
+from services.config_store import get_github_token
+from services.github import GitHubClient, get_client
+from services.github_ratelimit import BATCH
+from services.blob_store import BLOB_STORE, ingest_commit
+from services.files import fetch_blob_view
+from services.ratelimit import TokenBucket
+from services.tree_cache import REF_RESOLVER, get_complete_tree_index
+from services.analyzer.router import COBOL_EXTS, GENERIC_MAP, detect_language, analyze_units, llm_enabled
+from services.analysis_store import save_analysis
+from services.analyzer.pipeline import normalize_mode, cache_key_for, build_analysis, lookup_cached_units, store_units
+from services.analyzer.incremental import parse_hunks, reanalyze_units
+from services.analysis_cache import get_cached_units
+from services.schemas import validate_analysis
+from services.singleflight import SINGLE_FLIGHT
+
+log = logging.getLogger(__name__)
+
+# Concorrência e limites (configuráveis via .env)
+BATCH_LLM_WORKERS = int(os.getenv("BATCH_LLM_WORKERS", "4"))
+BATCH_FETCH_WORKERS = int(os.getenv("BATCH_FETCH_WORKERS", "8"))
+BATCH_GITHUB_RPS = float(os.getenv("BATCH_GITHUB_RPS", "10"))  # requisições/s ao GitHub, somando todos os jobs
+BATCH_LLM_RPM = float(os.getenv("BATCH_LLM_RPM", "60"))        # chamadas/min ao LLM, somando todos os jobs
+BATCH_MAX_ATTEMPTS = int(os.getenv("BATCH_MAX_ATTEMPTS", "3"))
+BATCH_SUPERVISOR_INTERVAL = float(os.getenv("BATCH_SUPERVISOR_INTERVAL", "30"))
+# contents (1 chamada por arquivo) | tarball (1 download por commit para o blob store) | auto
+BATCH_FETCH_MODE = os.getenv("BATCH_FETCH_MODE", "auto")
+BATCH_TARBALL_MIN_FILES = int(os.getenv("BATCH_TARBALL_MIN_FILES", "50"))
+HEARTBEAT_SECONDS = 10
+HEARTBEAT_STALE_SECONDS = 60
+
+# Limitadores globais do processo: compartilhados por todos os jobs
+GITHUB_BUCKET = TokenBucket(BATCH_GITHUB_RPS, capacity=max(1.0, BATCH_GITHUB_RPS))
+LLM_BUCKET = TokenBucket.per_minute(BATCH_LLM_RPM, burst=BATCH_LLM_WORKERS)
+
+ACTIVE_STATUSES = ("queued", "enumerating", "running")
+ANALYZABLE_EXTS = tuple(sorted(COBOL_EXTS | set(GENERIC_MAP)))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_running: set[int] = set()
+_running_lock = threading.Lock()
+_supervisor: threading.Thread | None = None
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _matches(path: str, include: list[str], exclude: list[str]) -> bool:
+    if include and not any(fnmatch.fnmatch(path, g) for g in include):
+        return False
+    return not any(fnmatch.fnmatch(path, g) for g in exclude)
+
+# ------------------ API pública ------------------
+
+def submit_job(db, *, owner: str, repo: str, ref: str, include: list[str] | None = None,
+               exclude: list[str] | None = None, mode: str | None = None,
+               base_ref: str | None = None) -> BatchJob:
+    """Com base_ref, o job é 'diff': só arquivos adicionados/modificados/renomeados desde base_ref."""
+    job = BatchJob(owner=owner, repo=repo, ref=ref, mode=normalize_mode(mode),
+                   kind="diff" if base_ref else "full", base_ref=base_ref or None,
+                   include=json.dumps(include or []), exclude=json.dumps(exclude or []),
+                   status="queued")
+    db.add(job)
+    db.commit()
+    start_job(job.id)
+    return job
+
+def cancel_job(db, job: BatchJob):
+    if job.status in ACTIVE_STATUSES:
+        job.status = "cancelled"
+        job.finished_at = _utcnow()
+        db.commit()
+
+def start_job(job_id: int) -> bool:
+    """Dispara o job numa thread própria (no máximo uma por job neste processo)."""
+    with _running_lock:
+        if job_id in _running:
+            return False
+        _running.add(job_id)
+    threading.Thread(target=_run_job, args=(job_id,), name=f"batch-job-{job_id}", daemon=True).start()
+    return True
+
+def resume_pending_jobs() -> list[int]:
+    """Retoma jobs ativos sem dono vivo (heartbeat antigo), ex.: após um restart."""
+    db = SessionLocal()
+    try:
+        stale = _utcnow() - timedelta(seconds=HEARTBEAT_STALE_SECONDS)
+        ids = [jid for (jid,) in db.query(BatchJob.id).filter(
+            BatchJob.status.in_(ACTIVE_STATUSES),
+            or_(BatchJob.heartbeat_at.is_(None), BatchJob.heartbeat_at < stale),
+        ).all()]
+    finally:
+        SessionLocal.remove()
+    return [jid for jid in ids if start_job(jid)]
+
+def ensure_supervisor():
+    """Thread que periodicamente retoma jobs órfãos (idempotente)."""
+    global _supervisor
+    with _running_lock:
+        if _supervisor is not None:
+            return
+        _supervisor = threading.Thread(target=_supervise, name="batch-supervisor", daemon=True)
+    _supervisor.start()
+
+def job_to_dict(job: BatchJob) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "owner": job.owner,
+        "repo": job.repo,
+        "ref": job.ref,
+        "sha": job.sha,
+        "base_ref": job.base_ref,
+        "base_sha": job.base_sha,
+        "mode": job.mode,
+        "include": json.loads(job.include or "[]"),
+        "exclude": json.loads(job.exclude or "[]"),
+        "status": job.status,
+        "error": job.error,
+        "progress": {
+            "total": job.total,
+            "done": job.done,
+            "failed": job.failed,
+            "cached": job.cached,
+            "reused_units": job.reused_units,
+            "pending": max(0, job.total - job.done - job.failed),
+        },
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+def file_to_dict(f: BatchJobFile, with_result: bool = False) -> dict:
+    out = {
+        "id": f.id,
+        "path": f.path,
+        "blob_sha": f.blob_sha,
+        "size": f.size,
+        "language": f.language,
+        "change": f.change,
+        "previous_path": f.previous_path,
+        "status": f.status,
+        "cache_status": f.cache_status,
+        "attempts": f.attempts,
+        "error": f.error,
+    }
+    if with_result:
+        out["analysis"] = json.loads(f.result) if f.result else None
+    return out
+
+# ------------------ execução ------------------
+
+def _supervise():
+    while True:
+        try:
+            resume_pending_jobs()
+        except Exception as e:
+            log.exception("batch supervisor: %s", e)
+        time.sleep(BATCH_SUPERVISOR_INTERVAL)
+
+# Escritas do job vão todas pelo escritor único (DB_WRITER), como em /docs/analyze:
+# a thread do job só lê na própria sessão. Assim jobs simultâneos e requisições não
+# disputam o lock de escrita nem correm nos check-then-insert de save_analysis.
+
+def _claim_op(db, job_id: int) -> bool:
+    """UPDATE condicional: só um processo assume o job (dono ausente ou heartbeat vencido)."""
+    stale = _utcnow() - timedelta(seconds=HEARTBEAT_STALE_SECONDS)
+    res = db.execute(
+        update(BatchJob)
+        .where(BatchJob.id == job_id,
+               BatchJob.status.in_(ACTIVE_STATUSES),
+               or_(BatchJob.worker_id.is_(None), BatchJob.worker_id == WORKER_ID,
+                   BatchJob.heartbeat_at.is_(None), BatchJob.heartbeat_at < stale))
+        .values(worker_id=WORKER_ID, heartbeat_at=_utcnow())
+    )
+    return res.rowcount == 1
+
+def _update_job_op(db, job_id: int, values: dict):
+    db.execute(update(BatchJob).where(BatchJob.id == job_id).values(**values))
+
+def _update_job(db, job: BatchJob, **values):
+    """Grava campos do job pelo escritor único e recarrega o objeto desta sessão."""
+    DB_WRITER.submit_wait(_update_job_op, job.id, values, timeout=None)
+    db.refresh(job)
+
+def _run_job(job_id: int):
+    db = SessionLocal()
+    try:
+        if not DB_WRITER.submit_wait(_claim_op, job_id, timeout=None):
+            return
+        job = db.get(BatchJob, job_id)
+        token = get_github_token()
+        if not token:
+            _finish_job(db, job, "failed", "Token do GitHub não configurado.")
+            return
+        gh = get_client(token, priority=BATCH)
+        if job.sha is None or job.status in ("queued", "enumerating"):
+            _enumerate(db, gh, job)
+        _update_job(db, job, status="running")
+        _process_files(db, gh, job)
+    except Exception as e:
+        db.rollback()
+        job = db.get(BatchJob, job_id)
+        if job is not None:
+            _finish_job(db, job, "failed", str(e))
+    finally:
+        SessionLocal.remove()
+        with _running_lock:
+            _running.discard(job_id)
+
+def _finish_job(db, job: BatchJob, status: str, error: str | None = None):
+    _update_job(db, job, status=status, error=error, finished_at=_utcnow(), worker_id=None)
+
+def _enumerate(db, gh: GitHubClient, job: BatchJob):
+    """Fixa o sha do ref e cria um BatchJobFile por arquivo analisável (idempotente)."""
+    _update_job(db, job, status="enumerating")
+
+    GITHUB_BUCKET.acquire()
+    sha = job.sha or REF_RESOLVER.resolve(gh, job.owner, job.repo, job.ref)
+    index = get_complete_tree_index(gh, job.owner, job.repo, sha)
+    include, exclude = json.loads(job.include or "[]"), json.loads(job.exclude or "[]")
+    changes = _diff_changes(gh, job, sha) if job.kind == "diff" else None
+
+    known = {p for (p,) in db.query(BatchJobFile.path).filter(BatchJobFile.job_id == job.id)}
+    rows = []
+    for e in index.iter_files(extensions=ANALYZABLE_EXTS):
+        path = e["path"]
+        if path in known or not _matches(path, include, exclude):
+            continue
+        det = detect_language(path, None)
+        if det.language == "unknown":
+            continue
+        extra = {}
+        if changes is not None:
+            extra = _diff_entry(changes, path, e.get("sha"))
+            if extra is None:
+                continue  # inalterado: a análise anterior (cache por blob) continua valendo
+        rows.append({"job_id": job.id, "path": path, "blob_sha": e.get("sha"), "size": e.get("size"),
+                     "language": det.language, "status": "pending", "attempts": 0, **extra})
+        known.add(path)
+
+    DB_WRITER.submit_wait(_enumerated_op, job.id, rows, sha, len(known), timeout=None)
+    db.refresh(job)
+
+def _enumerated_op(db, job_id: int, rows: list[dict], sha: str, total: int):
+    if rows:
+        db.execute(insert(BatchJobFile), rows)
+    _update_job_op(db, job_id, {"sha": sha, "total": total})
+
+def _diff_changes(gh: GitHubClient, job: BatchJob, sha: str) -> dict:
+    """
+    Tudo o que o diff precisa de base_ref -> sha: a árvore da base (quem mudou de
+    blob) e o compare (renomeações e hunks). O compare pode omitir arquivos/patches
+    em diffs enormes; aí o arquivo é reanalisado por inteiro.
+    """
+    GITHUB_BUCKET.acquire()
+    base_sha = job.base_sha or REF_RESOLVER.resolve(gh, job.owner, job.repo, job.base_ref)
+    job.base_sha = base_sha
+    base_index = get_complete_tree_index(gh, job.owner, job.repo, base_sha)
+    GITHUB_BUCKET.acquire()
+    files = gh.compare(job.owner, job.repo, base_sha, sha).get("files") or []
+    return {"base_index": base_index, "files": {f.get("filename"): f for f in files}}
+
+def _diff_entry(changes: dict, path: str, blob_sha: str | None) -> dict | None:
+    """Colunas do BatchJobFile de um arquivo do head; None se o blob não mudou."""
+    info = changes["files"].get(path) or {}
+    previous = info.get("previous_filename") if info.get("status") in ("renamed", "copied") else None
+    base_index = changes["base_index"]
+    node = base_index.lookup(previous or path)
+    base_blob = base_index.entry(node).get("sha") if node is not None else None
+    if base_blob is not None and base_blob == blob_sha:
+        return None
+    if base_blob is None:
+        change = "added"
+    else:
+        change = "renamed" if previous else "modified"
+    hunks = parse_hunks(info.get("patch")) if base_blob else []
+    return {"change": change, "previous_path": previous, "base_blob_sha": base_blob,
+            "hunks": json.dumps(hunks) if hunks else None}
+
+def _use_tarball(pending: int) -> bool:
+    if BATCH_FETCH_MODE == "tarball":
+        return True
+    return BATCH_FETCH_MODE == "auto" and pending >= BATCH_TARBALL_MIN_FILES
+
+def _ingest(gh: GitHubClient, job: BatchJob) -> bool:
+    """Baixa o tarball do commit para o blob store (uma vez por sha). False se falhar."""
+    try:
+        if not BLOB_STORE.has_commit(job.sha):
+            GITHUB_BUCKET.acquire()
+        ingest_commit(gh, job.owner, job.repo, job.sha)
+        return True
+    except Exception as e:
+        log.warning("batch %s: tarball indisponível, usando contents API: %s", job.id, e)
+        return False
+
+def _fetch(gh: GitHubClient, job: BatchJob, path: str, blob_sha: str | None = None) -> dict:
+    if BLOB_STORE.has(blob_sha):
+        return BLOB_STORE.file_view(blob_sha, path)
+    GITHUB_BUCKET.acquire()
+    if blob_sha:
+        return fetch_blob_view(gh, job.owner, job.repo, path, blob_sha)
+    return gh.get_file_content(job.owner, job.repo, path, job.sha)
+
+def _analyze(fv: dict, path: str, mode: str, base_units: list[dict] | None = None, hunks: list | None = None):
+    """
+    (detecção, unidades, unidades reaproveitadas da base, status do cache). Passa
+    pelo single-flight: se uma requisição ou outro job já analisa o mesmo blob,
+    espera e reaproveita; senão analisa e grava no cache antes de liberar a chave.
+    """
+    code = fv.get("text") or ""
+    det = detect_language(path, code)
+    key, model, version = cache_key_for(fv.get("sha"), det.language, mode)
+    with SINGLE_FLIGHT.flight(key, lambda: lookup_cached_units(key)) as flight:
+        if flight.result is not None:
+            return det, flight.result, 0, "shared"
+        if llm_enabled() and det.language != "cobol":  # COBOL usa o parser local
+            LLM_BUCKET.acquire()
+        if base_units and hunks:
+            units, reused = reanalyze_units(code, det.language, path, base_units, [tuple(h) for h in hunks])
+        else:
+            units, reused = analyze_units(code, det.language, path, mode=mode), 0
+        # pelo escritor único: o worker não abre sessão de escrita (ver _process_files)
+        store_units(key, blob_sha=fv.get("sha"), language=det.language, mode=mode,
+                    model=model, version=version, units=units)
+        flight.set(units)
+        return det, units, reused, "partial" if reused else "miss"
+
+def _process_files(db, gh: GitHubClient, job: BatchJob):
+    """
+    Pipeline em dois estágios: pool de fetch (GitHub) -> pool de LLM.
+    Esta thread só lê na sua sessão; resultados, falhas e heartbeat (e o cache de
+    análises, gravado pelos workers) vão para o banco pelo escritor único (DB_WRITER).
+    """
+    mode = normalize_mode(job.mode)
+    queue = deque(db.query(BatchJobFile).filter(
+        BatchJobFile.job_id == job.id, BatchJobFile.status == "pending",
+    ).order_by(BatchJobFile.id).all())
+
+    # muitos arquivos: um tarball só em vez de uma chamada 'contents' por arquivo
+    if queue and _use_tarball(len(queue)):
+        _ingest(gh, job)
+
+    fetch_pool = ThreadPoolExecutor(BATCH_FETCH_WORKERS, thread_name_prefix=f"batch{job.id}-fetch")
+    llm_pool = ThreadPoolExecutor(BATCH_LLM_WORKERS, thread_name_prefix=f"batch{job.id}-llm")
+    max_inflight = BATCH_FETCH_WORKERS + 2 * BATCH_LLM_WORKERS  # limita conteúdo em memória
+    inflight: dict = {}
+    base_units: dict[int, list[dict]] = {}  # diff: unidades do blob anterior, por BatchJobFile.id
+    last_beat = time.monotonic()
+    try:
+        while queue or inflight:
+            while queue and len(inflight) < max_inflight:
+                f = queue.popleft()
+                key, model, version = cache_key_for(f.blob_sha, f.language, mode)
+                units = get_cached_units(db, key) if key else None
+                if units is not None:
+                    det = detect_language(f.path, None)
+                    if _file_done(db, job, f, det, units, "hit", blob_sha=f.blob_sha, size=f.size):
+                        queue.append(f)
+                    continue
+                if f.hunks and f.base_blob_sha:
+                    base_key, _, _ = cache_key_for(f.base_blob_sha, f.language, mode)
+                    previous = get_cached_units(db, base_key)
+                    if previous is not None:
+                        base_units[f.id] = previous
+                inflight[fetch_pool.submit(_fetch, gh, job, f.path, f.blob_sha)] = ("fetch", f)
+
+            if inflight:
+                done, _ = wait(list(inflight), timeout=HEARTBEAT_SECONDS, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    stage, f = inflight.pop(fut)
+                    f, fv = f if stage == "llm" else (f, None)
+                    try:
+                        value = fut.result()
+                    except Exception as e:
+                        if _file_failed(db, job, f, str(e)):
+                            queue.append(f)
+                        continue
+                    if stage == "fetch":
+                        if not value or value.get("type") != "file" or not value.get("is_text"):
+                            # binário/diretório: não adianta tentar de novo
+                            _file_failed(db, job, f, "Arquivo não é texto ou não foi possível obter conteúdo.",
+                                         permanent=True)
+                            continue
+                        hunks = json.loads(f.hunks) if f.id in base_units else None
+                        inflight[llm_pool.submit(_analyze, value, f.path, mode, base_units.get(f.id), hunks)] = \
+                            ("llm", (f, value))
+                    else:
+                        det, units, reused, cache_status = value  # já gravado no cache pelo worker
+                        base_units.pop(f.id, None)
+                        if _file_done(db, job, f, det, units, cache_status, reused=reused,
+                                      blob_sha=fv.get("sha"), size=fv.get("size")):
+                            queue.append(f)
+
+            if time.monotonic() - last_beat >= HEARTBEAT_SECONDS:
+                last_beat = time.monotonic()
+                _update_job(db, job, heartbeat_at=_utcnow())
+                if job.status == "cancelled":
+                    return
+    finally:
+        fetch_pool.shutdown(wait=False, cancel_futures=True)
+        llm_pool.shutdown(wait=False, cancel_futures=True)
+
+    db.refresh(job)
+    if job.status != "cancelled":
+        _finish_job(db, job, "done")
+
+def _file_done(db, job: BatchJob, f: BatchJobFile, det, units: list[dict], cache_status: str,
+               *, reused: int = 0, blob_sha: str | None, size: int | None) -> bool:
+    """Valida e grava o resultado; True se a gravação falhou e o arquivo deve ser re-tentado."""
+    analysis = build_analysis(owner=job.owner, repo=job.repo, ref=job.ref, path=f.path,
+                              blob_sha=blob_sha, size=size, det=det, units=units)
+    try:
+        validate_analysis(analysis)  # como em POST /docs/analyze: só análises válidas vão para o armazém
+    except ValidationError as e:
+        _file_failed(db, job, f, f"Saída não compatível com schema: {e.message}", permanent=True)
+        return False
+    try:
+        DB_WRITER.submit_wait(_file_done_op, job.id, f.id, analysis, sha=job.sha, mode=job.mode,
+                              cache_status=cache_status, reused=reused, timeout=None)
+    except Exception as e:  # falha de um arquivo não derruba o job
+        log.warning("batch %s: falha ao gravar %s: %s", job.id, f.path, e)
+        return _file_failed(db, job, f, f"Falha ao gravar análise: {e}")
+    return False
+
+def _file_done_op(db, job_id: int, file_id: int, analysis: dict, *, sha: str, mode: str,
+                  cache_status: str, reused: int):
+    save_analysis(db, analysis, sha=sha, mode=mode, commit=False)
+    db.execute(update(BatchJobFile).where(BatchJobFile.id == file_id).values(
+        result=json.dumps(analysis, ensure_ascii=False), status="done", cache_status=cache_status, error=None))
+    db.execute(update(BatchJob).where(BatchJob.id == job_id).values(
+        done=BatchJob.done + 1,
+        cached=BatchJob.cached + (1 if cache_status in ("hit", "shared") else 0),  # sem chamada ao LLM
+        reused_units=BatchJob.reused_units + reused))
+
+def _file_failed(db, job: BatchJob, f: BatchJobFile, error: str, permanent: bool = False) -> bool:
+    """Registra a falha; True se o arquivo ainda deve ser re-tentado."""
+    return DB_WRITER.submit_wait(_file_failed_op, job.id, f.id, error, permanent, timeout=None)
+
+def _file_failed_op(db, job_id: int, file_id: int, error: str, permanent: bool) -> bool:
+    f = db.get(BatchJobFile, file_id)
+    f.attempts = (f.attempts or 0) + 1
+    f.error = error[:2000]
+    retry = not permanent and f.attempts < BATCH_MAX_ATTEMPTS
+    if not retry:
+        f.status = "failed"
+        db.execute(update(BatchJob).where(BatchJob.id == job_id).values(failed=BatchJob.failed + 1))
+    return retry
@@ -0,0 +1,226 @@
+from __future__ import annotations
+import hashlib
+import io
+import json
+import mmap
+import os
+import tarfile
+import tempfile
+import threading
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Dict, Iterator, Tuple
+from services.textdecode import file_view_from_bytes
+
+# Armazém local de blobs endereçado pelo sha do git ("blob <tamanho>\0" + conteúdo),
+# o mesmo sha que vem na árvore do GitHub. Permite baixar o tarball de um commit uma
+# vez e ler os arquivos do disco nas análises seguintes.
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "data/blobs")
+BLOB_MMAP_THRESHOLD = int(os.getenv("BLOB_MMAP_THRESHOLD", str(1024 * 1024)))
+# Diretório com arquivos <sha do commit>.tar.gz/.tgz/.zip usados no lugar do download
+BLOB_ARCHIVE_DIR = os.getenv("BLOB_ARCHIVE_DIR", "")
+
+_COPY_CHUNK = 1024 * 1024
+
+def git_blob_sha(data: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+class BlobStore:
+    """
+    Layout: <root>/objects/ab/cdef... (conteúdo cru) e <root>/commits/<sha>.json
+    (manifesto caminho -> [blob sha, tamanho] de um commit já ingerido).
+    Escritas são atômicas (arquivo temporário + os.replace), então leitores
+    concorrentes nunca veem um blob pela metade.
+    """
+    def __init__(self, root: str | Path = BLOB_STORE_DIR, mmap_threshold: int = BLOB_MMAP_THRESHOLD):
+        self.root = Path(root)
+        self.mmap_threshold = mmap_threshold
+        self._lock = threading.Lock()
+        self._stats = {"puts": 0, "dedup": 0, "reads": 0, "bytes_written": 0}
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    # ---------- blobs ----------
+    def path_for(self, sha: str) -> Path:
+        return self.root / "objects" / sha[:2] / sha[2:]
+
+    def has(self, sha: str | None) -> bool:
+        return bool(sha) and self.path_for(sha).is_file()
+
+    def put_stream(self, src: IO[bytes], size: int) -> str:
+        """Grava 'size' bytes de src calculando o sha do git no caminho (sem carregar tudo)."""
+        tmp_dir = self.root / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        h = hashlib.sha1(b"blob %d\0" % size)
+        fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                remaining = size
+                while remaining > 0:
+                    buf = src.read(min(_COPY_CHUNK, remaining))
+                    if not buf:
+                        raise IOError("conteúdo truncado")
+                    h.update(buf)
+                    out.write(buf)
+                    remaining -= len(buf)
+            sha = h.hexdigest()
+            dest = self.path_for(sha)
+            if dest.exists():
+                self._count("dedup")
+                os.unlink(tmp)
+            else:
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp, dest)
+                self._count("puts")
+                self._count("bytes_written", size)
+            return sha
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def put_bytes(self, data: bytes) -> str:
+        return self.put_stream(io.BytesIO(data), len(data))
+
+    @contextmanager
+    def open_blob(self, sha: str) -> Iterator[bytes | mmap.mmap]:
+        """Conteúdo do blob: bytes em arquivos pequenos, mmap (somente leitura) nos grandes."""
+        path = self.path_for(sha)
+        self._count("reads")
+        size = path.stat().st_size
+        if size < self.mmap_threshold or size == 0:
+            yield path.read_bytes()
+            return
+        with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+    def read_bytes(self, sha: str) -> bytes:
+        with self.open_blob(sha) as data:
+            return bytes(data)
+
+    def file_view(self, sha: str, path: str) -> dict:
+        """Mesmo formato de GitHubClient.get_file_content, lido do disco."""
+        with self.open_blob(sha) as data:
+            # decode_text olha os primeiros KB e decodifica direto do mmap: binários não são
+            # lidos inteiros e texto grande não passa por uma cópia em bytes
+            return file_view_from_bytes(data, path=path, sha=sha, size=len(data), source="blob_store")
+
+    # ---------- commits ----------
+    def _manifest_path(self, commit_sha: str) -> Path:
+        return self.root / "commits" / f"{commit_sha}.json"
+
+    def has_commit(self, commit_sha: str) -> bool:
+        return self._manifest_path(commit_sha).is_file()
+
+    def manifest(self, commit_sha: str) -> Dict[str, Tuple[str, int]] | None:
+        p = self._manifest_path(commit_sha)
+        if not p.is_file():
+            return None
+        return {k: tuple(v) for k, v in json.loads(p.read_text(encoding="utf-8")).items()}
+
+    def save_manifest(self, commit_sha: str, manifest: Dict[str, Tuple[str, int]]):
+        p = self._manifest_path(commit_sha)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_suffix(".tmp")
+        tmp.write_text(json.dumps(manifest), encoding="utf-8")
+        os.replace(tmp, p)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "root": str(self.root)}
+
+BLOB_STORE = BlobStore()
+
+# ------------------ ingestão de arquivos compactados ------------------
+
+def _strip_root(name: str, root: str | None) -> str:
+    if root and name.startswith(root + "/"):
+        return name[len(root) + 1:]
+    return name
+
+def ingest_tar_stream(store: BlobStore, fileobj: IO[bytes]) -> Dict[str, Tuple[str, int]]:
+    """
+    Extrai um tar (gz/bz2/xz ou cru) em modo stream ('r|*': sem seek, sem carregar o
+    arquivo todo) direto para o store. Remove o diretório raiz que o GitHub coloca
+    (owner-repo-sha/). Retorna o manifesto caminho -> (blob sha, tamanho).
+    """
+    manifest: Dict[str, Tuple[str, int]] = {}
+    root = None
+    first = True
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+        for member in tar:
+            if member.type in (tarfile.XGLTYPE, tarfile.XHDTYPE):
+                continue
+            name = member.name.strip("/")
+            while name.startswith("./"):
+                name = name[2:]
+            if not name or name == ".":
+                continue
+            if first:
+                first = False
+                if member.isdir() and "/" not in name:
+                    root = name
+                    continue
+            if not member.isreg():
+                continue  # diretórios, links, submódulos
+            src = tar.extractfile(member)
+            if src is None:
+                continue
+            manifest[_strip_root(name, root)] = (store.put_stream(src, member.size), member.size)
+    return manifest
+
+def ingest_zip(store: BlobStore, path: str | Path) -> Dict[str, Tuple[str, int]]:
+    """Zipball (precisa de arquivo local: o índice do zip fica no final)."""
+    manifest: Dict[str, Tuple[str, int]] = {}
+    with zipfile.ZipFile(path) as zf:
+        names = [i.filename for i in zf.infolist()]
+        top = {n.split("/", 1)[0] for n in names}
+        root = top.pop() if len(top) == 1 and all("/" in n for n in names) else None
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            with zf.open(info) as src:
+                manifest[_strip_root(info.filename, root)] = (store.put_stream(src, info.file_size), info.file_size)
+    return manifest
+
+def ingest_archive(store: BlobStore, path: str | Path, commit_sha: str | None = None) -> Dict[str, Tuple[str, int]]:
+    """Ingere um .tar(.gz) ou .zip local; com commit_sha, grava o manifesto do commit."""
+    path = Path(path)
+    if path.suffix == ".zip":
+        manifest = ingest_zip(store, path)
+    else:
+        with path.open("rb") as f:
+            manifest = ingest_tar_stream(store, f)
+    if commit_sha:
+        store.save_manifest(commit_sha, manifest)
+    return manifest
+
+def _local_archive(commit_sha: str) -> Path | None:
+    if not BLOB_ARCHIVE_DIR:
+        return None
+    for ext in (".tar.gz", ".tgz", ".tar", ".zip"):
+        p = Path(BLOB_ARCHIVE_DIR) / f"{commit_sha}{ext}"
+        if p.is_file():
+            return p
+    return None
+
+def ingest_commit(gh, owner: str, repo: str, commit_sha: str, store: BlobStore = BLOB_STORE
+                  ) -> Dict[str, Tuple[str, int]]:
+    """
+    Garante que todos os arquivos do commit estão no store: usa o manifesto se o
+    commit já foi ingerido, senão um arquivo local (BLOB_ARCHIVE_DIR) ou o tarball
+    do GitHub, lido em stream direto da resposta HTTP.
+    """
+    existing = store.manifest(commit_sha)
+    if existing is not None:
+        return existing
+    local = _local_archive(commit_sha)
+    if local is not None:
+        return ingest_archive(store, local, commit_sha)
+    with gh.open_tarball(owner, repo, commit_sha) as raw:
+        manifest = ingest_tar_stream(store, raw)
+    store.save_manifest(commit_sha, manifest)
+    return manifest
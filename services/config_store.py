@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+from models.config import Config
+from services.crypto import decrypt
+from services.db import session_scope
+
+# Cache em memória da tabela config e do token do GitHub já descriptografado: evita
+# uma query + Fernet.decrypt a cada página. Escritas por set_config_value invalidam
+# na hora; o TTL limita quanto tempo outro processo pode ver um valor antigo.
+CONFIG_CACHE_TTL = float(os.getenv("CONFIG_CACHE_TTL", "300"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "600"))
+
+_MISSING = object()
+_cache: dict = {}  # chave -> (valor, expira em monotonic)
+_generation = 0  # incrementado a cada escrita: leituras concorrentes não repõem valor velho
+_lock = threading.Lock()
+
+def _cached(key):
+    with _lock:
+        hit = _cache.get(key)
+        if hit is not None and hit[1] > time.monotonic():
+            return hit[0]
+    return _MISSING
+
+def _store(key, value, ttl: float, generation: int):
+    if ttl <= 0:
+        return
+    with _lock:
+        if generation == _generation:
+            _cache[key] = (value, time.monotonic() + ttl)
+
+def invalidate_config(key: str | None = None):
+    global _generation
+    with _lock:
+        _generation += 1
+        if key is None:
+            _cache.clear()
+        else:
+            _cache.pop(key, None)
+            _cache.pop(("decrypted", key), None)
+
+def get_config_value(db, key: str) -> str | None:
+    value = _cached(key)
+    if value is not _MISSING:
+        return value
+    generation = _generation
+    item = db.query(Config).filter(Config.key == key).one_or_none()
+    value = item.value if item else None
+    _store(key, value, CONFIG_CACHE_TTL, generation)
+    return value
+
+def set_config_value(db, key: str, value: str | None):
+    item = db.query(Config).filter(Config.key == key).one_or_none()
+    if item:
+        item.value = value
+    else:
+        item = Config(key=key, value=value)
+        db.add(item)
+    db.commit()
+    invalidate_config(key)
+
+def get_config(key: str) -> str | None:
+    """get_config_value com sessão própria (só abre conexão em cache miss)."""
+    value = _cached(key)
+    if value is not _MISSING:
+        return value
+    with session_scope() as db:
+        return get_config_value(db, key)
+
+def get_secret(key: str) -> str | None:
+    """Valor descriptografado de uma chave cifrada (ex.: github_token), com TTL próprio."""
+    ck = ("decrypted", key)
+    value = _cached(ck)
+    if value is not _MISSING:
+        return value
+    generation = _generation
+    enc = get_config(key)
+    value = decrypt(enc) if enc else None
+    _store(ck, value, TOKEN_CACHE_TTL, generation)
+    return value
+
+def get_github_token() -> str | None:
+    return get_secret("github_token")
@@ -0,0 +1,126 @@
+from __future__ import annotations
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, List, Tuple
+from sqlalchemy import insert
+from services.db import SessionFactory
+
+# Escritor único: threads de requisição/workers enfileiram operações e uma thread
+# dedicada as executa em lote, numa transação e um commit por lote (group commit).
+# No SQLite isso elimina a disputa pelo lock de escrita; em Postgres só reduz commits.
+
+log = logging.getLogger(__name__)
+
+DB_WRITER_BATCH = int(os.getenv("DB_WRITER_BATCH", "200"))        # operações por commit
+DB_WRITER_LINGER_MS = float(os.getenv("DB_WRITER_LINGER_MS", "5"))  # espera por mais operações antes do commit
+DB_WRITER_TIMEOUT = float(os.getenv("DB_WRITER_TIMEOUT", "30"))     # submit_wait(): espera máxima pelo commit
+
+Op = Tuple[Callable[..., Any], tuple, dict, Future]
+
+def insert_many(table, rows: List[dict]):
+    """Operação de escrita: INSERT em lote (executemany) numa tabela/modelo."""
+    def op(db):
+        if rows:
+            db.execute(insert(table), rows)
+        return len(rows)
+    return op
+
+class DbWriter:
+    def __init__(self, batch_size: int = DB_WRITER_BATCH, linger_ms: float = DB_WRITER_LINGER_MS,
+                 session_factory=SessionFactory):
+        self.batch_size = batch_size
+        self.linger = linger_ms / 1000
+        self.session_factory = session_factory
+        self._queue: "queue.Queue[Op]" = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._stats = {"ops": 0, "commits": 0, "failed": 0, "retried_alone": 0}
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """
+        Enfileira fn(db, *args, **kwargs). O Future resolve com o retorno de fn
+        depois do commit do lote (ou com a exceção, se a operação falhar).
+        fn não deve chamar db.commit().
+        """
+        fut: Future = Future()
+        self._queue.put((fn, args, kwargs, fut))
+        self._ensure_thread()
+        return fut
+
+    def submit_wait(self, fn: Callable[..., Any], *args, timeout: float | None = DB_WRITER_TIMEOUT, **kwargs) -> Any:
+        return self.submit(fn, *args, **kwargs).result(timeout)
+
+    def _drain(self, first: Op) -> List[Op]:
+        ops = [first]
+        while len(ops) < self.batch_size:
+            try:
+                ops.append(self._queue.get(timeout=self.linger) if self.linger else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return ops
+
+    def _run(self):
+        while True:
+            ops = self._drain(self._queue.get())
+            try:
+                self._apply(ops)
+            except Exception:  # nunca deixa a thread morrer
+                log.exception("db-writer: falha inesperada")
+                for *_, fut in ops:
+                    if not fut.done():
+                        fut.set_exception(RuntimeError("db-writer falhou"))
+
+    def _apply(self, ops: List[Op]):
+        db = self.session_factory()
+        try:
+            results = []
+            try:
+                for fn, args, kwargs, _ in ops:
+                    results.append(fn(db, *args, **kwargs))
+                db.commit()
+            except Exception:
+                db.rollback()
+                # uma operação ruim não derruba o lote: refaz cada uma sozinha
+                self._count("retried_alone", len(ops))
+                for op in ops:
+                    self._apply_one(db, op)
+                return
+            self._count("ops", len(ops))
+            self._count("commits")
+            for (*_, fut), res in zip(ops, results):
+                fut.set_result(res)
+        finally:
+            db.close()
+
+    def _apply_one(self, db, op: Op):
+        fn, args, kwargs, fut = op
+        try:
+            res = fn(db, *args, **kwargs)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self._count("failed")
+            fut.set_exception(e)
+            return
+        self._count("ops")
+        self._count("commits")
+        fut.set_result(res)
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "queued": self._queue.qsize()}
+
+DB_WRITER = DbWriter()
@@ -0,0 +1,200 @@
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy import insert, tuple_
+from sqlalchemy.exc import OperationalError
+from models.analysis_store import Analysis
+from models.diagram_cache import AnalysisDiagram, DiagramCacheEntry
+from services.db import session_scope
+from services.db_writer import DB_WRITER
+from services.diagram.mermaid import MERMAID_VERSION, render_unit
+
+# Cache de diagramas Mermaid por conteúdo da unidade: hash do JSON canônico dos
+# campos que o gerador lê + MERMAID_VERSION -> (tipo, código). Primeiro um LRU em
+# memória, depois a tabela diagram_cache (uma consulta IN por lote), e só o que
+# faltar é gerado; os novos vão para o banco pelo escritor único, sem esperar o commit.
+# Análises gravadas ganham ainda um índice (analysis_diagrams) com o hash de cada
+# unidade: da segunda vez em diante, seus diagramas saem de um join, sem payload.
+
+log = logging.getLogger(__name__)
+
+DIAGRAM_CACHE_MAX_ENTRIES = int(os.getenv("DIAGRAM_CACHE_MAX_ENTRIES", "10000"))  # LRU em memória
+DIAGRAM_CACHE_DB = os.getenv("DIAGRAM_CACHE_DB", "1").lower() in ("1", "true", "yes")
+_IN_CHUNK = 500  # chaves por consulta IN (limite de variáveis do SQLite)
+
+Rendered = Tuple[str, str]  # (tipo, código)
+
+# Só o que o gerador lê (mermaid.render_unit + heuristics); purpose, riscos, evidências
+# etc. ficam fora do hash, que assim custa menos que gerar o diagrama.
+# unit_id/unit_name não fazem parte do valor cacheado: vêm da própria unidade.
+_HASHED_FIELDS = ("kind", "diagram_suggestion", "logic", "io")
+
+def unit_hash(unit: dict) -> str:
+    raw = json.dumps([unit.get(k) for k in _HASHED_FIELDS], sort_keys=True, ensure_ascii=False,
+                     separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{MERMAID_VERSION}|{raw}".encode("utf-8")).hexdigest()
+
+def _insert_ignore(db, model, rows: List[dict]) -> int:
+    """INSERT ignorando chaves já gravadas (outra requisição/processo pode ter gravado o mesmo)."""
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        db.execute(dialect_insert(model).on_conflict_do_nothing(), rows)
+        return len(rows)
+    pk = model.__table__.primary_key.columns.values()
+    have = set(db.query(*pk).filter(tuple_(*pk).in_([tuple(r[c.name] for c in pk) for r in rows])).all())
+    rows = [r for r in rows if tuple(r[c.name] for c in pk) not in have]
+    if rows:
+        db.execute(insert(model), rows)
+    return len(rows)
+
+class DiagramCache:
+    def __init__(self, max_entries: int = DIAGRAM_CACHE_MAX_ENTRIES, use_db: bool = DIAGRAM_CACHE_DB):
+        self.max_entries = max_entries
+        self.use_db = use_db
+        self._items: "OrderedDict[str, Rendered]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "db_hits": 0, "rendered": 0, "stored": 0, "store_failed": 0,
+                       "indexed_hits": 0, "indexed_analyses": 0}
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _remember(self, items: Dict[str, Rendered]):
+        with self._lock:
+            for h, value in items.items():
+                self._items[h] = value
+                self._items.move_to_end(h)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def _from_db(self, hashes: List[str]) -> Dict[str, Rendered]:
+        found: Dict[str, Rendered] = {}
+        try:
+            with session_scope() as db:
+                for i in range(0, len(hashes), _IN_CHUNK):
+                    rows = (db.query(DiagramCacheEntry.unit_hash, DiagramCacheEntry.type, DiagramCacheEntry.code)
+                              .filter(DiagramCacheEntry.unit_hash.in_(hashes[i:i + _IN_CHUNK])).all())
+                    found.update((h, (t, c)) for h, t, c in rows)
+        except OperationalError as e:
+            log.warning("cache de diagramas: tabela indisponível (%s); gerando sem cache", e)
+        return found
+
+    def _write(self, model, rows: List[dict], counter: str | None = None):
+        fut = DB_WRITER.submit(_insert_ignore, model, rows)
+
+        def done(f):
+            if f.exception() is not None:
+                self._count("store_failed")
+                log.warning("cache de diagramas: falha ao gravar %d linhas em %s: %s",
+                            len(rows), model.__tablename__, f.exception())
+            elif counter:
+                self._count(counter, f.result())
+        fut.add_done_callback(done)
+
+    def lookup(self, units: Iterable[dict], hashes: List[str] | None = None) -> List[Rendered]:
+        """(tipo, código) de cada unidade, na ordem: memória -> banco -> gerador."""
+        units = list(units)
+        hashes = hashes or [unit_hash(u) for u in units]
+        found: Dict[str, Rendered] = {}
+        with self._lock:
+            for h in hashes:
+                value = self._items.get(h)
+                if value is not None:
+                    self._items.move_to_end(h)
+                    found[h] = value
+        self._count("memory_hits", sum(1 for h in hashes if h in found))
+
+        missing = list(dict.fromkeys(h for h in hashes if h not in found))
+        if missing and self.use_db:
+            from_db = self._from_db(missing)
+            if from_db:
+                self._remember(from_db)
+                found.update(from_db)
+                self._count("db_hits", sum(1 for h in hashes if h in from_db))
+
+        new: Dict[str, Rendered] = {}
+        for h, u in zip(hashes, units):
+            if h not in found:
+                found[h] = new[h] = render_unit(u)
+        if new:
+            self._count("rendered", len(new))
+            self._remember(new)
+            if self.use_db:
+                self._write(DiagramCacheEntry, [{"unit_hash": h, "type": t, "code": c}
+                                                for h, (t, c) in new.items()], "stored")
+        return [found[h] for h in hashes]
+
+    def diagrams(self, units: List[dict], hashes: List[str] | None = None) -> List[dict]:
+        return [{"unit_id": u.get("id"), "unit_name": u.get("name"), "type": t, "code": c}
+                for u, (t, c) in zip(units, self.lookup(units, hashes))]
+
+    def to_mermaid(self, analysis: Dict) -> Dict:
+        """Mesma saída de mermaid.to_mermaid, servida do cache."""
+        return {"diagrams": self.diagrams(analysis.get("units") or [])}
+
+    # ---------- análises gravadas ----------
+    def _indexed(self, db, analysis_ids: List[int]) -> Dict[int, List[dict]]:
+        """Diagramas das análises já indexadas e com todos os diagramas no cache."""
+        counts = dict(db.query(Analysis.id, Analysis.unit_count).filter(Analysis.id.in_(analysis_ids)).all())
+        rows = (db.query(AnalysisDiagram.analysis_id, AnalysisDiagram.unit_id, AnalysisDiagram.unit_name,
+                         DiagramCacheEntry.type, DiagramCacheEntry.code)
+                  .outerjoin(DiagramCacheEntry, DiagramCacheEntry.unit_hash == AnalysisDiagram.unit_hash)
+                  .filter(AnalysisDiagram.analysis_id.in_(analysis_ids),
+                          AnalysisDiagram.version == MERMAID_VERSION)
+                  .order_by(AnalysisDiagram.analysis_id, AnalysisDiagram.position).all())
+        grouped: Dict[int, List[dict]] = {aid: [] for aid, n in counts.items() if n == 0}
+        broken = set()
+        for aid, uid, name, t, c in rows:
+            if c is None:  # diagrama ainda não gravado (ou falhou): refaz pelo payload
+                broken.add(aid)
+            grouped.setdefault(aid, []).append({"unit_id": uid, "unit_name": name, "type": t, "code": c})
+        out = {aid: d for aid, d in grouped.items() if aid not in broken and len(d) == counts.get(aid)}
+        self._count("indexed_hits", sum(len(d) for d in out.values()))
+        return out
+
+    def for_analyses(self, db, analysis_ids: List[int]) -> Dict[int, List[dict]]:
+        """
+        Diagramas de análises gravadas, por id: pelo índice quando existe; senão
+        lê o payload, resolve todas as unidades numa consulta só e indexa.
+        """
+        out: Dict[int, List[dict]] = {}
+        for i in range(0, len(analysis_ids), _IN_CHUNK):
+            chunk = analysis_ids[i:i + _IN_CHUNK]
+            found = self._indexed(db, chunk) if self.use_db else {}
+            missing = [aid for aid in chunk if aid not in found]
+            if missing:
+                payloads = [(aid, json.loads(p)) for aid, p in
+                            db.query(Analysis.id, Analysis.payload).filter(Analysis.id.in_(missing)).all()]
+                per = [a.get("units") or [] for _, a in payloads]
+                units = [u for us in per for u in us]
+                hashes = [unit_hash(u) for u in units]
+                diagrams = iter(self.diagrams(units, hashes))
+                index, pos = [], 0
+                for (aid, _), us in zip(payloads, per):
+                    found[aid] = [next(diagrams) for _ in us]
+                    index += [{"analysis_id": aid, "version": MERMAID_VERSION, "position": n,
+                               "unit_id": d["unit_id"], "unit_name": d["unit_name"], "unit_hash": hashes[pos + n]}
+                              for n, d in enumerate(found[aid])]
+                    pos += len(us)
+                if index and self.use_db:
+                    self._write(AnalysisDiagram, index)
+                    self._count("indexed_analyses", len(payloads))
+            out.update(found)
+        return out
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "entries": len(self._items), "max_entries": self.max_entries,
+                    "db": self.use_db, "version": MERMAID_VERSION}
+
+DIAGRAM_CACHE = DiagramCache()
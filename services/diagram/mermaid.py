@@ -1,9 +1,12 @@
 from __future__ import annotations
 import re
-from typing import Dict, List
+from typing import Dict, List, Tuple
 from services.diagram.heuristics import suggest_diagram_type
 
 MAX_LABEL = 60
+# Versão do gerador: entra na chave do cache de diagramas (services/diagram/cache.py);
+# mude ao alterar a saída de _from_generic_unit/_from_cobol_unit.
+MERMAID_VERSION = "1"
 
 def _clean_label(txt: str) -> str:
     if not txt:
@@ -99,18 +102,22 @@ def _from_cobol_unit(u: dict) -> str:
 
     return "\n".join(lines)
 
+def render_unit(u: dict) -> Tuple[str, str]:
+    """(tipo sugerido, código Mermaid) de uma unidade."""
+    dg_type = u.get("diagram_suggestion") or suggest_diagram_type(u) or "flowchart"
+    if u.get("kind") == "cobol":
+        return dg_type, _from_cobol_unit(u)
+    return dg_type, _from_generic_unit(u)
+
 def to_mermaid(analysis: Dict) -> Dict:
     """
     Recebe um JSON compatível com analysis.schema.json e devolve:
     { "diagrams": [ { "unit_id": "...", "unit_name": "...", "type": "flowchart", "code": "flowchart TD\n..." }, ... ] }
+    Sem cache; as rotas usam DIAGRAM_CACHE.to_mermaid (mesma saída).
     """
     diagrams: List[Dict] = []
     for u in analysis.get("units", []):
-        dg_type = u.get("diagram_suggestion") or suggest_diagram_type(u) or "flowchart"
-        if u.get("kind") == "cobol":
-            code = _from_cobol_unit(u)
-        else:
-            code = _from_generic_unit(u)
+        dg_type, code = render_unit(u)
         diagrams.append({
             "unit_id": u.get("id"),
             "unit_name": u.get("name"),
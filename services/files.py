@@ -0,0 +1,26 @@
+from __future__ import annotations
+from services.blob_store import BLOB_STORE
+from services.github import GitHubClient, blob_file_view
+from services.tree_cache import REF_RESOLVER, get_tree_index
+
+# Leitura de arquivos pelo blob sha da árvore: disco (blob store) primeiro,
+# depois git/blobs em formato raw. O contents API fica só como último recurso.
+
+def fetch_blob_view(gh: GitHubClient, owner: str, repo: str, path: str, blob_sha: str) -> dict:
+    if BLOB_STORE.has(blob_sha):
+        return BLOB_STORE.file_view(blob_sha, path)
+    blob = gh.get_blob_raw(owner, repo, blob_sha)
+    if blob["complete"]:
+        BLOB_STORE.put_bytes(blob["data"])  # imutável: as próximas leituras vêm do disco
+    return blob_file_view(blob, path, blob_sha)
+
+def get_file_view(gh: GitHubClient, owner: str, repo: str, ref: str, path: str) -> dict:
+    """Arquivo no ref, no formato de GitHubClient.get_file_content."""
+    sha = REF_RESOLVER.resolve(gh, owner, repo, ref)
+    index = get_tree_index(gh, owner, repo, sha)
+    node = index.lookup(path.strip("/"))
+    entry = index.entry(node) if node is not None else None
+    if entry is None or entry["type"] != "file" or not entry.get("sha"):
+        # fora do índice (árvore truncada) ou diretório: deixa o contents responder
+        return gh.get_file_content(owner, repo, path, sha)
+    return fetch_blob_view(gh, owner, repo, path, entry["sha"])
@@ -1,86 +1,295 @@
 import base64
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlparse
 import requests
+from services.github_http import SESSION_POOL
+from services.github_ratelimit import GITHUB_RATE_MAX_RETRIES, GITHUB_SCHEDULER, INTERACTIVE, GitHubScheduler
+from services.http_cache import HTTP_CACHE, HttpCache, cache_entry_from_response
+from services.textdecode import SNIFF_BYTES, file_view_from_bytes, looks_binary
 
-GITHUB_API = "https://api.github.com"
+# Configurável para apontar para um GitHub Enterprise ou um servidor fake local (testes)
+GITHUB_API = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+# Teto de bytes mantidos em memória por arquivo; acima disso o conteúdo não é lido
+FILE_MAX_BYTES = int(os.getenv("GITHUB_FILE_MAX_BYTES", str(5 * 1024 * 1024)))
+# Páginas buscadas em paralelo quando o Link 'last' revela o total de páginas
+GITHUB_PAGE_WORKERS = int(os.getenv("GITHUB_PAGE_WORKERS", "4"))
+PER_PAGE = 100
+
+def _last_page(r: requests.Response) -> int | None:
+    """Número da última página pelo cabeçalho Link (ausente se houver só uma página)."""
+    last = r.links.get("last", {}).get("url")
+    if not last:
+        return None
+    try:
+        return int(parse_qs(urlparse(last).query)["page"][0])
+    except (KeyError, ValueError, IndexError):
+        return None
+
+def blob_file_view(blob: dict, path: str, blob_sha: str) -> dict:
+    """Converte a saída de get_blob_raw no formato de get_file_content."""
+    if not blob["complete"] or blob["binary"]:
+        return {"type": "file", "is_text": False, "text": None, "encoding": None, "size": blob["size"],
+                "name": path.rsplit("/", 1)[-1], "path": path, "sha": blob_sha,
+                "too_large": not blob["binary"]}
+    return file_view_from_bytes(blob["data"], path=path, sha=blob_sha)
 
 class GitHubClient:
-    def __init__(self, token: str):
-        self.session = requests.Session()
-        self.session.headers.update({
+    def __init__(self, token: str, base_url: str | None = None, cache: HttpCache | None = HTTP_CACHE,
+                 priority: int = INTERACTIVE, scheduler: GitHubScheduler | None = GITHUB_SCHEDULER):
+        self.base_url = (base_url or GITHUB_API).rstrip("/")
+        self.cache = cache
+        # prioridade no agendador de rate limit (INTERACTIVE para a UI, BATCH para jobs)
+        self.priority = priority
+        self.scheduler = scheduler
+        # namespace do cache HTTP: hash do token (nunca o token em si)
+        self.cache_namespace = hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+        # Session compartilhada por token (pool de conexões/TLS reaproveitado entre requisições)
+        self.session = SESSION_POOL.get(self.cache_namespace, {
             "Authorization": f"Bearer {token}",
             "Accept": "application/vnd.github+json",
             "X-GitHub-Api-Version": "2022-11-28",
             "User-Agent": "fiap-ford-migracao-legado"
         })
 
+    def _send(self, url: str, **kwargs) -> requests.Response:
+        """
+        session.get passando pelo agendador de rate limit: espera a vez/o reset da
+        cota do token e repete quando o GitHub responde 403/429 de rate limit.
+        """
+        if self.scheduler is None:
+            return self.session.get(url, **kwargs)
+        for attempt in range(GITHUB_RATE_MAX_RETRIES + 1):
+            self.scheduler.acquire(self.cache_namespace, self.priority)
+            r = None
+            try:
+                r = self.session.get(url, **kwargs)
+            finally:
+                retry = self.scheduler.release(self.cache_namespace, r)
+            if retry is None or attempt == GITHUB_RATE_MAX_RETRIES:
+                return r
+            r.close()  # a próxima acquire() espera a pausa registrada em release()
+        return r
+
+    def _get(self, url: str, params: dict | None = None, timeout: int = 20, headers: dict | None = None) -> requests.Response:
+        """
+        GET condicional: se já temos a resposta em cache, envia If-None-Match /
+        If-Modified-Since; em 304 devolve o corpo do cache (304 não consome rate limit).
+        """
+        if not url.startswith("http"):
+            url = self.base_url + url
+        headers = dict(headers or {})
+        if self.cache is None:
+            r = self._send(url, params=params, headers=headers, timeout=timeout)
+            r.raise_for_status()
+            return r
+
+        full_url = requests.Request("GET", url, params=params).prepare().url
+        accept = headers.get("Accept") or self.session.headers.get("Accept")
+        key = HttpCache.make_key(self.cache_namespace, full_url, accept)
+        entry = self.cache.get(key)
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        r = self._send(full_url, headers=headers, timeout=timeout)
+        if r.status_code == 304 and entry is not None:
+            self.cache.record("revalidated")
+            return entry.to_response()
+        r.raise_for_status()
+        self.cache.record("misses")
+        new_entry = cache_entry_from_response(r)
+        if new_entry is not None:
+            self.cache.put(key, new_entry)
+        return r
+
     def get_user(self):
-        resp = self.session.get(f"{GITHUB_API}/user", timeout=20)
-        resp.raise_for_status()
-        return resp.json()
+        return self._get("/user", timeout=20).json()
+
+    def iter_pages(self, path: str, params: dict | None = None, timeout: int = 30):
+        """
+        Gera as páginas (listas) de um endpoint paginado, em ordem. A primeira página
+        revela a última pelo Link 'last'; as demais são buscadas em paralelo
+        (GITHUB_PAGE_WORKERS) e entregues assim que a anterior chega. Sem 'last',
+        segue o Link 'next' uma a uma.
+        """
+        params = {"per_page": PER_PAGE, **(params or {})}
+        r = self._get(path, params=params, timeout=timeout)
+        yield r.json()
+        last = _last_page(r)
+        if last is None:
+            while "next" in r.links:
+                r = self._get(r.links["next"]["url"], timeout=timeout)
+                yield r.json()
+            return
+        if last < 2:
+            return
+        workers = max(1, min(GITHUB_PAGE_WORKERS, last - 1))
+        with ThreadPoolExecutor(workers, thread_name_prefix="gh-pages") as pool:
+            fetch = lambda page: self._get(path, params={**params, "page": page}, timeout=timeout).json()
+            # janela limitada: no máximo 2x workers páginas em voo/aguardando o consumidor
+            pending, next_page = [], 2
+            while pending or next_page <= last:
+                while next_page <= last and len(pending) < workers * 2:
+                    pending.append(pool.submit(fetch, next_page))
+                    next_page += 1
+                try:
+                    yield pending.pop(0).result()
+                except GeneratorExit:
+                    for f in pending:
+                        f.cancel()
+                    raise
+
+    def iter_all(self, path: str, params: dict | None = None, timeout: int = 30):
+        for page in self.iter_pages(path, params, timeout):
+            yield from page
+
+    def iter_repos(self):
+        """Repositórios do usuário autenticado (pessoais, de colaboração e das orgs em que é membro)."""
+        return self.iter_all("/user/repos", {"sort": "updated"})
 
     def list_repos(self):
-        # lista os repositórios do usuário autenticado (pessoais)
-        # depois podemos expandir para orgs: /user/orgs + /orgs/{org}/repos
-        repos = []
-        url = f"{GITHUB_API}/user/repos?per_page=100&sort=updated"
-        while url:
-            r = self.session.get(url, timeout=30)
-            r.raise_for_status()
-            repos.extend(r.json())
-            # paginação simples
-            url = None
-            if "next" in r.links:
-                url = r.links["next"]["url"]
-        return repos
+        return list(self.iter_repos())
+
+    def list_orgs(self):
+        return list(self.iter_all("/user/orgs"))
+
+    def iter_org_repos(self, org: str):
+        return self.iter_all(f"/orgs/{org}/repos", {"sort": "updated"})
+
+    def list_org_repos(self, org: str):
+        return list(self.iter_org_repos(org))
 
     def get_repo(self, owner: str, repo: str):
-        r = self.session.get(f"{GITHUB_API}/repos/{owner}/{repo}", timeout=20)
-        r.raise_for_status()
-        return r.json()
+        return self._get(f"/repos/{owner}/{repo}", timeout=20).json()
 
     def get_default_branch(self, owner: str, repo: str) -> str:
         data = self.get_repo(owner, repo)
         return data.get("default_branch", "main")
 
+    def get_commit_sha(self, owner: str, repo: str, ref: str) -> str:
+        """Resolve branch/tag/sha curto para o sha completo do commit (corpo text/plain)."""
+        r = self._get(f"/repos/{owner}/{repo}/commits/{ref}", timeout=20,
+                      headers={"Accept": "application/vnd.github.sha"})
+        return r.text.strip()
+
     def list_branches(self, owner: str, repo: str):
-        r = self.session.get(f"{GITHUB_API}/repos/{owner}/{repo}/branches?per_page=100", timeout=20)
-        r.raise_for_status()
-        return r.json()
+        return list(self.iter_all(f"/repos/{owner}/{repo}/branches", timeout=20))
+
+    def get_tree(self, owner: str, repo: str, tree_sha: str):
+        """Um único nível da árvore (sem recursive): usado quando o recursivo vem truncado."""
+        return self._get(f"/repos/{owner}/{repo}/git/trees/{tree_sha}", timeout=30).json()
 
     def get_tree_recursive(self, owner: str, repo: str, ref: str):
-        # recursive=1 retorna até 100k entradas; suficiente para a maioria dos repos
-        r = self.session.get(f"{GITHUB_API}/repos/{owner}/{repo}/git/trees/{ref}?recursive=1", timeout=60)
-        r.raise_for_status()
-        return r.json()
+        # recursive=1 retorna até 100k entradas / 7 MB; acima disso vem "truncated": true
+        return self._get(f"/repos/{owner}/{repo}/git/trees/{ref}?recursive=1", timeout=60).json()
+
+    def compare(self, owner: str, repo: str, base: str, head: str) -> dict:
+        """
+        GET compare/{base}...{head} com todas as páginas de 'files' juntas.
+        Cada arquivo traz status, sha (blob no head), previous_filename e 'patch'
+        (ausente em diffs grandes/binários).
+        """
+        data, files, page = None, [], 1
+        while True:
+            r = self._get(f"/repos/{owner}/{repo}/compare/{base}...{head}",
+                          params={"per_page": 100, "page": page}, timeout=60)
+            body = r.json()
+            if data is None:
+                data = body
+            batch = body.get("files") or []
+            files.extend(batch)
+            if len(batch) < 100 or "next" not in r.links:
+                break
+            page += 1
+        data["files"] = files
+        return data
+
+    @contextmanager
+    def open_tarball(self, owner: str, repo: str, ref: str):
+        """
+        Tarball do commit como stream (arquivo-like, sem carregar em memória).
+        O GitHub redireciona para codeload; o corpo é um .tar.gz.
+        """
+        r = self._send(f"{self.base_url}/repos/{owner}/{repo}/tarball/{ref}", stream=True, timeout=120)
+        try:
+            r.raise_for_status()
+            r.raw.decode_content = True  # só afeta Content-Encoding, não o gzip do próprio arquivo
+            yield r.raw
+        finally:
+            r.close()
+
+    def get_blob_raw(self, owner: str, repo: str, blob_sha: str, max_bytes: int = FILE_MAX_BYTES) -> dict:
+        """
+        Conteúdo cru de um blob (git/blobs + application/vnd.github.raw, sem base64 e
+        sem o limite de 1 MB do contents). Lido em stream: para no primeiro bloco se
+        parecer binário e nunca guarda mais que max_bytes.
+        Retorna {"data": bytes, "size": int | None, "complete": bool, "binary": bool}.
+        """
+        r = self._send(f"{self.base_url}/repos/{owner}/{repo}/git/blobs/{blob_sha}",
+                       headers={"Accept": "application/vnd.github.raw"}, stream=True, timeout=60)
+        try:
+            r.raise_for_status()
+            declared = r.headers.get("Content-Length")
+            size = int(declared) if declared and declared.isdigit() else None
+            if size is not None and size > max_bytes:
+                return {"data": b"", "size": size, "complete": False, "binary": False}
+            buf, sniffed = bytearray(), False
+            for piece in r.iter_content(chunk_size=64 * 1024):
+                buf += piece
+                if not sniffed and len(buf) >= SNIFF_BYTES:
+                    sniffed = True
+                    if looks_binary(bytes(buf[:SNIFF_BYTES])):
+                        return {"data": bytes(buf[:SNIFF_BYTES]), "size": size, "complete": False, "binary": True}
+                if len(buf) > max_bytes:
+                    return {"data": b"", "size": size, "complete": False, "binary": False}
+            return {"data": bytes(buf), "size": len(buf), "complete": True,
+                    "binary": looks_binary(bytes(buf[:SNIFF_BYTES]))}
+        finally:
+            r.close()
+
+    def get_blob_view(self, owner: str, repo: str, path: str, blob_sha: str, max_bytes: int = FILE_MAX_BYTES) -> dict:
+        """Mesmo formato de get_file_content, via blob sha (ex.: vindo do TreeIndex)."""
+        return blob_file_view(self.get_blob_raw(owner, repo, blob_sha, max_bytes), path, blob_sha)
 
     def get_file_content(self, owner: str, repo: str, path: str, ref: str | None = None) -> dict:
         params = {"ref": ref} if ref else {}
-        r = self.session.get(f"{GITHUB_API}/repos/{owner}/{repo}/contents/{path}", params=params, timeout=30)
-        r.raise_for_status()
-        data = r.json()
+        data = self._get(f"/repos/{owner}/{repo}/contents/{path}", params=params, timeout=30).json()
         if isinstance(data, list):
             # Se path apontar para diretório por engano, retorna lista
             return {"type": "dir", "entries": data}
 
+        # Acima de 1 MB o contents não traz o conteúdo ("encoding": "none"): vai pelo blob
+        if data.get("type") == "file" and data.get("encoding") != "base64" and data.get("sha"):
+            view = self.get_blob_view(owner, repo, data.get("path") or path, data["sha"])
+            view["html_url"] = data.get("html_url")
+            return view
+
         # Conteúdo de arquivo
         if data.get("encoding") == "base64":
             raw = base64.b64decode(data["content"])
-            # tentativa simples de detectar texto
-            try:
-                text = raw.decode("utf-8")
-                is_text = True
-            except UnicodeDecodeError:
-                text = None
-                is_text = False
-
-            return {
-                "type": "file",
-                "is_text": is_text,
-                "text": text,
-                "size": data.get("size"),
-                "name": data.get("name"),
-                "path": data.get("path"),
-                "sha": data.get("sha"),
-                "html_url": data.get("html_url"),
-            }
-        return {"type": "unknown", "raw": data}
\ No newline at end of file
+            return file_view_from_bytes(raw, path=data.get("path") or path, sha=data.get("sha"),
+                                        size=data.get("size"), html_url=data.get("html_url"))
+        return {"type": "unknown", "raw": data}
+
+_CLIENTS: dict[tuple, GitHubClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+def get_client(token: str, priority: int = INTERACTIVE) -> GitHubClient:
+    """
+    GitHubClient compartilhado por (token, prioridade, URL base). O cliente não tem
+    estado por requisição, então é seguro usá-lo de várias threads.
+    """
+    key = (hashlib.sha256(token.encode("utf-8")).hexdigest(), priority, GITHUB_API)
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            if len(_CLIENTS) >= 64:
+                _CLIENTS.clear()  # tokens trocados: descarta tudo (as sessões ficam no SESSION_POOL)
+            client = _CLIENTS[key] = GitHubClient(token, priority=priority)
+        return client
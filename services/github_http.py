@@ -0,0 +1,162 @@
+from __future__ import annotations
+import io
+import logging
+import os
+import socket
+import threading
+from collections import OrderedDict
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+
+# Sessões HTTP compartilhadas pelo processo, uma por token: conexões (e o handshake
+# TLS) são reaproveitadas entre requisições da UI e workers dos jobs em lote.
+
+log = logging.getLogger(__name__)
+
+# Hosts distintos mantidos no pool (api.github.com, codeload.github.com, ...)
+GITHUB_POOL_CONNECTIONS = int(os.getenv("GITHUB_POOL_CONNECTIONS", "4"))
+# Conexões por host: cobre fetch workers dos jobs + páginas em paralelo + UI
+GITHUB_POOL_MAXSIZE = int(os.getenv("GITHUB_POOL_MAXSIZE", "32"))
+# Retries só de conexão (nunca reenvia depois de a requisição sair)
+GITHUB_CONNECT_RETRIES = int(os.getenv("GITHUB_CONNECT_RETRIES", "2"))
+# HTTP/2 via httpx (precisa do pacote h2); sem ele, segue em HTTP/1.1 keep-alive
+GITHUB_HTTP2 = os.getenv("GITHUB_HTTP2", "0").lower() in ("1", "true", "yes")
+# Tokens distintos com sessão aberta (LRU)
+GITHUB_SESSION_POOL_MAX = int(os.getenv("GITHUB_SESSION_POOL_MAX", "32"))
+
+_SOCKET_OPTIONS = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter com TCP keep-alive: conexões ociosas no pool não morrem em NAT/proxies."""
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = _SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+class _HttpxRaw(io.RawIOBase):
+    """Corpo de uma resposta httpx em stream exposto como o 'raw' de requests."""
+    def __init__(self, resp):
+        self._resp = resp
+        self._iter = resp.iter_bytes()
+        self._pending = b""
+        self.decode_content = True  # compatibilidade com urllib3 (httpx já decodifica)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._pending:
+            try:
+                self._pending = next(self._iter)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._resp.close()
+        super().close()
+
+    def release_conn(self):
+        self.close()
+
+class Http2Adapter(BaseAdapter):
+    """
+    Transport adapter do requests sobre um httpx.Client com HTTP/2: a Session e o
+    resto do código (links, raw, iter_content, redirects) continuam iguais, mas as
+    requisições concorrentes do mesmo token dividem uma conexão multiplexada.
+    """
+    def __init__(self, httpx_client):
+        super().__init__()
+        self.client = httpx_client
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        import httpx
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        try:
+            req = self.client.build_request(request.method, request.url, headers=dict(request.headers),
+                                            content=request.body, timeout=timeout)
+            resp = self.client.send(req, stream=True)
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(e, request=request)
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(e, request=request)
+
+        r = requests.Response()
+        r.status_code = resp.status_code
+        r.headers = CaseInsensitiveDict(resp.headers.multi_items())
+        r.encoding = get_encoding_from_headers(r.headers)
+        r.reason = resp.reason_phrase
+        r.url = request.url
+        r.request = request
+        r.connection = self
+        r.raw = _HttpxRaw(resp)
+        if not stream:
+            r.content  # noqa: B018 (lê o corpo e devolve a conexão ao pool)
+        return r
+
+    def close(self):
+        self.client.close()
+
+def _http2_adapter() -> Http2Adapter | None:
+    try:
+        import h2  # noqa: F401
+        import httpx
+    except ImportError:
+        log.warning("GITHUB_HTTP2=1, mas httpx[http2] não está instalado; usando HTTP/1.1")
+        return None
+    limits = httpx.Limits(max_connections=GITHUB_POOL_MAXSIZE, max_keepalive_connections=GITHUB_POOL_MAXSIZE)
+    transport = httpx.HTTPTransport(http2=True, retries=GITHUB_CONNECT_RETRIES, limits=limits)
+    return Http2Adapter(httpx.Client(transport=transport, follow_redirects=False))
+
+def build_session(headers: dict) -> requests.Session:
+    session = requests.Session()
+    session.headers.update(headers)
+    adapter = _http2_adapter() if GITHUB_HTTP2 else None
+    if adapter is None:
+        adapter = KeepAliveAdapter(
+            pool_connections=GITHUB_POOL_CONNECTIONS,
+            pool_maxsize=GITHUB_POOL_MAXSIZE,
+            max_retries=Retry(total=GITHUB_CONNECT_RETRIES, connect=GITHUB_CONNECT_RETRIES, read=0,
+                              status=0, redirect=None, backoff_factor=0.2, raise_on_status=False),
+        )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+class SessionPool:
+    """Uma Session por chave (hash do token), criada sob demanda e mantida em LRU."""
+    def __init__(self, max_sessions: int = GITHUB_SESSION_POOL_MAX):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, requests.Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "reused": 0, "evicted": 0}
+
+    def get(self, key: str, headers: dict) -> requests.Session:
+        with self._lock:
+            s = self._sessions.get(key)
+            if s is not None:
+                self._sessions.move_to_end(key)
+                self._stats["reused"] += 1
+                return s
+            s = self._sessions[key] = build_session(headers)
+            self._stats["created"] += 1
+            while len(self._sessions) > self.max_sessions:
+                # sem close(): outra thread pode estar usando; o GC fecha o pool
+                self._sessions.popitem(last=False)
+                self._stats["evicted"] += 1
+            return s
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "sessions": len(self._sessions), "http2": GITHUB_HTTP2,
+                    "pool_maxsize": GITHUB_POOL_MAXSIZE}
+
+SESSION_POOL = SessionPool()
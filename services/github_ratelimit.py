@@ -0,0 +1,170 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+import requests
+
+# Agendador de requisições ao GitHub ciente do rate limit, compartilhado pelo processo.
+# Lê X-RateLimit-* / Retry-After de cada resposta e, por token:
+#  - pausa todo mundo até o reset quando a cota zera (ou no Retry-After);
+#  - reserva uma fatia da cota para a navegação interativa (jobs em lote param antes);
+#  - faz backoff exponencial no rate limit secundário (403/429 sem cota zerada).
+
+INTERACTIVE = 0
+BATCH = 1
+_PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+# Fração da cota (X-RateLimit-Limit) que os jobs em lote não podem consumir
+GITHUB_RATE_BATCH_RESERVE = float(os.getenv("GITHUB_RATE_BATCH_RESERVE", "0.1"))
+# Quanto uma requisição interativa aceita esperar antes de falhar com GitHubRateLimited
+GITHUB_RATE_MAX_WAIT_INTERACTIVE = float(os.getenv("GITHUB_RATE_MAX_WAIT_INTERACTIVE", "30"))
+# Idem para lote (padrão: 1h, o suficiente para atravessar um reset da cota)
+GITHUB_RATE_MAX_WAIT_BATCH = float(os.getenv("GITHUB_RATE_MAX_WAIT_BATCH", "3600"))
+# Backoff do rate limit secundário sem Retry-After (a doc pede ao menos 1 minuto)
+GITHUB_SECONDARY_BACKOFF = float(os.getenv("GITHUB_SECONDARY_BACKOFF", "60"))
+GITHUB_SECONDARY_BACKOFF_MAX = float(os.getenv("GITHUB_SECONDARY_BACKOFF_MAX", "900"))
+GITHUB_RATE_MAX_RETRIES = int(os.getenv("GITHUB_RATE_MAX_RETRIES", "3"))
+
+class GitHubRateLimited(requests.HTTPError):
+    """A cota do token acabou e a espera passaria do limite da prioridade."""
+    def __init__(self, message: str, retry_at: float):
+        super().__init__(message)
+        self.retry_at = retry_at
+
+@dataclass
+class _Budget:
+    limit: int | None = None
+    remaining: int | None = None
+    reset_at: float | None = None      # epoch (X-RateLimit-Reset)
+    paused_until: float = 0.0          # epoch: Retry-After / cota zerada / backoff secundário
+    secondary_strikes: int = 0
+    in_flight: int = 0
+    waiting: dict = field(default_factory=lambda: {INTERACTIVE: 0, BATCH: 0})
+    stats: dict = field(default_factory=lambda: {"requests": 0, "waits": 0, "wait_seconds": 0.0,
+                                                 "primary_limited": 0, "secondary_limited": 0,
+                                                 "rejected": 0})
+
+class GitHubScheduler:
+    def __init__(self, batch_reserve: float = GITHUB_RATE_BATCH_RESERVE):
+        self.batch_reserve = batch_reserve
+        self._budgets: dict[str, _Budget] = {}
+        self._cond = threading.Condition()
+
+    def _budget(self, namespace: str) -> _Budget:
+        b = self._budgets.get(namespace)
+        if b is None:
+            b = self._budgets[namespace] = _Budget()
+        return b
+
+    def _ready_at(self, b: _Budget, priority: int, now: float) -> float:
+        """Epoch a partir do qual 'priority' pode enviar (<= now: já pode)."""
+        if b.paused_until > now:
+            return b.paused_until
+        if b.remaining is None:
+            return now  # ainda sem cabeçalhos: primeira requisição descobre a cota
+        # conta as requisições em voo: as respostas ainda vão descontar da cota
+        left = b.remaining - b.in_flight
+        floor = 0
+        if priority == BATCH:
+            floor = int((b.limit or 0) * self.batch_reserve)
+            if b.waiting[INTERACTIVE]:
+                return now + 0.05  # interativo na fila: lote cede a vez
+        if left > floor:
+            return now
+        reset = b.reset_at or now + 1
+        # requisições em voo podem trazer um reset/remaining novo antes disso
+        return reset if b.in_flight == 0 else min(reset, now + 1)
+
+    def acquire(self, namespace: str, priority: int = INTERACTIVE):
+        max_wait = GITHUB_RATE_MAX_WAIT_INTERACTIVE if priority == INTERACTIVE else GITHUB_RATE_MAX_WAIT_BATCH
+        started = time.time()
+        with self._cond:
+            b = self._budget(namespace)
+            b.waiting[priority] += 1
+            try:
+                while True:
+                    now = time.time()
+                    ready = self._ready_at(b, priority, now)
+                    if ready <= now:
+                        break
+                    if ready - started > max_wait:
+                        b.stats["rejected"] += 1
+                        raise GitHubRateLimited(
+                            f"Rate limit do GitHub esgotado; tente novamente em {int(ready - now) + 1}s.", ready)
+                    self._cond.wait(min(ready - now, 5.0))
+            finally:
+                b.waiting[priority] -= 1
+            waited = time.time() - started
+            if waited > 0.01:
+                b.stats["waits"] += 1
+                b.stats["wait_seconds"] += waited
+            b.in_flight += 1
+            b.stats["requests"] += 1
+
+    def release(self, namespace: str, response: requests.Response | None) -> float | None:
+        """
+        Registra os cabeçalhos da resposta. Devolve quantos segundos esperar antes de
+        repetir a requisição se ela foi barrada por rate limit, ou None.
+        """
+        with self._cond:
+            b = self._budget(namespace)
+            b.in_flight = max(0, b.in_flight - 1)
+            retry = None
+            if response is not None:
+                retry = self._observe(b, response)
+            self._cond.notify_all()
+            return retry
+
+    def _observe(self, b: _Budget, r: requests.Response) -> float | None:
+        h = r.headers
+        now = time.time()
+        if (h.get("X-RateLimit-Resource") or "core") == "core" and h.get("X-RateLimit-Remaining") is not None:
+            try:
+                b.remaining = int(h["X-RateLimit-Remaining"])
+                b.limit = int(h.get("X-RateLimit-Limit") or b.limit or 0) or b.limit
+                if h.get("X-RateLimit-Reset"):
+                    b.reset_at = float(h["X-RateLimit-Reset"])
+            except ValueError:
+                pass
+
+        if r.status_code not in (403, 429):
+            if r.status_code < 400:
+                b.secondary_strikes = 0
+            return None
+
+        retry_after = h.get("Retry-After")
+        if retry_after is not None and retry_after.strip().isdigit():
+            until = now + int(retry_after)
+            secondary = b.remaining != 0
+        elif h.get("X-RateLimit-Remaining") == "0":
+            until = (b.reset_at or now + 60) + 1
+            secondary = False
+        elif r.status_code == 429 or "secondary rate limit" in (r.text or "").lower():
+            b.secondary_strikes += 1
+            until = now + min(GITHUB_SECONDARY_BACKOFF * 2 ** (b.secondary_strikes - 1),
+                              GITHUB_SECONDARY_BACKOFF_MAX)
+            secondary = True
+        else:
+            return None  # 403 de permissão: não é rate limit
+        b.paused_until = max(b.paused_until, until)
+        b.stats["secondary_limited" if secondary else "primary_limited"] += 1
+        return max(0.0, until - now)
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._cond:
+            out = {}
+            for ns, b in self._budgets.items():
+                out[ns] = {
+                    "limit": b.limit,
+                    "remaining": b.remaining,
+                    "reset_in": round(b.reset_at - now, 1) if b.reset_at else None,
+                    "paused_for": round(max(0.0, b.paused_until - now), 1),
+                    "in_flight": b.in_flight,
+                    "waiting": {_PRIORITY_NAMES[p]: n for p, n in b.waiting.items()},
+                    **{k: (round(v, 2) if isinstance(v, float) else v) for k, v in b.stats.items()},
+                }
+            return {"tokens": out, "batch_reserve": self.batch_reserve}
+
+GITHUB_SCHEDULER = GitHubScheduler()
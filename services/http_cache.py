@@ -0,0 +1,105 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Limites do cache em memória (LRU por quantidade e por bytes)
+HTTP_CACHE_MAX_ENTRIES = int(os.getenv("GITHUB_HTTP_CACHE_MAX_ENTRIES", "2000"))
+HTTP_CACHE_MAX_BYTES = int(os.getenv("GITHUB_HTTP_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Cabeçalhos da resposta original que vale a pena preservar
+_KEEP_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Link")
+
+@dataclass
+class CachedResponse:
+    url: str
+    body: bytes
+    etag: str | None = None
+    last_modified: str | None = None
+    headers: dict = field(default_factory=dict)
+    stored_at: float = field(default_factory=time.time)
+
+    def to_response(self) -> requests.Response:
+        """Reconstrói um requests.Response (status 200) a partir do cache."""
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.url = self.url
+        resp._content = self.body
+        resp.encoding = "utf-8"
+        resp.headers = CaseInsensitiveDict(self.headers)
+        resp.from_cache = True
+        return resp
+
+class HttpCache:
+    """
+    Cache de respostas GET validado por ETag/Last-Modified.
+    A chave inclui um namespace por token: respostas de um usuário nunca são
+    servidas a outro.
+    """
+    def __init__(self, max_entries: int = HTTP_CACHE_MAX_ENTRIES, max_bytes: int = HTTP_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"revalidated": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(namespace: str, url: str, accept: str | None = None) -> tuple:
+        return (namespace, url, accept or "")
+
+    def get(self, key: tuple) -> CachedResponse | None:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                self._items.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, entry: CachedResponse):
+        size = len(entry.body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._items[key] = entry
+            self._bytes += size
+            self._stats["stores"] += 1
+            while self._items and (len(self._items) > self.max_entries or self._bytes > self.max_bytes):
+                _, dropped = self._items.popitem(last=False)
+                self._bytes -= len(dropped.body)
+                self._stats["evictions"] += 1
+
+    def record(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out.update({"entries": len(self._items), "size_bytes": self._bytes,
+                        "max_entries": self.max_entries, "max_bytes": self.max_bytes})
+        return out
+
+# Instância compartilhada por todos os GitHubClient do processo
+HTTP_CACHE = HttpCache()
+
+def cache_entry_from_response(resp: requests.Response) -> CachedResponse | None:
+    """Cria a entrada de cache se a resposta tiver validadores (ETag/Last-Modified)."""
+    etag = resp.headers.get("ETag")
+    last_modified = resp.headers.get("Last-Modified")
+    if not etag and not last_modified:
+        return None
+    headers = {h: resp.headers[h] for h in _KEEP_HEADERS if h in resp.headers}
+    return CachedResponse(url=resp.url, body=resp.content, etag=etag,
+                          last_modified=last_modified, headers=headers)
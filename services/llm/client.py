@@ -1,16 +1,28 @@
 from __future__ import annotations
 import os
-from typing import Any, Dict
+import threading
+from typing import Dict, Tuple
 from langchain_core.language_models import BaseChatModel
 from langchain_openai import ChatOpenAI  # trocável
 
+_llms: Dict[Tuple[str, float], BaseChatModel] = {}
+_llms_lock = threading.Lock()
+
 def get_llm(model: str | None = None, temperature: float = 0.2) -> BaseChatModel:
     """
-    Retorna um ChatModel do LangChain.
-    Troca fácil de provedor: basta mudar a import/instanciação.
+    Retorna um ChatModel do LangChain (um por modelo/temperatura no processo,
+    reaproveitando o cliente HTTP). Troca fácil de provedor: basta mudar a
+    import/instanciação.
     """
     model = model or os.getenv("LLM_MODEL", "gpt-4o-mini")
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY não configurada.")
-    return ChatOpenAI(model=model, temperature=temperature, timeout=60)
+    with _llms_lock:
+        llm = _llms.get((model, temperature))
+        if llm is None:
+            # retries ficam a cargo do LLMExecutor (backoff com jitter + circuit breaker);
+            # stream_usage: o uso de tokens também vem nas respostas em streaming
+            llm = ChatOpenAI(model=model, temperature=temperature, timeout=60, max_retries=0, stream_usage=True)
+            _llms[(model, temperature)] = llm
+        return llm
@@ -0,0 +1,337 @@
+from __future__ import annotations
+import asyncio
+import concurrent.futures
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Iterator, Sequence, Tuple
+from langchain_core.callbacks import BaseCallbackHandler
+from services.llm.tokens import usage_from_result
+from services.ratelimit import TokenBucket
+
+# Limites do provedor (configuráveis via .env). RPM/TPM <= 0 desativam o limite.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_RPM = float(os.getenv("LLM_RPM", "500"))
+LLM_TPM = float(os.getenv("LLM_TPM", "200000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+# stream_many(): espera máxima por um pedaço antes de dar as chamadas restantes como falha
+LLM_STREAM_IDLE_TIMEOUT = float(os.getenv("LLM_STREAM_IDLE_TIMEOUT", "300"))
+
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+STREAM_END = object()  # marca o fim de uma chamada em stream_many()
+
+class CircuitOpenError(RuntimeError):
+    """O provedor falhou repetidamente; chamadas são recusadas até o fim do cooldown."""
+
+class CircuitBreaker:
+    """
+    closed -> (N falhas seguidas) -> open -> (cooldown) -> half_open -> 1 chamada de teste:
+    sucesso fecha o circuito, falha reabre.
+    """
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_inflight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self._probe_inflight = False
+            if self.state == "half_open" and not self._probe_inflight:
+                self._probe_inflight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._probe_inflight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_inflight = False
+
+def _status_code(exc: BaseException) -> int | None:
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        resp = getattr(exc, "response", None)
+        code = getattr(resp, "status_code", None)
+    return code if isinstance(code, int) else None
+
+def _retry_after(exc: BaseException) -> float | None:
+    resp = getattr(exc, "response", None)
+    headers = getattr(resp, "headers", None) or {}
+    try:
+        value = headers.get("retry-after")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(exc: BaseException) -> bool:
+    """429/5xx/timeouts/conexão são transitórios; 4xx restantes (auth, request inválido) não."""
+    code = _status_code(exc)
+    if code is not None:
+        return code in _RETRYABLE_STATUS
+    name = type(exc).__name__
+    return isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)) or \
+        "Timeout" in name or "Connection" in name
+
+def is_provider_failure(exc: BaseException) -> bool:
+    """
+    Falha do provedor/transporte (conta para o circuit breaker). Erros de parser
+    ou validação de uma resposta ruim não indicam provedor fora do ar.
+    """
+    code = _status_code(exc)
+    return is_retryable(exc) or (code is not None and code >= 500)
+
+class _CallUsage(BaseCallbackHandler):
+    """Tokens que o provedor informou para uma tentativa (acerta a reserva de TPM)."""
+    def __init__(self):
+        super().__init__()
+        self.tokens = 0
+
+    def on_llm_end(self, response, **kwargs: Any):
+        input_tokens, output_tokens, _ = usage_from_result(response)
+        self.tokens += input_tokens + output_tokens
+
+class LLMExecutor:
+    """
+    Executa Runnables do LangChain (ainvoke) num event loop dedicado, com:
+      - semáforo de concorrência máxima,
+      - token buckets de requisições/min e tokens/min,
+      - retry com backoff exponencial + jitter em 429/5xx (respeita Retry-After),
+      - circuit breaker.
+    A reserva de TPM é uma estimativa (prompt + saída esperada): quando o provedor
+    informa o uso real, a sobra volta ao bucket; um 429 devolve a reserva inteira.
+    invoke()/batch() são wrappers síncronos para as rotas Flask e os workers.
+    """
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, rpm: float = LLM_RPM, tpm: float = LLM_TPM,
+                 max_retries: int = LLM_MAX_RETRIES, backoff_base: float = LLM_BACKOFF_BASE,
+                 backoff_max: float = LLM_BACKOFF_MAX, breaker: CircuitBreaker | None = None):
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket.per_minute(rpm, burst=max_concurrency) if rpm > 0 else TokenBucket(0)
+        self.tokens = TokenBucket.per_minute(tpm, burst=tpm / 6) if tpm > 0 else TokenBucket(0)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "retries": 0, "failures": 0, "rejected": 0, "refunded_tokens": 0}
+
+    # ---------- event loop dedicado ----------
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-executor", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _sem(self) -> asyncio.Semaphore:
+        # criado dentro do loop dedicado (primeiro uso)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _backoff(self, attempt: int, exc: BaseException) -> float:
+        hinted = _retry_after(exc)
+        if hinted is not None:
+            return min(self.backoff_max, hinted)
+        # "full jitter": uniforme em [0, base * 2^attempt]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    async def _acquire(self, tokens: int):
+        # cada tentativa (inclusive retries) consome requisição e tokens do orçamento
+        await self.requests.acquire_async(1)
+        if tokens:
+            await self.tokens.acquire_async(tokens)
+
+    def _settle(self, reserved: int, used: int):
+        """Devolve ao bucket de TPM o reservado e não usado (used=0: nada a acertar)."""
+        if reserved and 0 < used < reserved:
+            self._refund(reserved - used)
+
+    def _refund(self, tokens: int):
+        if tokens > 0:
+            self.tokens.refund(tokens)
+            self._count("refunded_tokens", tokens)
+
+    def _record(self, exc: BaseException):
+        if is_provider_failure(exc):
+            self.breaker.record_failure()
+        else:  # o provedor respondeu; libera a sonda do half_open
+            self.breaker.record_success()
+
+    # ---------- API assíncrona ----------
+    async def ainvoke(self, runnable, input: Any, tokens: int = 0) -> Any:
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise CircuitOpenError("LLM indisponível (circuit breaker aberto).")
+        async with self._sem():
+            await self._acquire(tokens)
+            attempt = 0
+            while True:
+                used = _CallUsage()
+                try:
+                    self._count("calls")
+                    result = await runnable.ainvoke(input, config={"callbacks": [used]})
+                    self.breaker.record_success()
+                    self._settle(tokens, used.tokens)
+                    return result
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        self._count("failures")
+                        self._record(e)
+                        raise
+                    self._count("retries")
+                    if _status_code(e) == 429:  # recusada pelo provedor: não consumiu a cota
+                        self._refund(tokens)
+                    await asyncio.sleep(self._backoff(attempt, e))
+                    attempt += 1
+                    await self._acquire(tokens)
+
+    async def astream(self, runnable, input: Any, tokens: int = 0):
+        """
+        Como ainvoke, mas repassa os pedaços de runnable.astream(). Só há retry
+        enquanto nenhum pedaço foi entregue (depois disso a falha é propagada).
+        """
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise CircuitOpenError("LLM indisponível (circuit breaker aberto).")
+        async with self._sem():
+            await self._acquire(tokens)
+            attempt = 0
+            while True:
+                emitted, used = False, _CallUsage()
+                try:
+                    self._count("calls")
+                    async for piece in runnable.astream(input, config={"callbacks": [used]}):
+                        emitted = True
+                        yield piece
+                    self.breaker.record_success()
+                    self._settle(tokens, used.tokens)
+                    return
+                except Exception as e:
+                    if emitted or attempt >= self.max_retries or not is_retryable(e):
+                        self._count("failures")
+                        self._record(e)
+                        raise
+                    self._count("retries")
+                    if _status_code(e) == 429:
+                        self._refund(tokens)
+                    await asyncio.sleep(self._backoff(attempt, e))
+                    attempt += 1
+                    await self._acquire(tokens)
+
+    async def abatch(self, runnable, inputs: Sequence[Any], tokens: Sequence[int] | None = None) -> list:
+        """Executa todos em paralelo (limitado pelo semáforo). Exceções voltam na lista."""
+        tokens = tokens or [0] * len(inputs)
+        return await asyncio.gather(*(self.ainvoke(runnable, i, t) for i, t in zip(inputs, tokens)),
+                                    return_exceptions=True)
+
+    # ---------- wrappers síncronos ----------
+    def invoke(self, runnable, input: Any, tokens: int = 0, timeout: float | None = None) -> Any:
+        fut = asyncio.run_coroutine_threadsafe(self.ainvoke(runnable, input, tokens), self._ensure_loop())
+        return fut.result(timeout)
+
+    def batch(self, runnable, inputs: Sequence[Any], tokens: Sequence[int] | None = None,
+              timeout: float | None = None) -> list:
+        fut = asyncio.run_coroutine_threadsafe(self.abatch(runnable, inputs, tokens), self._ensure_loop())
+        return fut.result(timeout)
+
+    def as_completed(self, runnable, inputs: Sequence[Any], tokens: Sequence[int] | None = None
+                     ) -> Iterator[Tuple[int, Any]]:
+        """(índice, resultado ou exceção) na ordem em que as chamadas terminam."""
+        loop = self._ensure_loop()
+        tokens = tokens or [0] * len(inputs)
+        futures = {asyncio.run_coroutine_threadsafe(self.ainvoke(runnable, i, t), loop): n
+                   for n, (i, t) in enumerate(zip(inputs, tokens))}
+        try:
+            for fut in concurrent.futures.as_completed(futures):
+                exc = fut.exception()
+                yield futures[fut], exc if exc is not None else fut.result()
+        finally:  # consumidor parou antes: não deixa chamadas órfãs no loop
+            for fut in futures:
+                fut.cancel()
+
+    def stream_many(self, runnable, inputs: Sequence[Any], tokens: Sequence[int] | None = None,
+                    idle_timeout: float | None = LLM_STREAM_IDLE_TIMEOUT) -> Iterator[Tuple[int, Any]]:
+        """
+        Faz streaming de várias chamadas em paralelo. Gera (índice, pedaço) conforme
+        chegam; cada chamada termina com (índice, STREAM_END) ou (índice, exceção).
+        Sem nenhum pedaço em idle_timeout segundos, as chamadas abertas terminam com
+        TimeoutError. Se o consumidor parar antes (cliente SSE desconectou, generator
+        fechado), as chamadas em andamento são canceladas: liberam o semáforo e
+        deixam de consumir o orçamento de RPM/TPM.
+        """
+        loop = self._ensure_loop()
+        tokens = tokens or [0] * len(inputs)
+        out: "queue.Queue[Tuple[int, Any]]" = queue.Queue()
+
+        async def pump(n: int, inp: Any, tok: int):
+            try:
+                async for piece in self.astream(runnable, inp, tok):
+                    out.put((n, piece))
+                out.put((n, STREAM_END))
+            except Exception as e:
+                out.put((n, e))
+
+        futures = [asyncio.run_coroutine_threadsafe(pump(n, inp, tok), loop)
+                   for n, (inp, tok) in enumerate(zip(inputs, tokens))]
+        pending = set(range(len(futures)))
+        try:
+            while pending:
+                try:
+                    n, item = out.get(timeout=idle_timeout)
+                except queue.Empty:
+                    for n in sorted(pending):
+                        yield n, TimeoutError(f"LLM sem resposta em {idle_timeout:g}s")
+                    return
+                if item is STREAM_END or isinstance(item, BaseException):
+                    pending.discard(n)
+                yield n, item
+        finally:
+            for fut in futures:
+                fut.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+        out.update({"breaker": self.breaker.state, "max_concurrency": self.max_concurrency})
+        return out
+
+_executor: LLMExecutor | None = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> LLMExecutor:
+    """Executor compartilhado pelo processo: os limites valem para todas as requisições."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = LLMExecutor()
+        return _executor
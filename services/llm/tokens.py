@@ -0,0 +1,152 @@
+from __future__ import annotations
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Tuple
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Contagem de tokens e uso por análise.
+# count_tokens usa o tiktoken quando os arquivos BPE estão disponíveis localmente
+# (TIKTOKEN_CACHE_DIR; o tiktoken baixaria da internet na primeira vez, o que não
+# queremos no caminho de uma requisição) e, senão, uma estimativa offline por
+# palavras/símbolos que tende a superestimar código (seguro para orçamento).
+
+log = logging.getLogger(__name__)
+
+# auto: tiktoken só se TIKTOKEN_CACHE_DIR estiver definido; tiktoken: sempre; heuristic: nunca
+LLM_TOKENIZER = os.getenv("LLM_TOKENIZER", "auto").lower()
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_loaded = False
+
+def _load_encoding():
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if _encoding_loaded:
+            return _encoding
+        _encoding_loaded = True
+        if LLM_TOKENIZER == "heuristic" or (LLM_TOKENIZER == "auto" and not os.getenv("TIKTOKEN_CACHE_DIR")):
+            return None
+        try:
+            import tiktoken
+            model = os.getenv("LLM_MODEL", "gpt-4o-mini")
+            try:
+                _encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            log.warning("tiktoken indisponível (%s); usando estimativa de tokens.", e)
+        return _encoding
+
+def tokenizer_name() -> str:
+    enc = _load_encoding()
+    return f"tiktoken:{enc.name}" if enc is not None else "heuristic"
+
+# palavras (letras/_), números (até 3 dígitos por token), símbolos, quebras de linha com indentação
+_PIECES = re.compile(r"[^\W\d]+|\d{1,3}|\n\s*|[^\w\s]")
+
+def _estimate(text: str) -> int:
+    n = 0
+    for piece in _PIECES.findall(text):
+        n += (len(piece) + 3) // 4 if piece[0].isalpha() or piece[0] == "_" else 1
+    return n
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    enc = _load_encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return _estimate(text)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> Tuple[str, bool]:
+    """Corta em fronteira de linha para caber em max_tokens. Retorna (texto, cortado?)."""
+    if count_tokens(text) <= max_tokens:
+        return text, False
+    out, used = [], 0
+    for line in text.splitlines(keepends=True):
+        n = count_tokens(line)
+        if used + n > max_tokens:
+            if not out:  # uma linha só já estoura: corta proporcionalmente
+                out.append(line[:max(1, len(line) * max_tokens // max(n, 1))])
+            break
+        out.append(line)
+        used += n
+    return "".join(out), True
+
+# ------------------ uso por análise ------------------
+
+def usage_from_result(response) -> Tuple[int, int, int]:
+    """(entrada, saída, entrada em cache) informados pelo provedor num LLMResult; zeros se ausente."""
+    for gens in response.generations:
+        for g in gens:
+            um = getattr(getattr(g, "message", None), "usage_metadata", None)
+            if um:
+                details = um.get("input_token_details") or {}
+                return um.get("input_tokens", 0), um.get("output_tokens", 0), details.get("cache_read", 0)
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), cached
+
+class TokenUsage(BaseCallbackHandler):
+    """
+    Soma o uso informado pelo provedor (usage_metadata das respostas) e a
+    estimativa local dos prompts enviados. Registrado como callback das chains.
+    """
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        self.estimated_prompt_tokens = 0
+
+    def add_estimate(self, tokens: int):
+        with self._lock:
+            self.estimated_prompt_tokens += tokens
+        if self is not TOKEN_TOTALS:
+            TOKEN_TOTALS.add_estimate(tokens)
+
+    def add(self, input_tokens: int, output_tokens: int, cached_tokens: int = 0):
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.cached_tokens += cached_tokens
+        if self is not TOKEN_TOTALS:
+            TOKEN_TOTALS.add(input_tokens, output_tokens, cached_tokens)
+
+    def on_llm_end(self, response, **kwargs: Any):
+        self.add(*usage_from_result(response))
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"calls": self.calls, "input_tokens": self.input_tokens, "output_tokens": self.output_tokens,
+                    "cached_input_tokens": self.cached_tokens,
+                    "estimated_prompt_tokens": self.estimated_prompt_tokens,
+                    "seconds": round(time.monotonic() - self.started, 3)}
+
+# Acumulado do processo (exposto em /llm/stats)
+TOKEN_TOTALS = TokenUsage()
+
+_current: contextvars.ContextVar[TokenUsage | None] = contextvars.ContextVar("llm_token_usage", default=None)
+
+@contextmanager
+def track_usage() -> Iterator[TokenUsage]:
+    """Mede o uso de tokens das chamadas ao LLM feitas dentro do bloco (mesma thread)."""
+    usage = TokenUsage()
+    token = _current.set(usage)
+    try:
+        yield usage
+    finally:
+        _current.reset(token)
+
+def current_usage() -> TokenUsage | None:
+    return _current.get()
@@ -0,0 +1,54 @@
+from __future__ import annotations
+import asyncio
+import threading
+import time
+
+class TokenBucket:
+    """
+    Token bucket thread-safe: 'rate' tokens por segundo, acumulando até 'capacity'.
+    reserve() nunca bloqueia: debita os tokens (o saldo pode ficar negativo) e
+    devolve quantos segundos o chamador deve esperar. Assim o mesmo bucket serve
+    a threads (acquire) e a corrotinas (acquire_async) sem segurar o lock dormindo.
+    """
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, amount: float, burst: float | None = None) -> "TokenBucket":
+        return cls(amount / 60.0, burst if burst is not None else max(1.0, amount / 60.0))
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, n: float = 1.0) -> float:
+        if self.rate <= 0:
+            return 0.0  # rate <= 0 => sem limite
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= n
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, n: float = 1.0):
+        wait = self.reserve(n)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, n: float = 1.0):
+        wait = self.reserve(n)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def refund(self, n: float):
+        """Devolve tokens reservados a mais (ex.: estimativa de tokens maior que o uso real)."""
+        if self.rate <= 0 or n <= 0:
+            return
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + n)
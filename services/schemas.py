@@ -0,0 +1,244 @@
+from __future__ import annotations
+import copy
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable
+from jsonschema import Draft202012Validator, ValidationError
+from referencing import Registry, Resource
+
+# Schemas carregados, checados e compilados uma única vez por processo. O
+# analysis.schema.json valida cada unidade com oneOf (generic | cobol), ou seja,
+# contra os dois schemas; aqui o envelope é validado sem as unidades e cada
+# unidade uma vez só, pelo validador do seu 'kind'.
+
+ROOT = Path(__file__).resolve().parent.parent
+SCHEMA_ROOT = ROOT / "schemas"
+
+# auto: fastjsonschema se instalado, senão o compilador de closures abaixo;
+# compiled: sempre o compilador; jsonschema: só o jsonschema (mais lento)
+SCHEMA_VALIDATOR_BACKEND = os.getenv("SCHEMA_VALIDATOR_BACKEND", "auto")
+
+def _load(name: str) -> Dict[str, Any]:
+    return json.loads((SCHEMA_ROOT / name).read_text(encoding="utf-8"))
+
+ANALYSIS_SCHEMA = _load("analysis.schema.json")
+UNIT_GENERIC_SCHEMA = _load("unit.generic.schema.json")
+UNIT_COBOL_SCHEMA = _load("unit.cobol.schema.json")
+for _s in (ANALYSIS_SCHEMA, UNIT_GENERIC_SCHEMA, UNIT_COBOL_SCHEMA):
+    Draft202012Validator.check_schema(_s)
+
+# Digest do schema de unidade genérica: entra na versão do cache de análises
+SCHEMA_DIGEST = hashlib.sha1((SCHEMA_ROOT / "unit.generic.schema.json").read_bytes()).hexdigest()[:8]
+
+def _registry() -> Registry:
+    registry = Registry()
+    for name, schema in (("analysis.schema.json", ANALYSIS_SCHEMA),
+                         ("unit.generic.schema.json", UNIT_GENERIC_SCHEMA),
+                         ("unit.cobol.schema.json", UNIT_COBOL_SCHEMA)):
+        registry = registry.with_resource(name, Resource.from_contents(schema))
+        registry = registry.with_resource(f"./{name}", Resource.from_contents(schema))
+    return registry
+
+REGISTRY = _registry()
+
+# Validador completo (com $ref/oneOf), igual ao que cada módulo montava antes
+ANALYSIS_VALIDATOR = Draft202012Validator(ANALYSIS_SCHEMA, registry=REGISTRY)
+
+def _envelope_schema() -> Dict[str, Any]:
+    s = copy.deepcopy(ANALYSIS_SCHEMA)
+    s["properties"]["units"]["items"] = {"type": "object"}
+    return s
+
+ENVELOPE_VALIDATOR = Draft202012Validator(_envelope_schema())
+
+UNIT_VALIDATORS: Dict[str, Draft202012Validator] = {
+    "generic": Draft202012Validator(UNIT_GENERIC_SCHEMA),
+    "cobol": Draft202012Validator(UNIT_COBOL_SCHEMA),
+}
+UNIT_VALIDATOR = UNIT_VALIDATORS["generic"]
+
+# ------------------ validador compilado ------------------
+# Converte o subconjunto de JSON Schema usado em schemas/ num predicado feito de
+# closures Python (sem percorrer o schema a cada unidade). Só responde "válido ou
+# não"; a mensagem de erro continua vindo do jsonschema. Palavra-chave fora do
+# subconjunto => NotImplementedError e aquele schema fica com o jsonschema.
+
+_ANNOTATIONS = {"$schema", "$id", "title", "description", "default", "examples", "$comment"}
+
+def _is_type(value: Any, t: str) -> bool:
+    if t == "string":
+        return isinstance(value, str)
+    if t == "object":
+        return isinstance(value, dict)
+    if t == "array":
+        return isinstance(value, list)
+    if t == "boolean":
+        return isinstance(value, bool)
+    if t == "null":
+        return value is None
+    if isinstance(value, bool):
+        return False
+    if t == "integer":
+        return isinstance(value, int) or (isinstance(value, float) and value.is_integer())
+    if t == "number":
+        return isinstance(value, (int, float))
+    raise NotImplementedError(f"type {t}")
+
+def _json_equal(a: Any, b: Any) -> bool:
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    return a == b
+
+def compile_schema(schema: Any) -> Callable[[Any], bool]:
+    if schema is True or schema == {}:
+        return lambda v: True
+    if schema is False:
+        return lambda v: False
+    unknown = set(schema) - _ANNOTATIONS - {
+        "type", "required", "properties", "additionalProperties", "const", "enum", "minLength",
+        "maxLength", "pattern", "minimum", "maximum", "items", "minItems", "maxItems", "oneOf", "anyOf"}
+    if unknown:
+        raise NotImplementedError(", ".join(sorted(unknown)))
+
+    checks: list[Callable[[Any], bool]] = []
+    if "type" in schema:
+        types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        for t in types:
+            _is_type(None, t)  # valida o nome do tipo já na compilação
+        checks.append(lambda v, ts=tuple(types): any(_is_type(v, t) for t in ts))
+    if "const" in schema:
+        checks.append(lambda v, c=schema["const"]: _json_equal(v, c))
+    if "enum" in schema:
+        checks.append(lambda v, opts=tuple(schema["enum"]): any(_json_equal(v, o) for o in opts))
+
+    str_checks = []
+    if "minLength" in schema:
+        str_checks.append(lambda v, n=schema["minLength"]: len(v) >= n)
+    if "maxLength" in schema:
+        str_checks.append(lambda v, n=schema["maxLength"]: len(v) <= n)
+    if "pattern" in schema:
+        str_checks.append(lambda v, rx=re.compile(schema["pattern"]): rx.search(v) is not None)
+    if str_checks:
+        checks.append(lambda v, cs=tuple(str_checks): not isinstance(v, str) or all(c(v) for c in cs))
+
+    num_checks = []
+    if "minimum" in schema:
+        num_checks.append(lambda v, n=schema["minimum"]: v >= n)
+    if "maximum" in schema:
+        num_checks.append(lambda v, n=schema["maximum"]: v <= n)
+    if num_checks:
+        checks.append(lambda v, cs=tuple(num_checks): isinstance(v, bool) or not isinstance(v, (int, float))
+                      or all(c(v) for c in cs))
+
+    props = {k: compile_schema(sub) for k, sub in (schema.get("properties") or {}).items()}
+    required = tuple(schema.get("required") or ())
+    extra = schema.get("additionalProperties", True)
+    extra_check = None if extra is True else compile_schema(extra)
+    if props or required or extra_check is not None:
+        def check_object(v, props=props, required=required, extra_check=extra_check):
+            if not isinstance(v, dict):
+                return True
+            for k in required:
+                if k not in v:
+                    return False
+            for k, item in v.items():
+                c = props.get(k)
+                if c is not None:
+                    if not c(item):
+                        return False
+                elif extra_check is not None and not extra_check(item):
+                    return False
+            return True
+        checks.append(check_object)
+
+    if "items" in schema or "minItems" in schema or "maxItems" in schema:
+        item_check = compile_schema(schema.get("items", True))
+        lo, hi = schema.get("minItems", 0), schema.get("maxItems")
+        def check_array(v, item_check=item_check, lo=lo, hi=hi):
+            if not isinstance(v, list):
+                return True
+            if len(v) < lo or (hi is not None and len(v) > hi):
+                return False
+            return all(item_check(x) for x in v)
+        checks.append(check_array)
+
+    if "oneOf" in schema:
+        subs = tuple(compile_schema(x) for x in schema["oneOf"])
+        checks.append(lambda v, subs=subs: sum(1 for c in subs if c(v)) == 1)
+    if "anyOf" in schema:
+        subs = tuple(compile_schema(x) for x in schema["anyOf"])
+        checks.append(lambda v, subs=subs: any(c(v) for c in subs))
+
+    if len(checks) == 1:
+        return checks[0]
+    checks = tuple(checks)
+    return lambda v: all(c(v) for c in checks)
+
+def _compile_fast() -> tuple[str, Dict[str, Callable[[Any], bool]] | None]:
+    backend = SCHEMA_VALIDATOR_BACKEND
+    kinds = (("generic", UNIT_GENERIC_SCHEMA), ("cobol", UNIT_COBOL_SCHEMA))
+    if backend == "jsonschema":
+        return "jsonschema", None
+    if backend in ("auto", "fastjsonschema"):
+        try:
+            import fastjsonschema
+        except ImportError:
+            if backend == "fastjsonschema":
+                raise
+        else:
+            def wrap(fn):
+                def check(v):
+                    try:
+                        fn(v)
+                        return True
+                    except fastjsonschema.JsonSchemaException:
+                        return False
+                return check
+            return "fastjsonschema", {kind: wrap(fastjsonschema.compile(s)) for kind, s in kinds}
+    out = {}
+    for kind, s in kinds:
+        try:
+            out[kind] = compile_schema(s)
+        except NotImplementedError:
+            out[kind] = UNIT_VALIDATORS[kind].is_valid
+    return "compiled", out
+
+BACKEND, _FAST = _compile_fast()
+
+def is_valid_unit(unit: Any) -> bool:
+    kind = unit.get("kind") if isinstance(unit, dict) else None
+    if _FAST is not None:
+        check = _FAST.get(kind)
+        return check is not None and check(unit)
+    v = UNIT_VALIDATORS.get(kind)
+    return v is not None and v.is_valid(unit)
+
+def validate_unit(unit: Any, index: int | None = None):
+    """Valida uma unidade pelo schema do seu kind; levanta ValidationError."""
+    if is_valid_unit(unit):
+        return  # caminho rápido: sem montar mensagens de erro
+    kind = unit.get("kind") if isinstance(unit, dict) else None
+    where = f"units[{index}]" if index is not None else "unidade"
+    v = UNIT_VALIDATORS.get(kind)
+    if v is None:
+        raise ValidationError(f"{where}: kind inválido {kind!r} (esperado 'generic' ou 'cobol')")
+    err = next(v.iter_errors(unit), None)
+    if err is not None:
+        path = "/".join(str(p) for p in err.absolute_path)
+        raise ValidationError(f"{where}{'/' + path if path else ''}: {err.message}")
+
+def validate_units(units: Iterable[Any]):
+    for i, u in enumerate(units):
+        validate_unit(u, i)
+
+def validate_analysis(analysis: Dict[str, Any]):
+    """
+    Mesmo resultado que ANALYSIS_VALIDATOR.validate (o oneOf é exclusivo pelo
+    'kind' const de cada schema), com cada unidade validada uma única vez.
+    """
+    if not ENVELOPE_VALIDATOR.is_valid(analysis):
+        ENVELOPE_VALIDATOR.validate(analysis)
+    validate_units(analysis.get("units") or [])
@@ -0,0 +1,173 @@
+from __future__ import annotations
+import copy
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator
+from sqlalchemy.exc import IntegrityError, OperationalError
+from models.analysis_cache import AnalysisLock
+from services.db import session_scope
+
+# Single-flight: chamadas idênticas e simultâneas (mesma chave) esperam uma única
+# computação e compartilham o resultado. Dentro do processo, os seguidores
+# esperam um Event; entre processos, quem calcula segura um lease na tabela
+# analysis_locks e os demais esperam o lease sumir para ler o resultado de onde
+# o líder gravou (lookup, ex.: o cache de análises).
+
+log = logging.getLogger(__name__)
+
+# Lease entre processos: depois disso um lock é considerado abandonado (processo morto/travado)
+SINGLEFLIGHT_LEASE_SECONDS = float(os.getenv("SINGLEFLIGHT_LEASE_SECONDS", "600"))
+# Espera máxima de um seguidor; depois calcula por conta própria
+SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv("SINGLEFLIGHT_WAIT_SECONDS", "300"))
+SINGLEFLIGHT_POLL_SECONDS = float(os.getenv("SINGLEFLIGHT_POLL_SECONDS", "0.5"))
+
+_OWNER_PREFIX = f"{socket.gethostname()}:{os.getpid()}"
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class Flight:
+    """
+    result preenchido => outro chamador já calculou (shared=True) e o bloco só usa
+    o valor. Senão o bloco calcula, grava onde o lookup lê e chama set(valor).
+    """
+    __slots__ = ("result", "shared", "_value")
+
+    def __init__(self, result: Any = None):
+        self.result = result
+        self.shared = result is not None
+        self._value = None
+
+    def set(self, value: Any):
+        self._value = value
+
+class _Call:
+    __slots__ = ("done", "value", "ok")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.ok = False
+
+class SingleFlight:
+    def __init__(self, lease_seconds: float = SINGLEFLIGHT_LEASE_SECONDS,
+                 wait_seconds: float = SINGLEFLIGHT_WAIT_SECONDS, poll_seconds: float = SINGLEFLIGHT_POLL_SECONDS):
+        self.lease_seconds = lease_seconds
+        self.wait_seconds = wait_seconds
+        self.poll_seconds = poll_seconds
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "shared_local": 0, "shared_remote": 0, "waited_remote": 0,
+                       "leader_failed": 0, "timeouts": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    # ---------- lease entre processos ----------
+    def _try_acquire(self, key: str, owner: str) -> bool | None:
+        """True: lease obtido; False: outro processo calcula; None: coordenação indisponível."""
+        now = _utcnow()
+        try:
+            with session_scope() as db:
+                db.query(AnalysisLock).filter(AnalysisLock.cache_key == key,
+                                              AnalysisLock.expires_at <= now).delete(synchronize_session=False)
+                db.add(AnalysisLock(cache_key=key, owner=owner, acquired_at=now,
+                                    expires_at=now + timedelta(seconds=self.lease_seconds)))
+                try:
+                    db.commit()
+                    return True
+                except IntegrityError:
+                    db.rollback()
+                    return False
+        except OperationalError as e:
+            log.warning("single-flight: tabela de locks indisponível (%s); seguindo sem coordenação", e)
+            return None
+
+    def _release(self, key: str, owner: str):
+        try:
+            with session_scope() as db:
+                db.query(AnalysisLock).filter(AnalysisLock.cache_key == key,
+                                              AnalysisLock.owner == owner).delete(synchronize_session=False)
+                db.commit()
+        except Exception as e:  # o lease vence sozinho
+            log.warning("single-flight: falha ao liberar %s: %s", key, e)
+
+    def _acquire(self, key: str, lookup: Callable[[], Any], flight: Flight) -> str | None:
+        """Obtém o lease (esperando outro processo, se preciso). Retorna o owner ou None."""
+        owner = f"{_OWNER_PREFIX}:{uuid.uuid4().hex[:8]}"
+        deadline = time.monotonic() + self.wait_seconds
+        waited = False
+        while True:
+            got = self._try_acquire(key, owner)
+            if got is None:
+                return None
+            if got:
+                if waited:  # o outro processo terminou enquanto esperávamos
+                    value = lookup()
+                    if value is not None:
+                        flight.result, flight.shared = value, True
+                        self._count("shared_remote")
+                return owner
+            if not waited:
+                waited = True
+                self._count("waited_remote")
+            if time.monotonic() >= deadline:
+                self._count("timeouts")
+                return None
+            time.sleep(self.poll_seconds)
+
+    # ---------- API ----------
+    @contextmanager
+    def flight(self, key: str | None, lookup: Callable[[], Any]) -> Iterator[Flight]:
+        """
+        with SINGLE_FLIGHT.flight(chave, lookup) as f:
+            if f.result is None:
+                valor = calcula(); grava(valor); f.set(valor)
+        lookup() lê o resultado gravado pelo líder de outro processo (None se não houver).
+        Se o líder falhar ou demorar demais, o seguidor calcula por conta própria.
+        """
+        if key is None:
+            yield Flight()
+            return
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            if call.done.wait(self.wait_seconds) and call.ok:
+                self._count("shared_local")
+                yield Flight(copy.deepcopy(call.value))
+            else:
+                self._count("timeouts" if not call.done.is_set() else "leader_failed")
+                yield Flight()
+            return
+
+        self._count("leaders")
+        flight = Flight()
+        try:
+            owner = self._acquire(key, lookup, flight)
+            try:
+                yield flight
+            finally:
+                if owner:
+                    self._release(key, owner)
+            call.value = flight.result if flight.shared else flight._value
+            call.ok = call.value is not None
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls)}
+
+SINGLE_FLIGHT = SingleFlight()
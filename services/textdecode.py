@@ -0,0 +1,100 @@
+from __future__ import annotations
+import codecs
+import os
+from typing import Tuple
+
+# Detecção de binário e decodificação de texto legado (cp1252 / latin-1 / EBCDIC)
+# a partir dos bytes já baixados: nada de segunda requisição para "tentar de novo".
+
+SNIFF_BYTES = 8192
+EBCDIC_CODEPAGE = os.getenv("TEXT_EBCDIC_CODEPAGE", "cp037")
+# Registros fixos de mainframe (RECFM=FB) sem quebra de linha: LRECL típico de fonte COBOL
+EBCDIC_RECORD_LENGTH = int(os.getenv("TEXT_EBCDIC_RECORD_LENGTH", "80"))
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+# bytes de controle "aceitáveis" em texto ASCII: \t \n \f \r \x1a (EOF do DOS) e ESC
+_TEXT_CONTROLS = {0x08, 0x09, 0x0A, 0x0C, 0x0D, 0x1A, 0x1B}
+
+def _bom(head: bytes) -> str | None:
+    for bom, enc in _BOMS:
+        if head.startswith(bom):
+            return enc
+    return None
+
+def looks_ebcdic(head: bytes) -> bool:
+    """
+    Texto EBCDIC: o espaço é 0x40 e letras/dígitos ficam em 0x81-0xF9, então
+    quase não há bytes ASCII imprimíveis "normais" e o 0x40 domina.
+    """
+    if not head:
+        return False
+    n = len(head)
+    spaces = head.count(0x40)
+    ascii_space = head.count(0x20)
+    alnum = sum(1 for b in head if 0x81 <= b <= 0xA9 or 0xC1 <= b <= 0xE9 or 0xF0 <= b <= 0xF9)
+    return spaces > ascii_space and spaces / n > 0.05 and (spaces + alnum) / n > 0.6
+
+def looks_binary(head: bytes) -> bool:
+    """Olha só o começo do arquivo: NUL ou muitos bytes de controle => binário."""
+    if not head or _bom(head):
+        return False
+    if b"\0" in head:
+        return True
+    if looks_ebcdic(head):
+        return False
+    controls = sum(1 for b in head if b < 0x20 and b not in _TEXT_CONTROLS)
+    return controls / len(head) > 0.10
+
+def _split_records(text: str, length: int) -> str:
+    return "\n".join(text[i:i + length].rstrip() for i in range(0, len(text), length))
+
+def decode_text(data: bytes) -> Tuple[str | None, str | None]:
+    """
+    (texto, encoding) ou (None, None) se for binário. Ordem: BOM -> utf-8 ->
+    EBCDIC (heurística) -> cp1252 -> latin-1 (nunca falha). Aceita qualquer
+    buffer (bytes, memoryview, mmap): decodifica direto dele, sem cópia em bytes.
+    """
+    head = bytes(data[:SNIFF_BYTES])
+    enc = _bom(head)
+    if enc:
+        return str(data, enc, "replace"), enc
+    if looks_binary(head):
+        return None, None
+
+    try:
+        return str(data, "utf-8"), "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    if looks_ebcdic(head):
+        text = str(data, EBCDIC_CODEPAGE, "replace").replace("\x85", "\n")
+        if "\n" not in text and EBCDIC_RECORD_LENGTH and len(text) % EBCDIC_RECORD_LENGTH == 0:
+            text = _split_records(text, EBCDIC_RECORD_LENGTH)
+        return text, EBCDIC_CODEPAGE
+
+    try:
+        return str(data, "cp1252"), "cp1252"
+    except UnicodeDecodeError:
+        return str(data, "latin-1"), "latin-1"
+
+def file_view_from_bytes(data: bytes, *, path: str, sha: str | None, size: int | None = None,
+                         **extra) -> dict:
+    """Monta o dict no formato de GitHubClient.get_file_content a partir dos bytes crus."""
+    text, encoding = decode_text(data)
+    return {
+        "type": "file",
+        "is_text": text is not None,
+        "text": text,
+        "encoding": encoding,
+        "size": size if size is not None else len(data),
+        "name": path.rsplit("/", 1)[-1],
+        "path": path,
+        "sha": sha,
+        **extra,
+    }
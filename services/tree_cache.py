@@ -0,0 +1,108 @@
+from __future__ import annotations
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+from services.tree_index import TreeIndex
+
+# Branch/tag -> sha muda com o tempo: TTL curto. Árvore em um sha é imutável.
+REF_TTL_SECONDS = float(os.getenv("GITHUB_REF_TTL_SECONDS", "30"))
+TREE_CACHE_MAX_ENTRIES = int(os.getenv("TREE_CACHE_MAX_ENTRIES", "32"))  # TreeIndex completos (caros)
+# Níveis de diretório (git/trees não recursivo): baratos e numerosos, cache separado
+# para que navegar por diretórios não expulse os índices completos
+TREE_LISTING_CACHE_MAX_ENTRIES = int(os.getenv("TREE_LISTING_CACHE_MAX_ENTRIES", "512"))
+
+_SHA_RE = re.compile(r"^[0-9a-fA-F]{40}$")
+
+def is_commit_sha(ref: str | None) -> bool:
+    return bool(ref and _SHA_RE.match(ref))
+
+class RefResolver:
+    """Resolve branch/tag para commit sha, com TTL curto por (token, owner, repo, ref)."""
+    def __init__(self, ttl: float = REF_TTL_SECONDS):
+        self.ttl = ttl
+        self._items: dict[tuple, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, gh, owner: str, repo: str, ref: str) -> str:
+        if is_commit_sha(ref):
+            return ref.lower()
+        key = (gh.cache_namespace, owner.lower(), repo.lower(), ref)
+        now = time.monotonic()
+        with self._lock:
+            hit = self._items.get(key)
+            if hit and hit[1] > now:
+                return hit[0]
+        sha = gh.get_commit_sha(owner, repo, ref)
+        with self._lock:
+            self._items[key] = (sha, now + self.ttl)
+        return sha
+
+    def invalidate(self, gh, owner: str, repo: str, ref: str):
+        with self._lock:
+            self._items.pop((gh.cache_namespace, owner.lower(), repo.lower(), ref), None)
+
+class TreeCache:
+    """
+    LRU de árvores já construídas por sha de commit. Como o conteúdo de um sha
+    nunca muda, as entradas não expiram — só saem por pressão de espaço.
+    """
+    def __init__(self, max_entries: int = TREE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def get_or_build(self, key: Hashable, builder: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self._stats["hits"] += 1
+                return self._items[key]
+            self._stats["misses"] += 1
+        value = builder()  # fora do lock: download + construção podem demorar
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "entries": len(self._items), "max_entries": self.max_entries}
+
+REF_RESOLVER = RefResolver()
+TREE_CACHE = TreeCache()
+TREE_LISTING_CACHE = TreeCache(TREE_LISTING_CACHE_MAX_ENTRIES)
+
+def get_tree_index(gh, owner: str, repo: str, sha: str) -> TreeIndex:
+    """TreeIndex compacto do commit, construído uma vez e cacheado por sha (imutável)."""
+    def build():
+        data = gh.get_tree_recursive(owner, repo, sha)
+        return TreeIndex.from_entries(data.get("tree", []), truncated=bool(data.get("truncated")))
+    return TREE_CACHE.get_or_build((gh.cache_namespace, owner.lower(), repo.lower(), sha), build)
+
+def get_complete_tree_index(gh, owner: str, repo: str, sha: str) -> TreeIndex:
+    """
+    Como get_tree_index, mas nunca truncado: se o recursive=1 vier truncado,
+    percorre a árvore nível a nível (git/trees não recursivo). Para enumerações
+    completas (jobs em lote), não para navegação interativa.
+    """
+    index = get_tree_index(gh, owner, repo, sha)
+    if not index.truncated:
+        return index
+
+    def build():
+        entries, stack = [], [("", sha)]
+        while stack:
+            prefix, tree_sha = stack.pop()
+            for e in gh.get_tree(owner, repo, tree_sha).get("tree", []):
+                path = f"{prefix}/{e['path']}" if prefix else e["path"]
+                entries.append({**e, "path": path})
+                if e.get("type") == "tree":
+                    stack.append((path, e["sha"]))
+        return TreeIndex.from_entries(entries)
+    return TREE_CACHE.get_or_build((gh.cache_namespace, owner.lower(), repo.lower(), sha, "complete"), build)
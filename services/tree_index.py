@@ -0,0 +1,165 @@
+from __future__ import annotations
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator
+
+DIR, FILE = 0, 1
+
+class TreeIndex:
+    """
+    Índice compacto da árvore de um commit (saída de git/trees?recursive=1).
+
+    Em vez de um dict por componente de caminho, cada nó é uma posição em
+    arrays paralelos:
+      - _name:   id do segmento (tabela de segmentos internados)
+      - _parent: id do nó pai (-1 para a raiz)
+      - _kind:   DIR/FILE
+      - _size:   tamanho do blob (0 para diretórios)
+      - _sha:    20 bytes por nó, concatenados (zeros quando desconhecido)
+    Os caminhos completos ficam numa tabela ordenada (busca O(log n) via bisect),
+    e os filhos de cada diretório são um intervalo contíguo de _children.
+    O nó 0 é a raiz (caminho "").
+    """
+    __slots__ = ("truncated", "_segments", "_name", "_parent", "_kind", "_size", "_sha",
+                 "_paths", "_path_node", "_child_start", "_child_count", "_children")
+
+    def __init__(self):
+        self.truncated = False
+        self._segments: list[str] = [""]
+        self._name = array("I", [0])
+        self._parent = array("i", [-1])
+        self._kind = array("b", [DIR])
+        self._size = array("q", [0])
+        self._sha = bytearray(20)
+        self._paths: list[str] = []
+        self._path_node = array("I")
+        self._child_start = array("I")
+        self._child_count = array("I")
+        self._children = array("I")
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[dict], truncated: bool = False) -> "TreeIndex":
+        """Constrói o índice a partir das entradas do git/trees. Ignora submódulos ('commit')."""
+        idx = cls()
+        idx.truncated = truncated
+
+        raw: dict[str, tuple[int, int, str | None]] = {}
+        for e in entries:
+            t = e.get("type")
+            p = e.get("path") or ""
+            if t not in ("blob", "tree") or not p:
+                continue
+            raw[p] = (FILE if t == "blob" else DIR, int(e.get("size") or 0), e.get("sha"))
+            # garante diretórios intermediários mesmo se a listagem vier incompleta
+            i = p.rfind("/")
+            while i != -1:
+                d = p[:i]
+                if d in raw:
+                    break
+                raw[d] = (DIR, 0, None)
+                i = d.rfind("/")
+
+        seg_ids: dict[str, int] = {"": 0}
+        node_of: dict[str, int] = {"": 0}  # temporário: descartado ao final da construção
+        paths = sorted(raw)  # pai é prefixo do filho => sempre aparece antes na ordem
+        for p in paths:
+            kind, size, sha = raw[p]
+            i = p.rfind("/")
+            parent, seg = (node_of[p[:i]], p[i + 1:]) if i != -1 else (0, p)
+            sid = seg_ids.get(seg)
+            if sid is None:
+                sid = seg_ids[seg] = len(idx._segments)
+                idx._segments.append(seg)
+            node = len(idx._name)
+            node_of[p] = node
+            idx._name.append(sid)
+            idx._parent.append(parent)
+            idx._kind.append(kind)
+            idx._size.append(size)
+            idx._sha += bytes.fromhex(sha) if sha and len(sha) == 40 else bytes(20)
+
+        idx._paths = paths
+        idx._path_node = array("I", (node_of[p] for p in paths))
+
+        # filhos agrupados por pai, já na ordem de listagem (diretórios primeiro, nome)
+        n = len(idx._name)
+        order = sorted(range(1, n), key=lambda k: (idx._parent[k], idx._kind[k], idx._segments[idx._name[k]].lower()))
+        idx._children = array("I", order)
+        idx._child_start = array("I", bytes(4 * n))
+        idx._child_count = array("I", bytes(4 * n))
+        for pos, k in enumerate(order):
+            par = idx._parent[k]
+            if idx._child_count[par] == 0:
+                idx._child_start[par] = pos
+            idx._child_count[par] += 1
+        return idx
+
+    def __len__(self) -> int:
+        return len(self._name) - 1
+
+    def lookup(self, path: str) -> int | None:
+        """Id do nó para um caminho (O(log n)); "" é a raiz."""
+        path = path.strip("/")
+        if not path:
+            return 0
+        i = bisect_left(self._paths, path)
+        if i < len(self._paths) and self._paths[i] == path:
+            return self._path_node[i]
+        return None
+
+    def path_of(self, node: int) -> str:
+        parts = []
+        while node > 0:
+            parts.append(self._segments[self._name[node]])
+            node = self._parent[node]
+        return "/".join(reversed(parts))
+
+    def entry(self, node: int, path: str | None = None) -> dict:
+        is_dir = self._kind[node] == DIR
+        out = {
+            "name": self._segments[self._name[node]],
+            "path": path if path is not None else self.path_of(node),
+            "type": "dir" if is_dir else "file",
+        }
+        if not is_dir:
+            sha = bytes(self._sha[node * 20:(node + 1) * 20])
+            out["size"] = self._size[node]
+            out["sha"] = sha.hex() if any(sha) else None
+        return out
+
+    def list_dir(self, path: str = "") -> list[dict] | None:
+        """Filhos diretos de um diretório (diretórios primeiro). None se não for diretório."""
+        node = self.lookup(path)
+        if node is None or self._kind[node] != DIR:
+            return None
+        base = path.strip("/")
+        start, count = self._child_start[node], self._child_count[node]
+        out = []
+        for k in self._children[start:start + count]:
+            name = self._segments[self._name[k]]
+            out.append(self.entry(k, f"{base}/{name}" if base else name))
+        return out
+
+    def iter_files(self, prefix: str = "", extensions: Iterable[str] | None = None) -> Iterator[dict]:
+        """
+        Arquivos sob 'prefix' (diretório), em ordem de caminho, opcionalmente
+        filtrados por extensão (ex.: {".cbl", ".cob"}). Usa o intervalo do bisect.
+        """
+        exts = tuple(e.lower() for e in extensions) if extensions else None
+        base = prefix.strip("/")
+        if base:
+            lo = bisect_left(self._paths, base + "/")
+            hi = bisect_left(self._paths, base + "0")  # '0' é o caractere seguinte a '/'
+        else:
+            lo, hi = 0, len(self._paths)
+        for i in range(lo, hi):
+            node = self._path_node[i]
+            if self._kind[node] != FILE:
+                continue
+            p = self._paths[i]
+            if exts and not p.lower().endswith(exts):
+                continue
+            yield self.entry(node, p)
+
+    def file_count(self) -> int:
+        return self._kind.count(FILE)
@@ -0,0 +1,105 @@
+# tools/bench_db_writes.py
+from __future__ import annotations
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Rode: python -m tools.bench_db_writes --writers 8 --ops 50 [--units 20] [--no-wal] [--url sqlite:///x.db]
+# Mede gravações de análises (save_analysis) com N threads concorrentes em dois
+# caminhos: cada thread com sua sessão e commit ("direct") e via escritor único
+# com group commit ("writer"). Usa um banco temporário, a não ser que --url seja dado.
+
+def _parse_args():
+    ap = argparse.ArgumentParser(description="Benchmark de gravação concorrente de análises")
+    ap.add_argument("--writers", type=int, default=8)
+    ap.add_argument("--ops", type=int, default=50, help="análises gravadas por thread")
+    ap.add_argument("--units", type=int, default=20, help="unidades por análise")
+    ap.add_argument("--no-wal", action="store_true", help="journal padrão (rollback) em vez de WAL")
+    ap.add_argument("--url", help="DATABASE_URL (padrão: SQLite temporário)")
+    return ap.parse_args()
+
+def _analysis(i: int, units: int) -> dict:
+    return {
+        "version": "1.0.0",
+        "file": {"path": f"src/file_{i}.py", "sha": f"{i:040x}", "repo": "bench", "owner": "bench",
+                 "size_bytes": 1000},
+        "ref": "main",
+        "language": "python",
+        "detector": {"method": "extension", "confidence": 0.9},
+        "units": [{
+            "kind": "generic", "id": f"u_{j}", "name": f"func_{j}",
+            "range": {"start_line": j * 10 + 1, "end_line": j * 10 + 9},
+            "purpose": "Função de benchmark.",
+            "io": {"inputs": [], "outputs": [], "side_effects": []},
+            "logic": {"steps": [], "decisions": [],
+                      "calls": [{"target": f"func_{j + 1}", "kind": "function"},
+                                {"target": "requests.get", "kind": "api"}]},
+            "risks": ["r"] if j % 5 == 0 else [],
+        } for j in range(units)],
+        "summary": {"unit_count": units, "diagram_suggestion": "flowchart", "notes": ""},
+    }
+
+def _run(label: str, writers: int, ops: int, work) -> dict:
+    errors, locked, first = [0], [0], []
+    lock = threading.Lock()
+    def worker(w: int):
+        for k in range(ops):
+            try:
+                work(w * ops + k)
+            except Exception as e:
+                with lock:
+                    errors[0] += 1
+                    if "locked" in str(e):
+                        locked[0] += 1
+                    if not first:
+                        first.append(f"{type(e).__name__}: {str(e).splitlines()[0][:120]}")
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(writers)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    total = writers * ops
+    return {"mode": label, "ok": total - errors[0], "errors": errors[0], "locked": locked[0],
+            "seconds": round(elapsed, 2), "writes/s": round((total - errors[0]) / elapsed, 1),
+            "first_error": first[0] if first else None}
+
+def main():
+    args = _parse_args()
+    tmp = None
+    if args.url:
+        os.environ["DATABASE_URL"] = args.url
+    else:
+        tmp = tempfile.mkdtemp()
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+    os.environ["DB_SQLITE_WAL"] = "0" if args.no_wal else "1"
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from services.db import Base, engine, session_scope
+    from services.db_writer import DbWriter
+    from services.analysis_store import save_analysis
+    import models.analysis_store  # noqa: F401 (registra as tabelas)
+    Base.metadata.create_all(bind=engine)
+
+    def direct(i: int):
+        with session_scope() as db:
+            save_analysis(db, _analysis(i, args.units), sha="a" * 40, mode="per_unit")
+
+    writer = DbWriter()
+    def save_op(db, i: int):
+        save_analysis(db, _analysis(i, args.units), sha="b" * 40, mode="per_unit", commit=False)
+
+    def via_writer(i: int):
+        writer.submit_wait(save_op, i)
+
+    print(f"{engine.dialect.name} wal={not args.no_wal} writers={args.writers} ops={args.ops} units={args.units}")
+    for res in (_run("direct", args.writers, args.ops, direct), _run("writer", args.writers, args.ops, via_writer)):
+        print("  ".join(f"{k}={v}" for k, v in res.items()))
+    print("writer:", writer.stats())
+
+if __name__ == "__main__":
+    main()
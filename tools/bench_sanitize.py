@@ -0,0 +1,116 @@
+# tools/bench_sanitize.py
+from __future__ import annotations
+import argparse
+import copy
+import json
+import subprocess
+import time
+import types
+from pathlib import Path
+
+from services.analyzer.sanitize import sanitize_units
+from services.schemas import UNIT_VALIDATORS
+
+# Rode: python -m tools.bench_sanitize [--input saidas.jsonl] [--units 5000] [--baseline <commit>]
+# Mede o normalizador de unidades (services.analyzer.sanitize) sobre saídas do LLM:
+# --input: JSONL com uma resposta bruta por linha (array de unidades ou objeto);
+# sem --input, gera saídas "sujas" a partir de examples/ (steps como string,
+# 'label' no lugar de 'text', ids com espaço, assinatura em texto, io como
+# objetos, chaves extras, enums em maiúsculas, textos longos, ids de steps/decisions
+# com 32 caracteres repetidos).
+# --baseline: compara com o _sanitize_units de generic_llm.py naquele commit.
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def _messy(unit: dict, i: int) -> dict:
+    u = copy.deepcopy(unit)
+    heavy = i % 4 == 0  # a cada 4, defeitos que o saneamento antigo não corrigia
+    u["id"] = f"unit {i}" if heavy else f"u_{i}"
+    u["extra_field"] = {"debug": True}
+    u["purpose"] = "  " + u.get("purpose", "") + " " + "detalhe " * (i % 40)
+    u["signature"] = f"def f{i}(self, a: int, b: str = 'x', c) -> Dict[str, Any]"
+    u["io"] = {"inputs": [{"name": "a", "type": "int", "description": "entrada"}, "b"],
+               "outputs": "dict", "side_effects": [], "notes": "?"}
+    long_id = "passo_" + "x" * 26  # 32 chars: a desambiguação precisa cortar a base
+    steps = []
+    for n, s in enumerate(u.get("logic", {}).get("steps", []) or [{"text": "passo"}], start=1):
+        if n % 3 == 0:
+            steps.append(s.get("text", "passo") if isinstance(s, dict) else str(s))
+        else:
+            steps.append({"id": long_id if heavy else f"step {n}", "label": (s.get("text", "") if isinstance(s, dict) else "") * 3,
+                          "kind": "CALC" if n % 2 else "weird"})
+    u["logic"] = {
+        "steps": steps,
+        "decisions": [{"id": "d 1", "text": "x > 0", "true_path": ["step 1"], "false_path": ["step 2", "s9"]},
+                      "senão"] + ([{"id": long_id, "condition": "a"}, {"id": long_id, "condition": "b"}] if heavy else []),
+        "calls": ["requests.get", {"target": "db.save", "kind": "DB"}] + ([{"kind": "api", "args": [1]}] if heavy else []),
+        "complexity": 3,
+    }
+    u["risks"] = ["r" * (400 if heavy else 100), {"risk": "x"}]
+    u["diagram_suggestion"] = "mindmap" if heavy else "flowchart"
+    return u
+
+def _generated(n: int) -> list:
+    units = []
+    for name in ("analysis.python.example.json", "analysis.cobol.example.json"):
+        units += [u for u in json.loads((ROOT / "examples" / name).read_text(encoding="utf-8"))["units"]]
+    return [[_messy(units[i % len(units)], i)] for i in range(n)]
+
+def _recorded(path: str) -> list:
+    out = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            out.append(json.loads(line))
+    return out
+
+def _baseline(commit: str):
+    src = subprocess.check_output(
+        ["git", "show", f"{commit}:services/analyzer/specialists/generic_llm.py"], cwd=ROOT, text=True)
+    mod = types.ModuleType("generic_llm_baseline")
+    exec(compile(src, f"generic_llm@{commit}", "exec"), mod.__dict__)
+    return mod._sanitize_units
+
+def _time(fn, outputs, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        data = copy.deepcopy(outputs)
+        t0 = time.perf_counter()
+        for o in data:
+            fn(o)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def _valid(fn, outputs) -> tuple[int, int]:
+    kept = invalid = 0
+    for o in copy.deepcopy(outputs):
+        for u in fn(o):
+            kept += 1
+            invalid += not UNIT_VALIDATORS["generic"].is_valid(u)
+    return kept, invalid
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark do normalizador de unidades do LLM")
+    ap.add_argument("--input", help="JSONL com respostas brutas do LLM")
+    ap.add_argument("--units", type=int, default=5000, help="saídas geradas (sem --input)")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--baseline", help="commit com a implementação anterior para comparação")
+    args = ap.parse_args()
+
+    outputs = _recorded(args.input) if args.input else _generated(args.units)
+    total = sum(len(o) if isinstance(o, list) else 1 for o in outputs)
+    modes = [("sanitize_units", sanitize_units)]
+    if args.baseline:
+        modes.append((f"baseline {args.baseline}", _baseline(args.baseline)))
+
+    print(f"saídas={len(outputs)} unidades brutas={total}")
+    times = {}
+    for label, fn in modes:
+        times[label] = _time(fn, outputs, args.repeat)
+        kept, invalid = _valid(fn, outputs)
+        print(f"  {label:24s} {times[label] * 1000:8.1f} ms  ({times[label] / total * 1e6:.1f} us/unidade)"
+              f"  mantidas={kept} inválidas={invalid}")
+    if args.baseline:
+        print(f"  ganho: {times[modes[1][0]] / times['sanitize_units']:.1f}x")
+
+if __name__ == "__main__":
+    main()
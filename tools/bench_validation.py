@@ -0,0 +1,90 @@
+# tools/bench_validation.py
+from __future__ import annotations
+import argparse
+import copy
+import json
+import time
+from pathlib import Path
+
+from services.schemas import ANALYSIS_VALIDATOR, BACKEND, validate_analysis
+
+# Rode: python -m tools.bench_validation [--units 5000] [--repeat 3]
+# Compara a validação de uma análise grande pelo analysis.schema.json completo
+# (oneOf: cada unidade contra os dois schemas) com validate_analysis (envelope +
+# cada unidade uma vez, pelo kind). Também confere que os dois concordam em
+# unidades propositalmente inválidas.
+
+ROOT = Path(__file__).resolve().parent.parent
+EXAMPLES = ROOT / "examples"
+
+def _sample_units() -> list[dict]:
+    units = []
+    for name in ("analysis.python.example.json", "analysis.cobol.example.json"):
+        units += json.loads((EXAMPLES / name).read_text(encoding="utf-8"))["units"]
+    return units
+
+def _analysis(n: int) -> dict:
+    base = json.loads((EXAMPLES / "analysis.python.example.json").read_text(encoding="utf-8"))
+    sample = _sample_units()
+    units = []
+    for i in range(n):
+        u = copy.deepcopy(sample[i % len(sample)])
+        u["id"] = f"u{i}"
+        units.append(u)
+    base["units"] = units
+    base.setdefault("summary", {})["unit_count"] = n
+    return base
+
+def _mutations(unit: dict) -> list[dict]:
+    bad = []
+    for mutate in (
+        lambda u: u.pop("purpose"),
+        lambda u: u.__setitem__("kind", "other"),
+        lambda u: u["range"].__setitem__("start_line", 0),
+        lambda u: u.__setitem__("extra", 1),
+        lambda u: u["logic"]["steps"].append({"id": "bad id!", "text": "x"}),
+    ):
+        u = copy.deepcopy(unit)
+        mutate(u)
+        bad.append(u)
+    return bad
+
+def _time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de validação de análises")
+    ap.add_argument("--units", type=int, default=5000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    analysis = _analysis(args.units)
+    full = _time(lambda: ANALYSIS_VALIDATOR.validate(analysis), args.repeat)
+    fast = _time(lambda: validate_analysis(analysis), args.repeat)
+    print(f"unidades={args.units} backend={BACKEND}")
+    print(f"  analysis.schema (oneOf): {full * 1000:8.1f} ms  ({full / args.units * 1e6:.1f} us/unidade)")
+    print(f"  validate_analysis:       {fast * 1000:8.1f} ms  ({fast / args.units * 1e6:.1f} us/unidade)")
+    print(f"  ganho: {full / fast:.1f}x")
+
+    # equivalência: os dois caminhos rejeitam as mesmas unidades
+    small = _analysis(2)
+    disagreements = 0
+    for unit in _sample_units():
+        for bad in _mutations(unit):
+            small["units"] = [bad]
+            a = ANALYSIS_VALIDATOR.is_valid(small)
+            try:
+                validate_analysis(small)
+                b = True
+            except Exception:
+                b = False
+            disagreements += a != b
+    print(f"  divergências em unidades inválidas: {disagreements}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# tools/check_github_cache.py
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Rode: python -m tools.check_github_cache
+# Sobe um GitHub fake local (ETag/304, X-RateLimit-*, um 429 com Retry-After),
+# aponta GITHUB_API_URL para ele e confere o GET condicional de GitHubClient._get:
+# a segunda busca envia If-None-Match e, no 304, o corpo sai do cache; a chave
+# (namespace do token, url, Accept) separa tokens e media types; e cada envio,
+# 304 inclusive, passa pelo agendador de rate limit.
+
+REPO = {"full_name": "o/r", "default_branch": "main"}
+SHA = "a" * 40
+
+class FakeGitHub(BaseHTTPRequestHandler):
+    seen: list = []          # (caminho, Accept, If-None-Match) de cada requisição
+    throttle = {"left": 0}   # quantos 429 ainda devolver em /repos/o/r/throttled
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status: int, body: bytes = b"", headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("X-RateLimit-Limit", "5000")
+        self.send_header("X-RateLimit-Remaining", str(4999 - len(self.seen)))
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        accept = self.headers.get("Accept")
+        self.seen.append((path, accept, self.headers.get("If-None-Match")))
+        if path == "/repos/o/r/throttled" and self.throttle["left"]:
+            self.throttle["left"] -= 1
+            return self._reply(429, b'{"message": "secondary rate limit"}', {"Retry-After": "1"})
+        if path in ("/repos/o/r", "/repos/o/r/throttled"):
+            body = json.dumps(REPO).encode()
+        elif path == "/repos/o/r/commits/main" and accept == "application/vnd.github.sha":
+            body = SHA.encode()
+        elif path == "/repos/o/r/commits/main":
+            body = json.dumps({"sha": SHA}).encode()
+        else:
+            return self._reply(404, b'{"message": "Not Found"}')
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            return self._reply(304, headers={"ETag": etag})
+        self._reply(200, body, {"ETag": etag, "Content-Type": "application/json"})
+
+def _start() -> str:
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), FakeGitHub)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{srv.server_address[1]}"
+
+def _last(path: str):
+    return [s for s in FakeGitHub.seen if s[0] == path][-1]
+
+def main():
+    os.environ["GITHUB_API_URL"] = _start()
+    # importado depois: services.github lê GITHUB_API_URL no import
+    from services.github import GitHubClient
+    from services.github_ratelimit import GitHubScheduler
+    from services.http_cache import HttpCache
+
+    cache, scheduler = HttpCache(), GitHubScheduler()
+    gh = GitHubClient("token-a", cache=cache, scheduler=scheduler)
+
+    first = gh._get("/repos/o/r")
+    assert first.json() == REPO and not getattr(first, "from_cache", False)
+    assert _last("/repos/o/r")[2] is None, "primeira busca não deveria ser condicional"
+    second = gh._get("/repos/o/r")
+    assert _last("/repos/o/r")[2] == first.headers["ETag"], "segunda busca sem If-None-Match"
+    assert second.from_cache and second.json() == REPO
+    assert cache.stats()["revalidated"] == 1
+    print("OK: segunda busca envia If-None-Match e o 304 é servido do cache")
+
+    assert gh.get_commit_sha("o", "r", "main") == SHA
+    assert _last("/repos/o/r/commits/main")[2] is None
+    assert gh._get("/repos/o/r/commits/main").json() == {"sha": SHA}
+    assert _last("/repos/o/r/commits/main")[2] is None, "Accept diferente reaproveitou a entrada"
+    assert gh.get_commit_sha("o", "r", "main") == SHA and cache.stats()["revalidated"] == 2
+    print("OK: Accept faz parte da chave (sha em text/plain x JSON)")
+
+    other = GitHubClient("token-b", cache=cache, scheduler=scheduler)
+    assert other._get("/repos/o/r").json() == REPO
+    assert _last("/repos/o/r")[2] is None, "resposta de um token servida a outro"
+    print("OK: namespace por token")
+
+    tokens = scheduler.stats()["tokens"]
+    assert tokens[gh.cache_namespace]["requests"] == 5, tokens  # 304 também passa pelo agendador
+    assert tokens[gh.cache_namespace]["remaining"] is not None
+    print("OK: agendador viu todas as requisições, 304 inclusive")
+
+    FakeGitHub.throttle["left"] = 1
+    started = time.time()
+    assert gh._get("/repos/o/r/throttled").json() == REPO
+    assert time.time() - started >= 0.9, "não esperou o Retry-After"
+    assert scheduler.stats()["tokens"][gh.cache_namespace]["secondary_limited"] == 1
+    assert gh._get("/repos/o/r/throttled").from_cache
+    print("OK: 429 com Retry-After é repetido pelo agendador e a resposta entra no cache")
+    print("Cache HTTP do GitHub conferido com sucesso.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# tools/check_llm_executor.py
+from __future__ import annotations
+import time
+import types
+from langchain_core.language_models.fake_chat_models import FakeListChatModel, GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from services.llm.executor import STREAM_END, CircuitBreaker, CircuitOpenError, LLMExecutor
+
+# Rode: python -m tools.check_llm_executor
+# Exercita o LLMExecutor (services/llm/executor.py) sem provedor: um chat model fake
+# do LangChain atrás de um RunnableLambda que levanta, sob demanda, erros com
+# status HTTP. Confere retry com backoff + jitter (e Retry-After), o que conta ou
+# não para o circuit breaker, as transições closed -> open -> half_open -> closed,
+# a devolução da reserva de TPM e o cancelamento de stream_many.
+
+class ProviderError(Exception):
+    """Erro no formato dos clientes HTTP do LangChain: status_code + response.headers."""
+    def __init__(self, status: int, retry_after: str | None = None):
+        super().__init__(f"HTTP {status}")
+        self.status_code = status
+        self.response = types.SimpleNamespace(status_code=status,
+                                              headers={"retry-after": retry_after} if retry_after else {})
+
+def flaky(model, *errors: BaseException):
+    """Chain que levanta os erros dados, um por chamada, e depois responde pelo model."""
+    pending = list(errors)
+
+    def gate(value):
+        if pending:
+            raise pending.pop(0)
+        return value
+    return RunnableLambda(gate) | model
+
+def fake(*replies: str):
+    return FakeListChatModel(responses=list(replies) or ["ok"])
+
+def executor(**kwargs) -> LLMExecutor:
+    kwargs = {"rpm": 0, "tpm": 0, "backoff_base": 0.01, "backoff_max": 0.05, **kwargs}
+    return LLMExecutor(**kwargs)
+
+def check_retry():
+    ex = executor(max_retries=3)
+    reply = ex.invoke(flaky(fake("pronto"), ProviderError(503), ProviderError(429)), "oi")
+    assert reply.content == "pronto", reply
+    assert ex.stats()["calls"] == 3 and ex.stats()["retries"] == 2, ex.stats()
+
+    ex = executor(max_retries=1)
+    try:
+        ex.invoke(flaky(fake(), ProviderError(503), ProviderError(503)), "oi")
+        raise AssertionError("deveria desistir após max_retries")
+    except ProviderError:
+        pass
+    assert ex.stats()["calls"] == 2 and ex.stats()["failures"] == 1
+
+    ex = LLMExecutor(backoff_base=1.0, backoff_max=30)
+    waits = [ex._backoff(3, ProviderError(503)) for _ in range(200)]
+    assert all(0 <= w <= 8 for w in waits) and len(set(waits)) > 100, "backoff sem jitter"
+    assert ex._backoff(3, ProviderError(429, retry_after="2")) == 2.0
+    assert ex._backoff(0, ProviderError(429, retry_after="120")) == 30
+    print("OK: retry em 429/5xx com backoff + jitter; Retry-After respeitado e limitado")
+
+def check_breaker_scope():
+    ex = executor(breaker=CircuitBreaker(threshold=1, reset_seconds=60))
+    for err in (ProviderError(400), ValueError("JSON inválido")):
+        try:
+            ex.invoke(flaky(fake(), err), "oi")
+        except type(err):
+            pass
+        assert ex.breaker.state == "closed", (err, ex.breaker.state)
+    assert ex.stats()["retries"] == 0
+    print("OK: 4xx e erro de parser não têm retry nem abrem o circuito")
+
+def check_breaker_transitions():
+    breaker = CircuitBreaker(threshold=2, reset_seconds=0.2)
+    ex = executor(max_retries=0, breaker=breaker)
+    for _ in range(2):
+        try:
+            ex.invoke(flaky(fake(), ProviderError(502)), "oi")
+        except ProviderError:
+            pass
+    assert breaker.state == "open", breaker.state
+    try:
+        ex.invoke(flaky(fake()), "oi")
+        raise AssertionError("circuito aberto deveria recusar")
+    except CircuitOpenError:
+        pass
+    assert ex.stats()["rejected"] == 1
+
+    time.sleep(0.25)
+    try:  # sonda do half_open falha: reabre
+        ex.invoke(flaky(fake(), ProviderError(503)), "oi")
+    except ProviderError:
+        pass
+    assert breaker.state == "open", breaker.state
+    time.sleep(0.25)
+    assert ex.invoke(flaky(fake("voltou")), "oi").content == "voltou"
+    assert breaker.state == "closed", breaker.state
+    print("OK: closed -> open -> (recusa) -> half_open -> open -> half_open -> closed")
+
+def _model_with_usage(*totals: int):
+    return GenericFakeChatModel(messages=iter(
+        AIMessage(content="ok", usage_metadata={"input_tokens": t - 5, "output_tokens": 5, "total_tokens": t})
+        for t in totals))
+
+def check_tpm_refund():
+    ex = executor(tpm=60_000)  # bucket de 10k tokens
+    before = ex.tokens._tokens
+    ex.invoke(flaky(_model_with_usage(150)), "oi", tokens=1000)
+    assert ex.stats()["refunded_tokens"] == 850, ex.stats()
+    assert before - ex.tokens._tokens < 151, "sobra da reserva não voltou ao bucket"
+
+    ex = executor(tpm=60_000)
+    ex.invoke(flaky(fake()), "oi", tokens=1000)  # provedor sem usage: mantém a estimativa
+    assert ex.stats()["refunded_tokens"] == 0
+
+    ex = executor(tpm=60_000, max_retries=2)
+    ex.invoke(flaky(_model_with_usage(150), ProviderError(429)), "oi", tokens=1000)
+    assert ex.stats()["refunded_tokens"] == 1000 + 850, ex.stats()
+    print("OK: reserva de TPM acertada pelo uso informado; 429 devolve a reserva da tentativa")
+
+def check_stream_many():
+    ex = executor(max_concurrency=2)
+    got = {}
+    for n, piece in ex.stream_many(flaky(fake("abc", "de")), ["x", "y"]):
+        if piece is not STREAM_END:
+            got[n] = got.get(n, "") + piece.content
+    assert sorted(got.values()) == ["abc", "de"], got
+
+    slow = FakeListChatModel(responses=["x" * 200], sleep=0.02)
+    stream = ex.stream_many(slow, ["a", "b"])
+    next(stream)
+    stream.close()
+    time.sleep(0.1)
+    assert ex._semaphore._value == 2, "stream cancelado segurou o semáforo"
+    print("OK: stream_many entrega os pedaços e libera o semáforo quando o consumidor para")
+
+def main():
+    check_retry()
+    check_breaker_scope()
+    check_breaker_transitions()
+    check_tpm_refund()
+    check_stream_many()
+    print("LLMExecutor conferido com sucesso.")
+
+if __name__ == "__main__":
+    main()